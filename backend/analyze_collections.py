@@ -4,9 +4,18 @@ from pathlib import Path
 import datetime
 import sys
 import os
+import time
 import nltk
+import numpy as np
 import psutil
 
+import metrics
+from batching import encode_bucketed
+from embedding_store import passage_texts, read_sidecar, store_for, texts_digest
+from lexical_index import LEXICAL_SHORTLIST, fuse, lexical_shortlist
+from model_registry import DEFAULT_MODEL, get_model, model_key
+from vector_index import load_index, make_index, normalize_rows, top_k
+
 def log_memory_usage(stage=""):
     process = psutil.Process(os.getpid())
     mem_mb = process.memory_info().rss / 1024 / 1024
@@ -19,6 +28,12 @@ BASE_DIR = Path(__file__).parent
 INPUT_DIR = BASE_DIR / "input"
 OUTPUT_DIR = BASE_DIR / "output"
 NLTK_DATA_PATH_IN_CONTAINER = BASE_DIR / "nltk_data"
+MODEL_NAME = DEFAULT_MODEL
+# "exhaustive" embeds every candidate's title and content; "cascade" scores titles
+# first and embeds contents only for the CASCADE_TOP_K best plus CASCADE_EXPLORE random others.
+RANKING_MODE = os.getenv("RANKING_MODE", "exhaustive")
+CASCADE_TOP_K = int(os.getenv("CASCADE_TOP_K", 50))
+CASCADE_EXPLORE = int(os.getenv("CASCADE_EXPLORE", 10))
 
 # Check if we are inside the Docker container by seeing if that path exists.
 if NLTK_DATA_PATH_IN_CONTAINER.exists():
@@ -92,31 +107,182 @@ def load_sections(documents, rich_sections_dir):
     return all_sections
 
 
-def rank_sections(all_sections, query_embedding, model):
-    """Performs the two-level ranking and returns the top sections."""
-    from sentence_transformers import util
-    section_titles = [s['section_title'] for s in all_sections]
-    section_contents = [s.get('content', '') for s in all_sections]
-
-    title_embeddings = model.encode(["passage: " + t for t in section_titles], convert_to_tensor=True, show_progress_bar=False)
-    content_embeddings = model.encode(["passage: " + c for c in section_contents], convert_to_tensor=True, show_progress_bar=False)
-
-    title_scores = util.cos_sim(query_embedding, title_embeddings)[0]
-    content_scores = util.cos_sim(query_embedding, content_embeddings)[0]
-
-    combined_sections = []
-    content_only_sections = []
-
+def section_positions(all_sections):
+    """{document: [indices into all_sections]} in load order."""
+    positions = {}
     for i, section in enumerate(all_sections):
-        combined_score = 0.5 * content_scores[i].item() + 0.5 * title_scores[i].item()
-        content_score = content_scores[i].item()
-        combined_sections.append({**section, 'score': combined_score})
-        content_only_sections.append({**section, 'score': content_score})
+        positions.setdefault(section['document'], []).append(i)
+    return positions
+
+def as_query_vector(query_embedding):
+    if hasattr(query_embedding, "cpu"):
+        query_embedding = query_embedding.cpu().numpy()
+    return normalize_rows(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
 
-    top_extracted = sorted(combined_sections, key=lambda s: s['score'], reverse=True)[:5]
-    top_content = sorted(content_only_sections, key=lambda s: s['score'], reverse=True)[:5]
+def load_precomputed_embeddings(documents, rich_sections_dir, all_sections, model_id):
+    """
+    Reads the ingest-time <stem>.embeddings.npz sidecars. Returns
+    {document: (title_vectors, content_vectors)} for documents whose sidecar
+    was computed by this model from exactly the sections just loaded.
+    """
+    precomputed = {}
+    for doc_info in documents:
+        doc_name = doc_info['filename']
+        sections = [s for s in all_sections if s['document'] == doc_name]
+        titles, contents = passage_texts(sections)
+        vectors = read_sidecar(rich_sections_dir / f"{Path(doc_name).stem}.json", model_id,
+                               texts_digest(titles, contents))
+        if vectors is not None:
+            precomputed[doc_name] = vectors
+    return precomputed
+
+def section_vectors(all_sections, candidates, model, store=None, precomputed=None,
+                    fields=("title", "content")):
+    """
+    Normalised vectors of all_sections[candidates], one matrix per field
+    ("title", "content"). Sections of documents in `precomputed` reuse their
+    ingest-time vectors; with an embedding store, only the remaining
+    sections it hasn't seen are encoded.
+    """
+    texts = dict(zip(("title", "content"), passage_texts([all_sections[i] for i in candidates])))
+
+    def encode(texts):
+        # One length-bucketed pass over all requested fields together.
+        if store is not None:
+            return store.encode(texts, lambda misses: encode_bucketed(model, misses)[0])
+        return encode_bucketed(model, texts)[0]
+
+    start = time.perf_counter()
+    row_of = {i: row for rows in section_positions(all_sections).values() for row, i in enumerate(rows)}
+    rows = {field: [None] * len(candidates) for field in fields}
+    for j, i in enumerate(candidates):
+        vectors = (precomputed or {}).get(all_sections[i]['document'])
+        if vectors is not None:
+            for field in fields:
+                rows[field][j] = vectors[0 if field == "title" else 1][row_of[i]]
+    missing = [j for j, row in enumerate(rows[fields[0]]) if row is None]
+    if missing:
+        vectors = encode([texts[field][j] for field in fields for j in missing])
+        for f, field in enumerate(fields):
+            for n, j in enumerate(missing):
+                rows[field][j] = vectors[f * len(missing) + n]
+    matrices = tuple(normalize_rows(np.stack(rows[field])) for field in fields)
+    encode_seconds = time.perf_counter() - start
+    metrics.ANALYZE_STAGE_SECONDS.observe(encode_seconds, stage="encode")
+    if encode_seconds > 0 and missing:
+        metrics.ANALYZE_SECTIONS_PER_SECOND.observe(len(fields) * len(missing) / encode_seconds)
+    return matrices
+
+def cascade_candidates(all_sections, candidates, query, model, store=None, precomputed=None,
+                       lexical=None, top=None, explore=None, seed=0):
+    """
+    Stage A of cascade ranking: scores every candidate by its title alone
+    and keeps the `top` best plus `explore` others drawn at random, so
+    sections with weak titles still get a chance. Returns (kept candidates,
+    their title vectors, their lexical scores or None).
+    """
+    top = CASCADE_TOP_K if top is None else top
+    explore = CASCADE_EXPLORE if explore is None else explore
+    titles, = section_vectors(all_sections, candidates, model, store, precomputed, fields=("title",))
+    if len(candidates) <= top + explore:
+        return candidates, titles, lexical
+    scores = titles @ query if lexical is None else fuse(titles @ query, lexical)
+    best = top_k(scores, top)
+    rest = np.setdiff1d(np.arange(len(candidates)), best)
+    explored = np.random.default_rng(seed).choice(rest, min(explore, len(rest)), replace=False)
+    keep = np.concatenate([best, np.sort(explored)])
+    print(f"  - Cascade: embedding contents of {len(keep)}/{len(candidates)} sections")
+    return ([candidates[j] for j in keep], titles[keep],
+            None if lexical is None else np.asarray(lexical)[keep])
+
+def rank_sections(all_sections, query_embedding, model, store=None, precomputed=None,
+                  index_dir=None, index_kind=None, shortlist=None, mode=None):
+    """
+    Performs the two-level ranking and returns the top sections. Without a
+    shortlist every section is embedded and top-k selection goes through a
+    vector_index backend (RETRIEVAL_INDEX). With a shortlist ({section
+    index: BM25 score}) only those sections are embedded, and both rankings
+    fuse cosine similarity with BM25 (LEXICAL_FUSION_WEIGHT). In "cascade"
+    mode (RANKING_MODE) contents are only embedded for the sections
+    cascade_candidates keeps after a title-only pass.
+    """
+    mode = mode or RANKING_MODE
+    candidates = list(range(len(all_sections))) if shortlist is None else list(shortlist)
+    lexical = None if shortlist is None else [shortlist[i] for i in candidates]
+    query = as_query_vector(query_embedding)
+    if mode == "cascade":
+        candidates, titles, lexical = cascade_candidates(
+            all_sections, candidates, query, model, store, precomputed, lexical)
+        contents, = section_vectors(all_sections, candidates, model, store, precomputed, fields=("content",))
+    else:
+        titles, contents = section_vectors(all_sections, candidates, model, store, precomputed)
+
+    with metrics.ANALYZE_STAGE_SECONDS.time(stage="rank"):
+        # With unit vectors, 0.5 * cos(q, title) + 0.5 * cos(q, content) is q . (t + c) / 2,
+        # so one inner-product index per ranking replaces the per-section score dicts and sorts.
+        if shortlist is not None or mode == "cascade":
+            def top_sections(vectors):
+                scores = vectors @ query if lexical is None else fuse(vectors @ query, lexical)
+                return [{**all_sections[candidates[j]], 'score': float(scores[j])} for j in top_k(scores, 5)]
+
+            return top_sections((titles + contents) / 2), top_sections(contents)
+
+        positions = section_positions(all_sections)
+        combined_index, content_index = sync_indexes(
+            all_sections, (titles + contents) / 2, contents, index_dir, index_kind)
+
+        def top_sections(index):
+            return [{**all_sections[positions[doc][row]], 'score': score}
+                    for score, doc, row in index.search(query, 5)]
+
+        top_extracted = top_sections(combined_index)
+        top_content = top_sections(content_index)
     return top_extracted, top_content
 
+def lexical_candidates(all_sections, query, rich_sections_dir, size=None):
+    """
+    The BM25 shortlist ({section index: score}) of all_sections for query,
+    from the persistent index in rich_sections_dir, or None if disabled.
+    """
+    size = LEXICAL_SHORTLIST if size is None else size
+    if size <= 0:
+        return None
+    positions = section_positions(all_sections)
+    paths = [rich_sections_dir / f"{Path(doc).stem}.json" for doc in positions]
+    by_stem = {Path(doc).stem: rows for doc, rows in positions.items()}
+    with metrics.ANALYZE_STAGE_SECONDS.time(stage="lexical"):
+        hits = lexical_shortlist(rich_sections_dir, query, size, paths)
+    return {by_stem[doc][row]: score for score, doc, row in hits
+            if doc in by_stem and row < len(by_stem[doc])}
+
+def sync_indexes(all_sections, combined, contents, index_dir=None, index_kind=None):
+    """
+    Returns (combined, content) retrieval indexes holding exactly the given
+    sections. With index_dir, the indexes persist between calls and only
+    documents whose sections changed are re-added (and vanished ones deleted).
+    """
+    positions = section_positions(all_sections)
+    tags = {doc: texts_digest(*passage_texts([all_sections[i] for i in rows]))
+            for doc, rows in positions.items()}
+
+    indexes = []
+    for name, vectors in (("combined", combined), ("content", contents)):
+        path = Path(index_dir) / f"{name}.npz" if index_dir else None
+        index = load_index(path, index_kind) if path else make_index(index_kind)
+        indexed = index.documents()
+        changed = False
+        for doc in indexed.keys() - tags.keys():
+            index.delete(doc)
+            changed = True
+        for doc, rows in positions.items():
+            if indexed.get(doc) != tags[doc]:
+                index.add(doc, vectors[rows], tag=tags[doc])
+                changed = True
+        if path and changed:
+            index.save(path)
+        indexes.append(index)
+    return indexes
+
 def build_output(documents, persona, job, top_extracted, top_content):
     """Formats the final results into the required JSON structure."""
     output = {
@@ -153,35 +319,21 @@ def analyze_collection(input_config_path: Path, rich_sections_dir: Path, output_
         config = json.load(f)
     persona, job, documents = config['persona']['role'], config['job_to_be_done']['task'], config['documents']
 
-    # --- ENHANCED MODEL LOADING WITH FALLBACKS ---
+    # --- SHARED MODEL (loaded once per process by model_registry) ---
     print("Loading semantic analysis model...")
-    from sentence_transformers import SentenceTransformer
-    model_name = 'paraphrase-MiniLM-L3-v2'
-    
-    # Check multiple possible cache locations
-    possible_cache_folders = [
-        str(Path(os.getenv('SENTENCE_TRANSFORMERS_HOME', '/app/model_cache'))),
-        str(rich_sections_dir.parent / "model_cache"),
-        str(Path.home() / ".cache" / "sentence_transformers")
-    ]
-    model = None
-    for cache_folder in possible_cache_folders:
+    with metrics.ANALYZE_STAGE_SECONDS.time(stage="model_load"):
         try:
-            print(f"Trying to load model from cache: {cache_folder}")
-            model = SentenceTransformer(model_name, cache_folder=cache_folder)
-            print(f"✅ Model loaded from {cache_folder}")
-            log_memory_usage("AFTER MODEL LOAD")
-            break
+            model = get_model(MODEL_NAME)
         except Exception as e:
-            print(f"❌ Failed to load model from {cache_folder}: {e}")
-    if model is None:
-        print("❌ All attempts to load the model failed.", file=sys.stderr)
-        return
+            print(f"❌ All attempts to load the model failed: {e}", file=sys.stderr)
+            return
+    log_memory_usage("AFTER MODEL LOAD")
     # -----------------------------------------------------------
 
     expanded_query = expand_query_with_nlp(persona, job)
     print(f"  - Using Expanded Query: {expanded_query}")
-    query_embedding = model.encode("query: " + expanded_query, convert_to_tensor=True, show_progress_bar=False)
+    with metrics.ANALYZE_STAGE_SECONDS.time(stage="encode_query"):
+        query_embedding = model.encode("query: " + expanded_query, convert_to_tensor=True, show_progress_bar=False)
 
     all_sections = load_sections(documents, rich_sections_dir)
     log_memory_usage("AFTER SECTION LOAD")
@@ -189,7 +341,17 @@ def analyze_collection(input_config_path: Path, rich_sections_dir: Path, output_
         print("Error: No sections were found in the pre-processed files.", file=sys.stderr)
         return
 
-    top_extracted, top_content = rank_sections(all_sections, query_embedding, model)
+    model_id = model_key(MODEL_NAME)
+    precomputed = load_precomputed_embeddings(documents, rich_sections_dir, all_sections, model_id)
+    print(f"  - Ingest-time embeddings available for {len(precomputed)}/{len(documents)} document(s)")
+    # The persona and task alone; the generic enrichment sentence would only add noise terms.
+    shortlist = lexical_candidates(all_sections, f"{persona} {job}", rich_sections_dir)
+    if shortlist is not None:
+        print(f"  - Lexical shortlist: {len(shortlist)}/{len(all_sections)} sections")
+    top_extracted, top_content = rank_sections(
+        all_sections, query_embedding, model, store_for(model_id), precomputed,
+        index_dir=rich_sections_dir / "retrieval_index" / model_id.replace("/", "__"),
+        shortlist=shortlist)
     log_memory_usage("AFTER SEMANTIC RANKING")
     output_json = build_output(documents, persona, job, top_extracted, top_content)
 
@@ -199,6 +361,7 @@ def analyze_collection(input_config_path: Path, rich_sections_dir: Path, output_
 
     print(f"Analysis complete. Final Round 1B output saved to {output_path}")
     log_memory_usage("END Stage 2")
+    metrics.STAGE_RSS_MB.observe(metrics.rss_mb(), component="analyze")
 
 # --- LOCAL TESTING HARNESS (UNCHANGED) ---
 if __name__ == '__main__':
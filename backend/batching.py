@@ -0,0 +1,102 @@
+# batching.py - Length-bucketed, token-budgeted batches for the embedding model
+import logging
+import os
+import time
+
+import numpy as np
+
+import metrics
+
+# Padded tokens (batch size x longest member) allowed per forward pass.
+ENCODE_TOKEN_BUDGET = int(os.getenv("ENCODE_TOKEN_BUDGET", 4096))
+# Cap on texts per batch, however short they are.
+ENCODE_MAX_BATCH = int(os.getenv("ENCODE_MAX_BATCH", 256))
+# A batch is closed once a text is shorter than this share of its longest member,
+# which bounds the padding any one text can carry.
+ENCODE_BUCKET_RATIO = float(os.getenv("ENCODE_BUCKET_RATIO", 0.8))
+
+ENCODE_PADDING_WASTE = metrics.histogram(
+    "encode_padding_waste_ratio", "Share of padded token slots that were padding, per encode call.",
+    buckets=(0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1))
+
+
+def token_lengths(texts, model):
+    """
+    Token count of each text as the model will see it (special tokens
+    included, truncated at max_seq_length). Falls back to ~4 characters per
+    token for models without a tokenizer.
+    """
+    tokenizer = getattr(model, "tokenizer", None)
+    max_length = getattr(model, "max_seq_length", None)
+    if tokenizer is not None:
+        encoded = tokenizer(list(texts), add_special_tokens=True, truncation=max_length is not None,
+                            max_length=max_length)
+        return [len(ids) for ids in encoded["input_ids"]]
+    lengths = [len(text) // 4 + 2 for text in texts]
+    return [min(n, max_length) for n in lengths] if max_length else lengths
+
+
+def plan_batches(lengths, token_budget=None, max_batch=None, bucket_ratio=None):
+    """
+    Groups text indices longest first into batches whose padded size
+    (count x longest) stays within token_budget and whose members are all
+    at least bucket_ratio of the longest. Returns a list of index lists.
+    """
+    token_budget = token_budget or ENCODE_TOKEN_BUDGET
+    max_batch = max_batch or ENCODE_MAX_BATCH
+    bucket_ratio = ENCODE_BUCKET_RATIO if bucket_ratio is None else bucket_ratio
+    batches, batch, longest = [], [], 0
+    for i in sorted(range(len(lengths)), key=lambda i: -lengths[i]):
+        if batch and (len(batch) + 1 > max_batch or (len(batch) + 1) * longest > token_budget
+                      or lengths[i] < bucket_ratio * longest):
+            batches.append(batch)
+            batch = []
+        if not batch:
+            longest = max(lengths[i], 1)
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def padding_stats(lengths, batches):
+    """(real tokens, padded token slots) for a batch plan."""
+    real = sum(lengths[i] for batch in batches for i in batch)
+    padded = sum(len(batch) * max(lengths[i] for i in batch) for batch in batches if batch)
+    return real, padded
+
+
+def encode_bucketed(model, texts, token_budget=None, max_batch=None):
+    """
+    Encodes texts in length-bucketed batches and returns (float32 matrix in
+    the original order, report). The report has the batch count, real and
+    padded tokens, padding_waste and sentences_per_sec.
+    """
+    texts = list(texts)
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32), {"texts": 0, "batches": 0}
+    start = time.perf_counter()
+    lengths = token_lengths(texts, model)
+    batches = plan_batches(lengths, token_budget, max_batch)
+    out = None
+    for batch in batches:
+        vectors = np.asarray(model.encode([texts[i] for i in batch], batch_size=len(batch),
+                                          convert_to_numpy=True, show_progress_bar=False), dtype=np.float32)
+        if out is None:
+            out = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+        out[batch] = vectors
+    elapsed = time.perf_counter() - start
+    real, padded = padding_stats(lengths, batches)
+    report = {
+        "texts": len(texts),
+        "batches": len(batches),
+        "tokens": real,
+        "padded_tokens": padded,
+        "padding_waste": 1 - real / padded if padded else 0.0,
+        "seconds": elapsed,
+        "sentences_per_sec": len(texts) / elapsed if elapsed > 0 else 0.0,
+    }
+    ENCODE_PADDING_WASTE.observe(report["padding_waste"])
+    logging.info(f"🧮 Encoded {len(texts)} texts in {len(batches)} batches, "
+                 f"{report['padding_waste']:.1%} padding, {report['sentences_per_sec']:.0f} texts/s")
+    return out, report
@@ -0,0 +1 @@
+# benchmarks - Offline performance checks for the Stage 1 extractor
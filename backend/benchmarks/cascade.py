@@ -0,0 +1,102 @@
+# cascade.py - Top-5 agreement and latency of cascade vs exhaustive section ranking
+#
+#   python -m benchmarks.cascade [--sections 1000] [--top-k 25 50 100] [--explore 10] [--outlines output/]
+#
+# Ranks the same sections for several queries exhaustively and in cascade
+# mode (title pass first, contents only for the shortlist), both cold
+# (no embedding store, no ingest-time vectors, so every encode is paid),
+# and reports how often the cascade changes the top 5 of either ranking
+# and how much encode time it saves.
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+
+import analyze_collections
+from analyze_collections import rank_sections
+from benchmarks.encode_batching import make_sections
+from model_registry import DEFAULT_MODEL, get_model
+
+QUERIES = [
+    "Travel Planner. Plan a trip of 4 days for a group of 10 college friends.",
+    "HR professional. Create and manage fillable forms for onboarding and compliance.",
+    "Food Contractor. Prepare a vegetarian buffet-style dinner menu for a corporate gathering.",
+    "Researcher. Review the methodology, datasets and benchmarks of the papers.",
+    "Student. Identify key concepts and mechanisms for exam preparation.",
+]
+
+
+def load_outline_sections(outlines_dir):
+    """Sections of every Stage 1 outline in outlines_dir, shaped like load_sections' output."""
+    sections = []
+    for path in sorted(Path(outlines_dir).glob("*.json")):
+        try:
+            outline = json.loads(path.read_text(encoding="utf-8")).get("outline", [])
+        except (ValueError, AttributeError):
+            continue
+        for section in outline:
+            sections.append({**section, "document": f"{path.stem}.pdf",
+                             "section_title": section.get("text", ""), "page": section.get("page", 0)})
+    return sections
+
+
+def keys(ranked):
+    return [(s["document"], s["section_title"], s.get("page")) for s in ranked]
+
+
+def timed_rank(sections, query_embedding, model, mode, top, explore):
+    analyze_collections.CASCADE_TOP_K = top
+    analyze_collections.CASCADE_EXPLORE = explore
+    start = time.perf_counter()
+    extracted, content = rank_sections(sections, query_embedding, model, mode=mode)
+    return keys(extracted), keys(content), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cascade vs exhaustive ranking benchmark.")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--sections", type=int, default=1000)
+    parser.add_argument("--outlines", help="Stage 1 output folder to rank instead of the synthetic corpus.")
+    parser.add_argument("--top-k", type=int, nargs="+", default=[25, 50, 100])
+    parser.add_argument("--explore", type=int, default=10)
+    parser.add_argument("-o", "--output", help="Optional path for the JSON report.")
+    args = parser.parse_args()
+
+    sections = load_outline_sections(args.outlines) if args.outlines else [
+        {**s, "document": f"doc{i // 50}.pdf", "page": i % 50 + 1} for i, s in enumerate(make_sections(args.sections))]
+    model = get_model(args.model)
+    queries = [model.encode("query: " + q, convert_to_numpy=True, show_progress_bar=False) for q in QUERIES]
+
+    exhaustive = [timed_rank(sections, q, model, "exhaustive", 0, 0) for q in queries]
+    report = [{"mode": "exhaustive", "sections": len(sections),
+               "median_seconds": statistics.median(r[2] for r in exhaustive)}]
+    for top in args.top_k:
+        cascade = [timed_rank(sections, q, model, "cascade", top, args.explore) for q in queries]
+        pairs = list(zip(exhaustive, cascade))
+        report.append({
+            "mode": f"cascade(top={top}, explore={args.explore})",
+            "sections": len(sections),
+            "median_seconds": statistics.median(r[2] for r in cascade),
+            # Share of queries whose top-5 list (order included) differs from exhaustive ranking.
+            "extracted_top5_changed": statistics.mean(e[0] != c[0] for e, c in pairs),
+            "content_top5_changed": statistics.mean(e[1] != c[1] for e, c in pairs),
+            "extracted_overlap@5": statistics.mean(len(set(e[0]) & set(c[0])) / 5 for e, c in pairs),
+            "content_overlap@5": statistics.mean(len(set(e[1]) & set(c[1])) / 5 for e, c in pairs),
+        })
+    base = report[0]["median_seconds"]
+    for row in report:
+        row["latency_saved"] = 1 - row["median_seconds"] / base
+        detail = ""
+        if "extracted_top5_changed" in row:
+            detail = (f"  top-5 changed: extracted {row['extracted_top5_changed']:.0%}, "
+                      f"content {row['content_top5_changed']:.0%}  "
+                      f"overlap@5 {row['extracted_overlap@5']:.2f}/{row['content_overlap@5']:.2f}")
+        print(f"{row['mode']:<28}  {row['median_seconds']:7.2f}s  saved {row['latency_saved']:5.1%}{detail}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
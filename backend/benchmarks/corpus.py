@@ -0,0 +1,110 @@
+# corpus.py - Deterministic synthetic PDFs for the benchmarks
+import random
+from pathlib import Path
+
+import fitz
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+         "tempor incididunt ut labore et dolore magna aliqua").split()
+
+
+def _paragraph(rng, n_words):
+    return " ".join(rng.choice(WORDS) for _ in range(n_words)) + "."
+
+
+def _draw_table(page, rng, x, y, rows=4, cols=3):
+    """Ruled table; cell text avoids digits so it can't look like a ToC line."""
+    page.insert_text((x, y - 5), "Table Summary Header", fontsize=11, fontname="hebo")
+    for r in range(rows):
+        for c in range(cols):
+            rect = fitz.Rect(x + c * 120, y + r * 20, x + (c + 1) * 120, y + (r + 1) * 20)
+            page.draw_rect(rect, color=(0, 0, 0), width=0.8)
+            page.insert_text((rect.x0 + 4, rect.y1 - 6), rng.choice(WORDS).title(), fontsize=9)
+    return y + rows * 20
+
+
+def build_pdf(path, pages, toc=False, tables=False, header_xobject=False, seed=0):
+    """
+    Writes a manual-like PDF: a title on page 1, three numbered headings with
+    body text per page, optionally a ruled table every other page, a running
+    header placed as a shared Form XObject, and an embedded ToC.
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+    header_src = None
+    if header_xobject:
+        header_src = fitz.open()
+        hp = header_src.new_page(width=595, height=40)
+        hp.insert_text((20, 25), "ACME Corp Internal Handbook", fontsize=9)
+    toc_entries = []
+    for i in range(pages):
+        page = doc.new_page()
+        if i == 0:
+            page.insert_text((72, 80), "Synthetic Manual Title", fontsize=22, fontname="hebo")
+        y = 120
+        for s in range(3):
+            heading = f"{i + 1}.{s + 1} Section {i}-{s} topic"
+            page.insert_text((72, y), heading, fontsize=14, fontname="hebo")
+            toc_entries.append([1 if s == 0 else 2, heading, i + 1])
+            y += 20
+            for _ in range(4):
+                page.insert_text((72, y), _paragraph(rng, 10), fontsize=10)
+                y += 14
+            y += 10
+        if tables and i % 2 == 0:
+            _draw_table(page, rng, 72, y + 20)
+        if header_src is not None:
+            page.show_pdf_page(fitz.Rect(0, 0, 595, 40), header_src, 0)
+    if toc:
+        doc.set_toc(toc_entries)
+    doc.save(str(path), garbage=3, deflate=True)
+    doc.close()
+    return Path(path)
+
+
+def build_poster(path, seed=0):
+    """Single large page with a few big headings and sparse text."""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    page = doc.new_page(width=1684, height=2384)  # A1
+    page.insert_text((120, 200), "Research Poster Title", fontsize=64, fontname="hebo")
+    y = 400
+    for heading in ("Introduction", "Methods", "Results", "Conclusion"):
+        page.insert_text((120, y), heading, fontsize=40, fontname="hebo")
+        y += 60
+        for _ in range(6):
+            page.insert_text((120, y), _paragraph(rng, 14), fontsize=24)
+            y += 34
+        y += 80
+    doc.save(str(path))
+    doc.close()
+    return Path(path)
+
+
+# name -> (builder, kwargs). Every benchmark case is regenerated identically from here.
+CORPUS = {
+    "single_page": (build_pdf, {"pages": 1}),
+    "poster": (build_poster, {}),
+    "toc_100": (build_pdf, {"pages": 100, "toc": True}),
+    "toc_2000": (build_pdf, {"pages": 2000, "toc": True}),
+    "notoc_100": (build_pdf, {"pages": 100}),
+    "notoc_2000": (build_pdf, {"pages": 2000}),
+    "tables_200": (build_pdf, {"pages": 200, "tables": True}),
+    "header_xobject_200": (build_pdf, {"pages": 200, "header_xobject": True}),
+}
+
+QUICK = ["single_page", "poster", "toc_100", "notoc_100", "tables_200", "header_xobject_200"]
+
+
+def ensure_corpus(corpus_dir, names=None):
+    """Builds any missing corpus PDFs into corpus_dir and returns {name: path}."""
+    corpus_dir = Path(corpus_dir)
+    corpus_dir.mkdir(parents=True, exist_ok=True)
+    paths = {}
+    for name in names or CORPUS:
+        builder, kwargs = CORPUS[name]
+        path = corpus_dir / f"{name}.pdf"
+        if not path.exists():
+            builder(path, **kwargs)
+        paths[name] = path
+    return paths
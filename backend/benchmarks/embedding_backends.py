@@ -0,0 +1,134 @@
+# embedding_backends.py - Parity and throughput of the embedding inference backends
+#
+#   python -m benchmarks.embedding_backends [--backends torch torch-dynamic-int8 onnxruntime]
+#                                           [--outlines output/] [--tolerance 0.99]
+#
+# Encodes the same passages with every backend and compares each one to
+# fp32 torch by per-passage cosine similarity, then times sentences/sec.
+# The storage dtypes (float16, int8) are checked the same way against the
+# fp32 vectors. Exits non-zero if any backend or dtype falls below the
+# tolerance. Uses the models cached by setup_offline_assets.py.
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from embedding_store import pack, passage_texts, unpack
+from model_registry import DEFAULT_MODEL, BACKENDS, get_model, models
+
+SAMPLE_SENTENCES = [
+    "Plan a four-day trip to the South of France for a group of ten college friends.",
+    "Create and manage fillable forms for onboarding and compliance.",
+    "Prepare a vegetarian buffet-style dinner menu including gluten-free items.",
+    "Coastal adventures: beaches, water sports and nightlife along the Mediterranean.",
+    "Change flat forms to fillable forms with the Prepare Form tool.",
+    "Falafel: soak the chickpeas overnight, then blend with herbs and spices.",
+    "Request e-signatures from multiple recipients and track their progress.",
+    "Traditions and culture of the region, from local festivals to cuisine.",
+]
+
+
+def load_passages(outlines_dir, limit):
+    """Section titles and contents from Stage 1 outlines, or the built-in sample."""
+    texts = []
+    if outlines_dir:
+        for path in sorted(Path(outlines_dir).glob("*.json")):
+            try:
+                sections = json.loads(path.read_text(encoding="utf-8")).get("outline", [])
+            except (ValueError, AttributeError):
+                continue
+            titles, contents = passage_texts(sections)
+            texts.extend(titles + contents)
+    if not texts:
+        texts = ["passage: " + s for s in SAMPLE_SENTENCES]
+    while len(texts) < limit:
+        texts = texts + texts
+    return texts[:limit]
+
+
+def row_cosines(a, b):
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    return (a * b).sum(axis=1) / np.maximum(np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1), 1e-12)
+
+
+def throughput(model, texts, batch_size, repeat):
+    model.encode(texts[:batch_size], batch_size=batch_size, show_progress_bar=False)  # warm-up
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        model.encode(texts, batch_size=batch_size, show_progress_bar=False, convert_to_numpy=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(texts) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parity/throughput benchmark for the embedding backends.")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--outlines", help="Stage 1 output folder to take passages from.")
+    parser.add_argument("--sentences", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=0.99,
+                        help="Minimum per-passage cosine to fp32 torch for a backend or dtype to pass.")
+    parser.add_argument("-o", "--output", help="Optional path for the JSON report.")
+    args = parser.parse_args()
+
+    texts = load_passages(args.outlines, args.sentences)
+    reference = get_model(args.model, "torch").encode(
+        texts, batch_size=args.batch_size, show_progress_bar=False, convert_to_numpy=True)
+
+    report = []
+    failed = False
+    for backend in args.backends:
+        try:
+            model = get_model(args.model, backend)
+        except Exception as exc:
+            print(f"{backend:<20}  skipped: {exc}")
+            report.append({"backend": backend, "skipped": str(exc)})
+            continue
+        vectors = model.encode(texts, batch_size=args.batch_size, show_progress_bar=False, convert_to_numpy=True)
+        cosines = row_cosines(vectors, reference)
+        footprint = next((f for key, f in models.loaded().items() if f["backend"] == backend), {})
+        row = {
+            "backend": backend,
+            "min_cosine": float(cosines.min()),
+            "mean_cosine": float(cosines.mean()),
+            "sentences_per_sec": throughput(model, texts, args.batch_size, args.repeat),
+            "parameters_mb": footprint.get("parameters_mb"),
+            "load_seconds": footprint.get("load_seconds"),
+        }
+        row["passed"] = row["min_cosine"] >= args.tolerance
+        failed |= not row["passed"]
+        report.append(row)
+        print(f"{backend:<20}  min cos {row['min_cosine']:.5f}  mean {row['mean_cosine']:.5f}  "
+              f"{row['sentences_per_sec']:8.1f} sent/s  {row['parameters_mb']} MB  "
+              f"{'ok' if row['passed'] else 'BELOW TOLERANCE'}")
+
+    for dtype in ("float32", "float16", "int8"):
+        stored, scales = pack(reference, dtype)
+        cosines = row_cosines(unpack(stored, scales), reference)
+        nbytes = stored.nbytes + (scales.nbytes if scales is not None else 0)
+        row = {
+            "store_dtype": dtype,
+            "min_cosine": float(cosines.min()),
+            "bytes_per_vector": nbytes / len(reference),
+            "passed": bool(cosines.min() >= args.tolerance),
+        }
+        failed |= not row["passed"]
+        report.append(row)
+        print(f"store {dtype:<14}  min cos {row['min_cosine']:.5f}  {row['bytes_per_vector']:.0f} bytes/vector  "
+              f"{'ok' if row['passed'] else 'BELOW TOLERANCE'}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=4))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+# encode_batching.py - Padding waste and throughput of length-bucketed section encoding
+#
+#   python -m benchmarks.encode_batching [--sections 1000] [--budgets 2048 4096 8192] [--outlines output/]
+#
+# Compares the previous scheme (titles, then contents, each one
+# model.encode call with batch_size=32) with batching.encode_bucketed over
+# titles and contents together, on a mixed-length corpus: short titles,
+# one-line contents and multi-paragraph contents.
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+
+from batching import encode_bucketed, padding_stats, token_lengths
+from benchmarks.embedding_backends import load_passages
+from embedding_store import passage_texts
+from model_registry import DEFAULT_MODEL, get_model
+
+WORDS = ("form signature document travel recipe menu coastal nightlife buffet vegetarian field "
+         "acrobat export share review city hotel budget ingredient instructions").split()
+
+
+def make_sections(count, seed=0):
+    rng = random.Random(seed)
+    sections = []
+    for i in range(count):
+        words = rng.choice((3, 12, 40, 150, 400))
+        sections.append({
+            "section_title": " ".join(rng.choices(WORDS, k=rng.randint(2, 8))).title(),
+            "content": " ".join(rng.choices(WORDS, k=rng.randint(words // 2, words))),
+        })
+    return sections
+
+
+def previous_plan(texts, batch_size=32):
+    """SentenceTransformer.encode's own batching: longest (by characters) first, fixed-size chunks."""
+    order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def run_previous(model, titles, contents):
+    start = time.perf_counter()
+    for texts in (titles, contents):
+        model.encode(texts, batch_size=32, convert_to_numpy=True, show_progress_bar=False)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Padding/throughput benchmark for length-bucketed encoding.")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--sections", type=int, default=1000)
+    parser.add_argument("--outlines", help="Stage 1 output folder to take sections from instead.")
+    parser.add_argument("--budgets", type=int, nargs="+", default=[2048, 4096, 8192])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("-o", "--output", help="Optional path for the JSON report.")
+    args = parser.parse_args()
+
+    if args.outlines:
+        texts = load_passages(args.outlines, 2 * args.sections)
+        titles, contents = texts[:len(texts) // 2], texts[len(texts) // 2:]
+    else:
+        titles, contents = passage_texts(make_sections(args.sections))
+    model = get_model(args.model)
+    model.encode(titles[:32], show_progress_bar=False)  # warm-up
+
+    report = []
+    lengths = {"titles": token_lengths(titles, model), "contents": token_lengths(contents, model)}
+    real = padded = 0
+    for name, texts in (("titles", titles), ("contents", contents)):
+        r, p = padding_stats(lengths[name], previous_plan(texts))
+        real, padded = real + r, padded + p
+    seconds = min(run_previous(model, titles, contents) for _ in range(args.repeat))
+    baseline = {"scheme": "previous", "padding_waste": 1 - real / padded, "padded_tokens": padded,
+                "seconds": seconds, "sentences_per_sec": (len(titles) + len(contents)) / seconds}
+    report.append(baseline)
+
+    for budget in args.budgets:
+        runs = [encode_bucketed(model, titles + contents, token_budget=budget)[1] for _ in range(args.repeat)]
+        best = min(runs, key=lambda r: r["seconds"])
+        report.append({"scheme": f"bucketed({budget})", **best,
+                       "speedup": baseline["seconds"] / best["seconds"]})
+
+    for row in report:
+        speedup = f"  x{row['speedup']:.2f}" if "speedup" in row else ""
+        print(f"{row['scheme']:<18}  padding {row['padding_waste']:6.1%}  {row['padded_tokens']:>9} slots  "
+              f"{row['seconds']:7.2f}s  {row['sentences_per_sec']:8.1f} texts/s{speedup}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=4, default=float))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+# harness.py - Runs a benchmark function in a fresh process and reports its peak RSS
+import multiprocessing
+import resource
+import sys
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KB on Linux and in bytes on macOS.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _child(func, args, queue):
+    try:
+        result = func(*args)
+        result["peak_rss_mb"] = peak_rss_mb()
+        queue.put(result)
+    except Exception as exc:
+        queue.put({"error": f"{type(exc).__name__}: {exc}"})
+
+
+def run_isolated(func, *args):
+    """
+    Calls func(*args) -> dict in a spawned process, so that peak RSS is that
+    of this run alone, and returns the dict with "peak_rss_mb" added.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_child, args=(func, args, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
@@ -0,0 +1,69 @@
+# memory.py - Peak RSS of extract_outline as the page count grows
+#
+#   python -m benchmarks.memory [--pages 10 100 500 1000] [--max_growth 1.5]
+#
+# Each run happens in a fresh subprocess so peak RSS (ru_maxrss) is per run.
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.corpus import build_pdf
+from benchmarks.harness import peak_rss_mb, run_isolated
+
+
+def _run(pdf_path, low_memory):
+    from heading_extractor import extract_outline
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    result = extract_outline(pdf_path, low_memory=low_memory)
+    return {
+        "elapsed": time.perf_counter() - start,
+        "import_rss_mb": baseline,
+        "sections": len(result.get("outline", [])),
+    }
+
+
+def measure(pdf_path, low_memory):
+    return run_isolated(_run, str(pdf_path), low_memory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak RSS benchmark for extract_outline.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 500, 1000])
+    parser.add_argument("--modes", nargs="+", default=["default", "low_memory"],
+                        choices=["default", "low_memory"])
+    parser.add_argument("--max_growth", type=float, default=1.5,
+                        help="Fail if low-memory peak RSS at the largest size exceeds the smallest by this factor.")
+    parser.add_argument("-o", "--output", help="Optional path for the JSON report.")
+    args = parser.parse_args()
+
+    report = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in args.pages:
+            # Tables and a header XObject on every page exercise pdfplumber and the form memo.
+            pdf_path = build_pdf(Path(tmp) / f"bench_{pages}.pdf", pages, tables=True, header_xobject=True)
+            for mode in args.modes:
+                row = {"pages": pages, "mode": mode, **measure(pdf_path, mode == "low_memory")}
+                report.append(row)
+                print(f"{pages:>6} pages  {mode:<10}  peak {row['peak_rss_mb']:7.1f} MB  "
+                      f"(imports {row['import_rss_mb']:.1f} MB)  {row['elapsed']:6.1f}s  "
+                      f"{row['sections']} sections")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=4))
+
+    low = [r for r in report if r["mode"] == "low_memory"]
+    if len(low) >= 2:
+        growth = low[-1]["peak_rss_mb"] / low[0]["peak_rss_mb"]
+        print(f"Low-memory peak RSS growth {low[0]['pages']} -> {low[-1]['pages']} pages: x{growth:.2f}")
+        if growth > args.max_growth:
+            print(f"FAIL: growth exceeds x{args.max_growth}")
+            sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# retrieval.py - Recall and latency of rank_sections' top-k selection backends
+#
+#   python -m benchmarks.retrieval [--sizes 1000 10000 100000] [--queries 50] [--nprobe 4 8 16 32]
+#
+# Compares the original "score every section into a dict and sort" ranking
+# with the exact argpartition index and the approximate IVF index on a
+# synthetic clustered corpus of unit vectors (MiniLM's 384 dimensions).
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+
+import numpy as np
+
+from vector_index import ExactIndex, IVFIndex, normalize_rows
+
+DIM = 384
+K = 5
+
+
+def make_corpus(size, dim=DIM, clusters=None, seed=0):
+    """Unit vectors around random topic centres, plus queries drawn near the same topics."""
+    rng = np.random.default_rng(seed)
+    clusters = clusters or max(8, int(np.sqrt(size)))
+    centres = normalize_rows(rng.standard_normal((clusters, dim)))
+    labels = rng.integers(0, clusters, size)
+    vectors = normalize_rows(centres[labels] + 0.6 * rng.standard_normal((size, dim)) / np.sqrt(dim) * 4)
+    return vectors.astype(np.float32), centres, rng
+
+
+def make_queries(centres, count, rng):
+    picks = centres[rng.integers(0, len(centres), count)]
+    return normalize_rows(picks + 0.8 * rng.standard_normal(picks.shape) / np.sqrt(picks.shape[1]) * 4)
+
+
+def sort_baseline(vectors, sections, query):
+    """What rank_sections did before: a scored dict per section, then a full sort."""
+    scores = vectors @ query
+    scored = [{**section, 'score': scores[i].item()} for i, section in enumerate(sections)]
+    return [s['row'] for s in sorted(scored, key=lambda s: s['score'], reverse=True)[:K]]
+
+
+def add_documents(index, vectors, doc_size=200):
+    """Adds the corpus as documents of doc_size sections, the unit rank_sections indexes by."""
+    for start in range(0, len(vectors), doc_size):
+        index.add(f"doc{start // doc_size}", vectors[start:start + doc_size])
+    return doc_size
+
+
+def timed(func, queries):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(func(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, statistics.median(latencies)
+
+
+def recall(results, truth):
+    return statistics.mean(len(set(r) & set(t)) / len(t) for r, t in zip(results, truth))
+
+
+def run(size, query_count, nprobes, sort_queries):
+    vectors, centres, rng = make_corpus(size)
+    queries = make_queries(centres, query_count, rng)
+    sections = [{"document": f"doc{i // 200}", "section_title": f"s{i}", "row": i} for i in range(size)]
+    rows = []
+
+    baseline, ms = timed(lambda q: sort_baseline(vectors, sections, q), queries[:sort_queries])
+    rows.append({"size": size, "backend": "sort", "recall@5": 1.0, "median_ms": ms})
+
+    exact = ExactIndex()
+    doc_size = add_documents(exact, vectors)
+
+    def as_rows(hits):
+        return [int(doc[3:]) * doc_size + row for _, doc, row in hits]
+
+    truth, ms = timed(lambda q: as_rows(exact.search(q, K)), queries)
+    rows.append({"size": size, "backend": "exact", "recall@5": recall(truth[:sort_queries], baseline),
+                 "median_ms": ms})
+
+    for nprobe in nprobes:
+        ivf = IVFIndex(nprobe=nprobe, min_train=1)
+        add_documents(ivf, vectors)
+        start = time.perf_counter()
+        ivf.train()
+        train_s = time.perf_counter() - start
+        results, ms = timed(lambda q: as_rows(ivf.search(q, K)), queries)
+        rows.append({"size": size, "backend": f"ivf(nprobe={nprobe})", "recall@5": recall(results, truth),
+                     "median_ms": ms, "train_s": train_s})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall/latency benchmark for the retrieval index backends.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--sort-queries", type=int, default=10,
+                        help="Queries timed for the slow dict+sort baseline.")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("-o", "--output", help="Optional path for the JSON report.")
+    args = parser.parse_args()
+
+    report = []
+    for size in args.sizes:
+        for row in run(size, args.queries, args.nprobe, args.sort_queries):
+            report.append(row)
+            extra = f"  train {row['train_s']:.2f}s" if "train_s" in row else ""
+            print(f"{row['size']:>8}  {row['backend']:<16}  recall@5 {row['recall@5']:.3f}  "
+                  f"{row['median_ms']:8.2f} ms/query{extra}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
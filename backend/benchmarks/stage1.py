@@ -0,0 +1,127 @@
+# stage1.py - Per-phase timing and peak RSS of extract_outline over the synthetic corpus
+#
+#   python -m benchmarks.stage1                   # full corpus, compare with baseline.json
+#   python -m benchmarks.stage1 --quick           # skip the 2,000-page documents
+#   python -m benchmarks.stage1 --save-baseline   # record the current numbers as the baseline
+#
+# Runs offline: every PDF is generated locally with PyMuPDF and cached in --corpus-dir.
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.corpus import CORPUS, QUICK, ensure_corpus
+from benchmarks.harness import run_isolated
+
+BENCH_DIR = Path(__file__).parent
+DEFAULT_BASELINE = BENCH_DIR / "baseline.json"
+PHASES = ("title", "toc", "ocr", "candidates", "mapping")
+
+
+def _run_case(pdf_path, workers, low_memory):
+    from heading_extractor import extract_outline
+    timings = {}
+    start = time.perf_counter()
+    result = extract_outline(pdf_path, workers=workers, low_memory=low_memory, timings=timings)
+    return {
+        "total": time.perf_counter() - start,
+        "phases": {phase: timings.get(phase, 0.0) for phase in PHASES},
+        "sections": len(result.get("outline", [])),
+    }
+
+
+def run_case(pdf_path, repeat=3, workers=1, low_memory=False):
+    """Median timings over `repeat` fresh-process runs; peak RSS is the max seen."""
+    runs = [run_isolated(_run_case, str(pdf_path), workers, low_memory) for _ in range(repeat)]
+    for run in runs:
+        if "error" in run:
+            return run
+    return {
+        "total": statistics.median(r["total"] for r in runs),
+        "phases": {p: statistics.median(r["phases"][p] for r in runs) for p in PHASES},
+        "peak_rss_mb": max(r["peak_rss_mb"] for r in runs),
+        "sections": runs[0]["sections"],
+    }
+
+
+def compare(results, baseline, threshold, min_seconds):
+    """
+    Returns a list of regression messages. A metric regresses when it exceeds
+    the baseline by more than `threshold` (a ratio) and, for timings, by more
+    than `min_seconds` in absolute terms, so tiny cases don't flap on noise.
+    """
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base or "error" in current:
+            continue
+        metrics = [("total", current["total"], base["total"], True)]
+        metrics += [(f"phases.{p}", current["phases"][p], base["phases"].get(p, 0.0), True) for p in PHASES]
+        metrics.append(("peak_rss_mb", current["peak_rss_mb"], base["peak_rss_mb"], False))
+        for metric, now, then, is_time in metrics:
+            if now > then * threshold and (not is_time or now - then > min_seconds):
+                regressions.append(f"{name} {metric}: {now:.3f} vs baseline {then:.3f} (x{now / max(then, 1e-9):.2f})")
+        if current["sections"] != base.get("sections", current["sections"]):
+            regressions.append(f"{name} sections: {current['sections']} vs baseline {base['sections']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stage 1 extraction benchmark suite.")
+    parser.add_argument("--cases", nargs="+", choices=sorted(CORPUS), help="Subset of corpus cases to run.")
+    parser.add_argument("--quick", action="store_true", help="Skip the 2,000-page documents.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--low_memory", action="store_true")
+    parser.add_argument("--corpus-dir", default=Path(tempfile.gettempdir()) / "stage1_bench_corpus")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Write results to --baseline instead of comparing.")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="Allowed ratio over the baseline before a metric counts as a regression.")
+    parser.add_argument("--min-seconds", type=float, default=0.05,
+                        help="Timing regressions smaller than this many seconds are ignored.")
+    parser.add_argument("-o", "--output", help="Optional path for the JSON results.")
+    args = parser.parse_args()
+
+    names = args.cases or (QUICK if args.quick else list(CORPUS))
+    corpus = ensure_corpus(args.corpus_dir, names)
+
+    results = {}
+    for name in names:
+        row = run_case(corpus[name], args.repeat, args.workers, args.low_memory)
+        results[name] = row
+        if "error" in row:
+            print(f"{name:<20} ERROR {row['error']}")
+            continue
+        phases = "  ".join(f"{p} {row['phases'][p]:.3f}" for p in PHASES)
+        print(f"{name:<20} total {row['total']:7.3f}s  {phases}  "
+              f"peak {row['peak_rss_mb']:.0f} MB  {row['sections']} sections")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=4))
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+        baseline.update({name: row for name, row in results.items() if "error" not in row})
+        baseline_path.write_text(json.dumps(baseline, indent=4) + "\n")
+        print(f"Baseline written to {baseline_path}")
+        return
+    if not baseline_path.exists():
+        print(f"No baseline at {baseline_path}; run with --save-baseline first.")
+        return
+
+    regressions = compare(results, json.loads(baseline_path.read_text()), args.threshold, args.min_seconds)
+    errors = [name for name, row in results.items() if "error" in row]
+    for message in regressions:
+        print(f"REGRESSION {message}")
+    if regressions or errors:
+        sys.exit(1)
+    print("OK: no regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+# embedding_store.py - On-disk cache of passage embeddings keyed by model and text hash
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+import metrics
+
+BASE_DIR = Path(__file__).parent
+EMBEDDING_STORE_DIR = Path(os.getenv("EMBEDDING_STORE_DIR", BASE_DIR / "cache" / "embeddings"))
+# float16 halves the disk and page-cache footprint at a negligible cosine error;
+# int8 (symmetric, one scale per row) quarters it.
+EMBEDDING_STORE_DTYPE = os.getenv("EMBEDDING_STORE_DTYPE", "float32")
+# Segments are merged into one once a model has more than this many, which
+# also releases the memmaps (and file descriptors) of the merged ones.
+EMBEDDING_STORE_MAX_SEGMENTS = int(os.getenv("EMBEDDING_STORE_MAX_SEGMENTS", 16))
+# Disk budget per model; merging drops the least recently used rows beyond it.
+EMBEDDING_STORE_MAX_BYTES = int(os.getenv("EMBEDDING_STORE_MAX_BYTES", 256 * 1024 * 1024))
+# Upper bound on a segment's .npy header, counted against the budget.
+_NPY_HEADER_BYTES = 128
+
+EMBEDDING_LOOKUPS = metrics.counter(
+    "embedding_store_lookups", "Embedding store lookups by result (hit, miss).", ["result"])
+
+
+def text_key(text):
+    """Store key for one encoder input; callers hash exactly what they encode (e.g. "passage: ...")."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def pack(matrix, dtype):
+    """float32 rows -> (stored array, per-row scales or None) for the storage dtype."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if np.dtype(dtype) != np.int8:
+        return matrix.astype(dtype), None
+    scales = np.abs(matrix).max(axis=-1) / 127 if matrix.size else np.zeros(len(matrix), np.float32)
+    scales = np.where(scales > 0, scales, 1).astype(np.float32)
+    return np.round(matrix / scales[:, None]).astype(np.int8), scales
+
+
+def unpack(stored, scales=None):
+    stored = np.asarray(stored, dtype=np.float32)
+    return stored if scales is None else stored * np.asarray(scales, dtype=np.float32)[..., None]
+
+
+def _atomic_write(path, write):
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class EmbeddingStore:
+    """
+    Embeddings for one model, stored as append-only segments: seg-<id>.npy
+    holds a (rows, dim) matrix that is opened as a read-only memmap, and
+    seg-<id>.keys lists the text hash of each row. index.json names the
+    segments. Writers replace files atomically, so other processes (or
+    uvicorn workers) sharing the directory only ever see whole segments;
+    if two processes publish at the same instant one segment may be left
+    out of the index, which only costs re-encoding those texts later.
+
+    Once there are more than max_segments segments, or they take more than
+    max_bytes, a put merges them all into one segment, keeping the rows
+    this process looked up most recently when the budget does not fit them all.
+    """
+
+    def __init__(self, model_id, root=None, dtype=None, max_segments=None, max_bytes=None):
+        self.model_id = model_id
+        self.dir = Path(root or EMBEDDING_STORE_DIR) / model_id.replace("/", "__")
+        self.dtype = np.dtype(dtype or EMBEDDING_STORE_DTYPE)
+        self.max_segments = max_segments or EMBEDDING_STORE_MAX_SEGMENTS
+        self.max_bytes = max_bytes if max_bytes is not None else EMBEDDING_STORE_MAX_BYTES
+        self._lock = threading.Lock()
+        self._segments = {}
+        self._rows = {}
+        self._index_mtime = None
+        # Keys found by get() since the last merge; they are the last to be evicted.
+        self._used = set()
+
+    @property
+    def _index_path(self):
+        return self.dir / "index.json"
+
+    def _read_index(self):
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"segments": []}
+
+    def _write_index(self, index):
+        _atomic_write(self._index_path, lambda f: f.write(json.dumps(index, indent=1).encode("utf-8")))
+
+    def _refresh(self):
+        """
+        Maps any segments added since the last look (by this or another
+        process) and unmaps the ones a merge has removed from the index.
+        """
+        try:
+            mtime = self._index_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._index_mtime:
+            return
+        names = self._read_index()["segments"]
+        for name in [n for n in self._segments if n not in names]:
+            del self._segments[name]  # Drops the memmap, closing its file.
+        for name in names:
+            if name in self._segments:
+                continue
+            try:
+                matrix = np.load(self.dir / f"{name}.npy", mmap_mode="r")
+                scales_path = self.dir / f"{name}.scales.npy"
+                scales = np.load(scales_path) if scales_path.exists() else None
+                keys = (self.dir / f"{name}.keys").read_text(encoding="utf-8").split()
+            except FileNotFoundError:
+                continue  # Merged away by another process since the index was read.
+            self._segments[name] = (matrix, scales, keys)
+        self._rows = {key: (name, row) for name in names if name in self._segments
+                      for row, key in enumerate(self._segments[name][2])}
+        self._index_mtime = mtime
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._rows)
+
+    def get(self, keys):
+        """Returns (vectors, missing): float32 rows for found keys (None elsewhere) and the missing positions."""
+        with self._lock:
+            self._refresh()
+            vectors = [None] * len(keys)
+            missing = []
+            for i, key in enumerate(keys):
+                location = self._rows.get(key)
+                if location is None:
+                    missing.append(i)
+                else:
+                    name, row = location
+                    matrix, scales, _ = self._segments[name]
+                    vectors[i] = unpack(matrix[row], None if scales is None else scales[row])
+                    self._used.add(key)
+        EMBEDDING_LOOKUPS.inc(len(keys) - len(missing), result="hit")
+        EMBEDDING_LOOKUPS.inc(len(missing), result="miss")
+        return vectors, missing
+
+    def put(self, keys, vectors):
+        """Appends a new segment with the given rows (keys already stored are skipped)."""
+        vectors = np.asarray(vectors)
+        with self._lock:
+            self._refresh()
+            fresh = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self._rows and key not in fresh:
+                    fresh[key] = vector
+            if not fresh:
+                return
+            self.dir.mkdir(parents=True, exist_ok=True)
+            name = self._write_segment(list(fresh), np.stack(list(fresh.values())))
+            # Re-read right before publishing to keep segments other processes added meanwhile.
+            index = self._read_index()
+            index["segments"].append(name)
+            index.update(model=self.model_id, dtype=self.dtype.name, dim=int(vectors.shape[1]))
+            self._write_index(index)
+            logging.info(f"💾 Stored {len(fresh)} new embeddings for {self.model_id}")
+            names = index["segments"]
+            if len(names) > self.max_segments or sum(map(self._segment_bytes, names)) > self.max_bytes:
+                self._compact()
+
+    def _write_segment(self, keys, vectors):
+        """Writes a segment's files (not yet listed in the index) and returns its name."""
+        name = f"seg-{uuid.uuid4().hex[:16]}"
+        matrix, scales = pack(vectors, self.dtype)
+        if scales is not None:
+            _atomic_write(self.dir / f"{name}.scales.npy", lambda f: np.save(f, scales))
+        _atomic_write(self.dir / f"{name}.npy", lambda f: np.save(f, matrix))
+        _atomic_write(self.dir / f"{name}.keys", lambda f: f.write("\n".join(keys).encode("ascii")))
+        return name
+
+    def _segment_files(self, name):
+        return [self.dir / f"{name}{suffix}" for suffix in (".npy", ".scales.npy", ".keys")]
+
+    def _segment_bytes(self, name):
+        total = 0
+        for path in self._segment_files(name):
+            try:
+                total += path.stat().st_size
+            except FileNotFoundError:
+                pass
+        return total
+
+    def _compact(self):
+        """
+        Merges every mapped segment into one and deletes the merged files.
+        Rows are kept least recently used first, and the oldest ones are
+        dropped when all of them would not fit in max_bytes.
+        """
+        self._refresh()
+        names = [n for n in self._read_index()["segments"] if n in self._segments]
+        rows = [(key, name, row) for name in names for row, key in enumerate(self._segments[name][2])
+                if self._rows.get(key) == (name, row)]
+        if not rows:
+            return
+        rows.sort(key=lambda r: r[0] in self._used)  # Stable: index order within each group.
+        dim = self._segments[rows[0][1]][0].shape[1]
+        row_bytes = dim * self.dtype.itemsize + (4 if self.dtype == np.int8 else 0) + len(rows[0][0]) + 1
+        keep = max(0, (self.max_bytes - 3 * _NPY_HEADER_BYTES) // row_bytes)
+        dropped = rows[:max(0, len(rows) - keep)]
+        rows = rows[len(dropped):]
+        merged = []
+        if rows:
+            vectors = np.stack([unpack(self._segments[name][0][row],
+                                       None if self._segments[name][1] is None else self._segments[name][1][row])
+                                for _, name, row in rows])
+            merged = [self._write_segment([key for key, _, _ in rows], vectors)]
+        index = self._read_index()
+        index["segments"] = merged + [n for n in index["segments"] if n not in names]
+        self._write_index(index)
+        for name in names:
+            for path in self._segment_files(name):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+        self._used.clear()
+        self._index_mtime = None  # The rewrite may share the previous index's mtime tick.
+        self._refresh()
+        logging.info(f"🧹 Merged {len(names)} embedding segments for {self.model_id} "
+                     f"({len(rows)} rows kept, {len(dropped)} evicted)")
+
+    def encode(self, texts, encoder):
+        """
+        Returns a float32 (len(texts), dim) matrix for texts, calling
+        encoder(list_of_texts) -> array only for texts not stored yet.
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        keys = [text_key(t) for t in texts]
+        vectors, missing = self.get(keys)
+        if missing:
+            # Encode each distinct missing text once, even if it repeats in the corpus.
+            unique = {}
+            for i in missing:
+                unique.setdefault(keys[i], texts[i])
+            encoded = np.asarray(encoder(list(unique.values())), dtype=np.float32)
+            by_key = dict(zip(unique, encoded))
+            for i in missing:
+                vectors[i] = by_key[keys[i]]
+            self.put(list(by_key), encoded)
+        return np.asarray(np.stack(vectors), dtype=np.float32)
+
+
+# --- Per-outline sidecars written at ingest time ---
+SIDECAR_SUFFIX = ".embeddings.npz"
+
+
+def sidecar_path(outline_path):
+    """<stem>.json -> <stem>.embeddings.npz in the same directory."""
+    return Path(outline_path).with_suffix(SIDECAR_SUFFIX)
+
+
+def passage_texts(sections):
+    """Encoder inputs for an outline's sections, prefixed exactly as rank_sections does."""
+    titles = ["passage: " + s.get('section_title', s.get('text', '')) for s in sections]
+    contents = ["passage: " + s.get('content', '') for s in sections]
+    return titles, contents
+
+
+def texts_digest(titles, contents):
+    """Identifies the exact texts a sidecar was computed from, so stale sidecars are ignored."""
+    digest = hashlib.sha256()
+    for text in titles + contents:
+        digest.update(text_key(text).encode("ascii"))
+    return digest.hexdigest()
+
+
+def write_sidecar(outline_path, model_id, titles, contents, digest, dtype=None):
+    dtype = np.dtype(dtype or EMBEDDING_STORE_DTYPE)
+    path = sidecar_path(outline_path)
+    arrays = {}
+    for name, matrix in (("titles", titles), ("contents", contents)):
+        arrays[name], scales = pack(matrix, dtype)
+        if scales is not None:
+            arrays[f"{name}_scales"] = scales
+    _atomic_write(path, lambda f: np.savez(f, model=np.array(model_id), digest=np.array(digest), **arrays))
+    return path
+
+
+def read_sidecar(outline_path, model_id, digest):
+    """Returns float32 (titles, contents) matrices, or None if absent, for another model or stale."""
+    path = sidecar_path(outline_path)
+    try:
+        with np.load(path) as data:
+            if str(data["model"]) != model_id or str(data["digest"]) != digest:
+                return None
+            return tuple(unpack(data[name], data[f"{name}_scales"] if f"{name}_scales" in data else None)
+                         for name in ("titles", "contents"))
+    except FileNotFoundError:
+        return None
+    except Exception as exc:
+        logging.warning(f"[WARN] Ignoring unreadable embeddings sidecar {path}: {exc}")
+        return None
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def store_for(model_id):
+    """One EmbeddingStore per model per process."""
+    with _stores_lock:
+        if model_id not in _stores:
+            _stores[model_id] = EmbeddingStore(model_id)
+        return _stores[model_id]
@@ -3,9 +3,22 @@ from pathlib import Path
 import psutil
 import os
 import nltk
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
 
+import metrics
+from batching import encode_bucketed
+from embedding_store import passage_texts, store_for
+from lexical_index import fuse, lexical_shortlist
+from model_registry import DEFAULT_MODEL, get_model, model_key
+from vector_index import normalize_rows
+
+# BM25 hits re-ranked by embedding similarity per /explain/ call, so its cost
+# doesn't grow with the corpus; 0 re-ranks every section.
+EXPLAIN_SHORTLIST = int(os.getenv("EXPLAIN_SHORTLIST", 50))
+# BM25's share of the re-ranked score (see lexical_index.fuse); /analyze/ uses LEXICAL_FUSION_WEIGHT.
+EXPLAIN_FUSION_WEIGHT = float(os.getenv("EXPLAIN_FUSION_WEIGHT", 0.2))
+
 # RAM usage logger
 process = psutil.Process(os.getpid())
 def log_mem(stage):
@@ -20,41 +33,46 @@ def safe_sent_tokenize(text: str):
         # Simple regex split as fallback
         return [s.strip() for s in re.split(r"(?<=[.!?])\s+", text) if s.strip()]
 
-def find_relevant_sections(json_data, query, top_k=3):
-    """Select most relevant sections using lightweight TF-IDF similarity (no embeddings).
+def semantic_scores(query, sections):
+    """
+    Cosine similarity of each section ((title + content) / 2, as /analyze/
+    ranks) to query with the shared embedding model, or None if it can't load.
+    """
+    try:
+        model = get_model(DEFAULT_MODEL)
+    except Exception as e:
+        print(f"[WARN] Embedding model unavailable, ranking by BM25 only: {e}")
+        return None
+    titles, contents = passage_texts(sections)
+    vectors = normalize_rows(store_for(model_key(DEFAULT_MODEL)).encode(
+        titles + contents, lambda texts: encode_bucketed(model, texts)[0]))
+    query_vec = normalize_rows(np.asarray(
+        model.encode("query: " + query, convert_to_numpy=True, show_progress_bar=False)).reshape(1, -1))[0]
+    return (vectors[:len(sections)] + vectors[len(sections):]) / 2 @ query_vec
+
+def find_relevant_sections(outlines, query, outlines_dir, top_k=3):
+    """Select the most relevant sections across outlines ({stem: outline json}): the
+    EXPLAIN_SHORTLIST best BM25 hits from the persistent lexical index, re-ranked by
+    embedding similarity.
     Returns a list of (heading, content) tuples.
     """
-    sections_text = []
-    index_map = []
-    for idx, item in enumerate(json_data.get("outline", [])):
-        heading = item.get("text", "")
-        content = item.get("content", "")
-        combined = f"{heading}. {content}".strip()
-        if combined:
-            sections_text.append(combined)
-            index_map.append(idx)
-
-    if not sections_text:
+    with metrics.EXPLAIN_STAGE_SECONDS.time(stage="lexical"):
+        hits = lexical_shortlist(outlines_dir, query, EXPLAIN_SHORTLIST,
+                                 [Path(outlines_dir) / f"{stem}.json" for stem in outlines])
+    candidates = []
+    for score, stem, row in hits:
+        sections = outlines[stem].get("outline", [])
+        if row < len(sections) and (sections[row].get("text") or sections[row].get("content")):
+            candidates.append((score, sections[row]))
+    if not candidates:
         return []
 
-    # Fit TF-IDF on sections + query to keep memory small
-    vectorizer = TfidfVectorizer(max_features=3000, stop_words='english')
-    corpus = sections_text + [query]
-    tfidf = vectorizer.fit_transform(corpus)
-    query_vec = tfidf[-1]
-    section_mat = tfidf[:-1]
-    sims = cosine_similarity(query_vec, section_mat)[0]
-
-    # Pick top_k indices by similarity
-    top_positions = sims.argsort()[::-1][:top_k]
-    final_results = []
-    for pos in top_positions:
-        item = json_data.get("outline", [])[index_map[pos]]
-        head = item.get("text", "")
-        content = item.get('content', '')
-        final_results.append((head, content))
-
-    return final_results
+    lexical = [score for score, _ in candidates]
+    with metrics.EXPLAIN_STAGE_SECONDS.time(stage="rerank"):
+        semantic = semantic_scores(query, [section for _, section in candidates])
+    scores = fuse(semantic, lexical, EXPLAIN_FUSION_WEIGHT) if semantic is not None else np.asarray(lexical)
+    return [(candidates[i][1].get("text", ""), candidates[i][1].get("content", ""))
+            for i in np.argsort(-scores, kind="stable")[:top_k]]
 
 def summarize_text(text, max_chars=200):
     """Extractive summarization: pick highest TF-IDF sentences within a character budget."""
@@ -90,29 +108,26 @@ def summarize_text(text, max_chars=200):
         return sentences[0][:max_chars] + ("..." if len(sentences[0]) > max_chars else "")
     return " ".join(summary_parts)
 
-def explain_topic(topic: str, out_path: Path = None):
+def explain_topic(topic: str, out_path: Path = None, outlines_dir: Path = None):
     """Generate explanations for a topic from Stage 1 outlines using lightweight methods."""
     try:
         log_mem("Starting explain_topic")
-        outlines_dir = Path(__file__).parent / "output" / "1a_outlines"
+        outlines_dir = Path(outlines_dir) if outlines_dir else Path(__file__).parent / "output" / "1a_outlines"
         outlines_dir.mkdir(parents=True, exist_ok=True)
 
         json_files = list(outlines_dir.glob("*.json"))
         if not json_files:
             return {"error": "No outline files found. Please run the extraction first."}
 
-        # Aggregate relevant sections across all outline files
-        selected = []  # type: list
+        outlines = {}
         for fp in json_files:
             with open(fp, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            selected.extend(find_relevant_sections(data, topic))
+                outlines[fp.stem] = json.load(f)
+        selected = find_relevant_sections(outlines, topic, outlines_dir)
 
         # Fallback: if nothing matched, take first few sections with content
         if not selected:
-            for fp in json_files:
-                with open(fp, "r", encoding="utf-8") as f:
-                    data = json.load(f)
+            for data in outlines.values():
                 for item in data.get("outline", [])[:3]:
                     head = item.get("text", "")
                     content = item.get("content", "")
@@ -124,7 +139,8 @@ def explain_topic(topic: str, out_path: Path = None):
         # Produce explanations
         explanations = []
         for head, content in selected[:3]:  # keep it small for memory
-            summary = summarize_text(content)
+            with metrics.EXPLAIN_STAGE_SECONDS.time(stage="summarize"):
+                summary = summarize_text(content)
             explanations.append({
                 "heading": head or "Section",
                 "explanation": summary
@@ -136,13 +152,15 @@ def explain_topic(topic: str, out_path: Path = None):
             "memory_usage_mb": process.memory_info().rss / 1024 / 1024
         }
 
-        # Save if requested
-        out_path = Path(out_path) if out_path else (Path(__file__).parent / "output" / "explain.json")
-        out_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(out_path, "w", encoding="utf-8") as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)
+        # Save if requested (the API takes the result directly)
+        if out_path:
+            out_path = Path(out_path)
+            out_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(out_path, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
 
         log_mem("Finished explain_topic")
+        metrics.STAGE_RSS_MB.observe(process.memory_info().rss / 1024 / 1024, component="explain")
         return result
     except Exception as e:
         log_mem(f"Error in explain_topic: {e}")
@@ -153,7 +171,8 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate explanations for a topic from Stage 1 outlines.")
     parser.add_argument("--topic", required=True, help="Topic or query to explain")
     parser.add_argument("--out", default=str(Path(__file__).parent / "output" / "explain.json"), help="Output JSON file path")
+    parser.add_argument("--outlines", default=None, help="Directory of Stage 1 outline JSONs")
     args = parser.parse_args()
 
-    output = explain_topic(args.topic, Path(args.out))
+    output = explain_topic(args.topic, Path(args.out), args.outlines)
     print(json.dumps(output, ensure_ascii=False, indent=2))
\ No newline at end of file
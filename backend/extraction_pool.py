@@ -0,0 +1,278 @@
+# extraction_pool.py - Long-lived pool of warm Stage 1 extraction workers
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+import traceback
+import uuid
+from pathlib import Path
+
+import metrics
+
+# Defaults can be overridden through the environment (e.g. in the Dockerfile).
+DEFAULT_WORKERS = int(os.getenv("EXTRACTION_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+DEFAULT_TASK_TIMEOUT = float(os.getenv("EXTRACTION_TASK_TIMEOUT", 300))
+DEFAULT_MAX_TASKS_PER_CHILD = int(os.getenv("EXTRACTION_MAX_TASKS_PER_CHILD", 25))
+# Workers run at a lower CPU priority so the API process stays responsive under load.
+DEFAULT_NICE = int(os.getenv("EXTRACTION_NICE", 10))
+# Bounded-memory extraction (see heading_extractor.iter_outline) for memory-limited containers.
+DEFAULT_LOW_MEMORY = os.getenv("EXTRACTION_LOW_MEMORY", "0") == "1"
+# Per-worker RSS ceiling in MB; 0 disables it.
+DEFAULT_MAX_RSS_MB = float(os.getenv("EXTRACTION_MAX_RSS_MB", 0))
+
+
+class ExtractionTimeout(BaseException):
+    # BaseException so the extractor's broad `except Exception` blocks can't swallow it.
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise ExtractionTimeout()
+
+
+# task id -> (worker pid, wall-clock start), shared with the parent through a manager.
+_claims = None
+
+
+def _init_worker(niceness=0, claims=None):
+    """Imports the extractor (fitz, pdfplumber) once when the worker process starts."""
+    global _claims
+    _claims = claims
+    if niceness and hasattr(os, "nice"):
+        os.nice(niceness)
+    import heading_extractor  # noqa: F401
+    # The parent handles Ctrl+C; workers should not die mid-task on SIGINT.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _extract_to_json(pdf_path, out_path, timeout, max_pages=None, dpi=300, events=None, task_id=None):
+    """
+    Runs extract_outline on one PDF inside a worker and writes the JSON output,
+    exactly as `heading_extractor.py <pdf> -o <out>` does. Never raises: any
+    failure is returned as a structured dict for the caller's failures list.
+    The worker's metrics are drained into the result under "metrics".
+    If an events queue is given, each iter_outline event is put on it as it happens.
+    The task is claimed under task_id while it runs, so the parent can tell
+    when it was dequeued and which worker to kill if it gets stuck.
+    """
+    if _claims is not None and task_id is not None:
+        _claims[task_id] = (os.getpid(), time.time())
+    try:
+        result = _run_extraction(pdf_path, out_path, timeout, max_pages, dpi, events)
+    finally:
+        if _claims is not None and task_id is not None:
+            _claims.pop(task_id, None)
+    metrics.STAGE1_DOCUMENTS.inc(status=result["status"])
+    result["metrics"] = metrics.REGISTRY.drain()
+    return result
+
+
+def _run_extraction(pdf_path, out_path, timeout, max_pages, dpi, events=None):
+    from heading_extractor import count_pages, extract_outline
+
+    fname = Path(pdf_path).name
+    start = time.perf_counter()
+    # The alarm bounds the time spent on this task and frees the worker on expiry.
+    use_alarm = timeout and hasattr(signal, "setitimer")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        timings = {}
+        layout_stats = {}
+        extracted_data = extract_outline(pdf_path, max_pages, dpi, low_memory=DEFAULT_LOW_MEMORY,
+                                         max_rss_mb=DEFAULT_MAX_RSS_MB or None, timings=timings,
+                                         layout_stats=layout_stats,
+                                         on_event=events.put if events is not None else None)
+        if "error" in extracted_data:
+            return {"file": fname, "status": "error", "error": extracted_data["error"],
+                    "elapsed": time.perf_counter() - start}
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump(extracted_data, f, ensure_ascii=False, indent=4)
+        elapsed = time.perf_counter() - start
+        metrics.record_stage1(timings, elapsed, count_pages(pdf_path),
+                              mode="pool" if events is None else "stream", layout_stats=layout_stats)
+        return {"file": fname, "status": "ok", "elapsed": elapsed}
+    except ExtractionTimeout:
+        return {
+            "file": fname,
+            "status": "timeout",
+            "error": f"Stage 1 timed out after {timeout}s",
+            "elapsed": time.perf_counter() - start,
+        }
+    except Exception as exc:
+        return {
+            "file": fname,
+            "status": "error",
+            "exception": str(exc),
+            "traceback": traceback.format_exc(),
+            "elapsed": time.perf_counter() - start,
+        }
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+class ExtractionPool:
+    """
+    A persistent pool of pre-imported extraction workers. Created once at app
+    startup so each uploaded PDF costs only the extraction itself, not an
+    interpreter start plus the fitz/pdfplumber imports.
+
+    The pool is shared by every request. Workers enforce the per-task timeout
+    themselves; a task that outlives it by the backstop (stuck in native code,
+    or its worker died) only costs its own worker, which is killed and
+    replaced by the pool, so other requests' tasks keep running.
+    """
+
+    def __init__(self, processes=None, task_timeout=None, max_tasks_per_child=None):
+        self.processes = processes or DEFAULT_WORKERS
+        self.task_timeout = task_timeout if task_timeout is not None else DEFAULT_TASK_TIMEOUT
+        self.max_tasks_per_child = max_tasks_per_child or DEFAULT_MAX_TASKS_PER_CHILD
+        # Counted from when a worker dequeues the task, not from submission.
+        self.backstop = self.task_timeout + 30
+        self._pool = None
+        # Holds the task claims, and the event queues of streamed tasks.
+        self._manager = None
+        self._claims = None
+        self._manager_lock = threading.Lock()
+
+    def start(self):
+        with self._manager_lock:
+            if self._pool is None:
+                # 'spawn' keeps workers independent of the server's threads and event loop.
+                ctx = multiprocessing.get_context("spawn")
+                if self._manager is None:
+                    self._manager = ctx.Manager()
+                    self._claims = self._manager.dict()
+                self._pool = ctx.Pool(
+                    processes=self.processes,
+                    initializer=_init_worker,
+                    initargs=(DEFAULT_NICE, self._claims),
+                    # Recycle workers periodically to bound PyMuPDF memory growth.
+                    maxtasksperchild=self.max_tasks_per_child,
+                )
+                logging.info(f"🔥 Extraction pool started with {self.processes} workers")
+        return self
+
+    def close(self):
+        self._stop_pool()
+        with self._manager_lock:
+            if self._manager is not None:
+                self._manager.shutdown()
+                self._manager = None
+                self._claims = None
+
+    def _stop_pool(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def _submit(self, pdf_path, out_path, max_pages, dpi, events=None):
+        """Queues one task; returns (task id, AsyncResult)."""
+        self.start()
+        task_id = uuid.uuid4().hex
+        async_result = self._pool.apply_async(
+            _extract_to_json, (str(pdf_path), str(out_path), self.task_timeout, max_pages, dpi, events, task_id))
+        return task_id, async_result
+
+    def _kill_if_stuck(self, task_id):
+        """
+        Kills the worker running task_id once the task has run for longer than
+        the backstop, and returns True. The pool replaces the worker; the
+        task's AsyncResult never resolves, so the caller reports a timeout.
+        """
+        claim = self._claims.get(task_id)
+        if claim is None or time.time() - claim[1] < self.backstop:
+            return False
+        pid = claim[0]
+        logging.warning(f"[WARN] Killing extraction worker {pid}: task still running after {self.backstop:.0f}s")
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass  # The worker already died (e.g. OOM-killed) without finishing the task.
+        self._claims.pop(task_id, None)
+        return True
+
+    def _timed_out(self, pdf_path):
+        metrics.STAGE1_DOCUMENTS.inc(status="timeout")
+        return {
+            "file": Path(pdf_path).name,
+            "status": "timeout",
+            "error": f"Stage 1 did not finish within {self.backstop:.0f}s",
+        }
+
+    def _collect(self, async_result, pdf_path):
+        try:
+            result = async_result.get()
+            metrics.REGISTRY.merge(result.pop("metrics", None))
+            return result
+        except Exception as exc:
+            metrics.STAGE1_DOCUMENTS.inc(status="error")
+            return {
+                "file": Path(pdf_path).name,
+                "status": "error",
+                "exception": str(exc),
+                "traceback": traceback.format_exc(),
+            }
+
+    def _events_queue(self):
+        self.start()
+        return self._manager.Queue()
+
+    def run_batch(self, jobs, max_pages=None, dpi=300, on_result=None):
+        """
+        Extracts a batch of (pdf_path, out_path) jobs concurrently and blocks
+        until all are done. Returns one result dict per job, in job order.
+        on_result, if given, is called with each result as soon as it is collected.
+        """
+        pending = [(pdf_path, *self._submit(pdf_path, out_path, max_pages, dpi)) for pdf_path, out_path in jobs]
+        results = [None] * len(pending)
+        reported = 0
+        while reported < len(pending):
+            # Every unfinished task is checked each round, so a stuck one is
+            # killed on time even while an earlier job is still running.
+            for i, (pdf_path, task_id, async_result) in enumerate(pending):
+                if results[i] is not None:
+                    continue
+                if async_result.ready():
+                    results[i] = self._collect(async_result, pdf_path)
+                elif self._kill_if_stuck(task_id):
+                    results[i] = self._timed_out(pdf_path)
+            while reported < len(pending) and results[reported] is not None:
+                if on_result is not None:
+                    on_result(results[reported])
+                reported += 1
+            if reported < len(pending):
+                pending[reported][2].wait(1)
+        return results
+
+    def stream(self, pdf_path, out_path, max_pages=None, dpi=300):
+        """
+        Extracts one PDF on a pool worker, with the same timeout and worker
+        limits as run_batch, and yields its iter_outline events as the worker
+        produces them. The last item is {"event": "result", "result": ...}
+        with the task's result dict, shaped like run_batch's.
+        """
+        events = self._events_queue()
+        task_id, async_result = self._submit(pdf_path, out_path, max_pages, dpi, events)
+        while not async_result.ready():
+            try:
+                yield events.get(timeout=0.1)
+            except queue.Empty:
+                # Only this task's worker is killed; other clients' tasks keep running.
+                if self._kill_if_stuck(task_id):
+                    yield {"event": "result", "result": self._timed_out(pdf_path)}
+                    return
+        # The worker puts every event before returning, so what is left is already queued.
+        while True:
+            try:
+                yield events.get_nowait()
+            except queue.Empty:
+                break
+        yield {"event": "result", "result": self._collect(async_result, pdf_path)}
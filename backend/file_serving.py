@@ -0,0 +1,163 @@
+# file_serving.py - Range-aware file responses with content-hash ETags
+import hashlib
+import os
+import threading
+from urllib.parse import quote
+
+import anyio
+from starlette.responses import Response
+
+CHUNK_SIZE = 64 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class ContentHashIndex:
+    """
+    Remembers the SHA-256 of served files, keyed by path and invalidated by
+    (mtime, size), so each file is hashed at most once per version. Uploads
+    prime it with the hash computed while saving.
+    """
+
+    def __init__(self):
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _version(stat):
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def remember(self, path, sha256):
+        stat = os.stat(path)
+        with self._lock:
+            self._hashes[str(path)] = (self._version(stat), sha256)
+
+    def get(self, path, stat=None):
+        stat = stat or os.stat(path)
+        with self._lock:
+            cached = self._hashes.get(str(path))
+        if cached and cached[0] == self._version(stat):
+            return cached[1]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+        with self._lock:
+            self._hashes[str(path)] = (self._version(stat), sha256)
+        return sha256
+
+
+def etag_matches(header, etag):
+    """True if an If-None-Match / If-Range value names this (strong) ETag."""
+    if header is None:
+        return False
+    header = header.strip()
+    if header == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def parse_range(header, size):
+    """
+    Parses a `bytes=` Range header into an inclusive (start, end) pair.
+    Returns None when the header should be ignored (absent, malformed, or
+    several ranges, which we answer with the whole file) and raises
+    ValueError when the range cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+    spec = header[len("bytes="):].strip()
+    if "," in spec or "-" not in spec:
+        return None
+    first, last = (part.strip() for part in spec.split("-", 1))
+    if not (first or last) or (first and not first.isdigit()) or (last and not last.isdigit()):
+        return None
+    if not first:
+        # Suffix range: the last N bytes (none to give from an empty file).
+        if int(last) == 0 or size == 0:
+            raise ValueError("Range not satisfiable")
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError("Range not satisfiable")
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+class FileRangeResponse(Response):
+    """
+    Sends bytes [start, end] of a file. Uses the ASGI zero-copy send
+    extension (os.sendfile in the server) when the server offers it, and
+    otherwise streams fixed-size chunks, so memory stays flat for any size.
+    """
+
+    def __init__(self, path, start, end, status_code=200, headers=None, media_type=None, send_body=True):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.start = start
+        self.length = end - start + 1
+        self.send_body = send_body
+        self.headers["content-length"] = str(self.length)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body or not self.length:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        extensions = scope.get("extensions") or {}
+        if "http.response.zerocopysend" in extensions:
+            with open(self.path, "rb") as f:
+                await send({"type": "http.response.zerocopysend", "file": f,
+                            "offset": self.start, "count": self.length, "more_body": False})
+            return
+        async with await anyio.open_file(self.path, mode="rb") as f:
+            await f.seek(self.start)
+            remaining = self.length
+            while remaining:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": bool(remaining)})
+            if remaining:
+                # The file shrank underneath us; close the body rather than hang the client.
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def serve_file(request, path, hashes, media_type="application/octet-stream", filename=None):
+    """
+    Builds the response for GET/HEAD of a file: 304 for a matching
+    If-None-Match, 206 for a satisfiable Range (honouring If-Range), 416 for
+    an unsatisfiable one, and 200 with the whole file otherwise.
+    """
+    stat = os.stat(path)
+    etag = f'"{hashes.get(path, stat)}"'
+    headers = {
+        "etag": etag,
+        "accept-ranges": "bytes",
+        # Names can be re-uploaded with new content, so always revalidate (cheap with the ETag).
+        "cache-control": "no-cache",
+    }
+    if filename:
+        headers["content-disposition"] = f"inline; filename*=UTF-8''{quote(filename)}"
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    size = stat.st_size
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or etag_matches(if_range, etag):
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "content-range": f"bytes */{size}"})
+
+    send_body = request.method != "HEAD"
+    if byte_range is None:
+        return FileRangeResponse(path, 0, size - 1, 200, headers, media_type, send_body)
+    start, end = byte_range
+    headers["content-range"] = f"bytes {start}-{end}/{size}"
+    return FileRangeResponse(path, start, end, 206, headers, media_type, send_body)
+
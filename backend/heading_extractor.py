@@ -1,11 +1,23 @@
 import fitz  # PyMuPDF
+import hashlib
+import json
+import multiprocessing
+import os
 import re
+import time
+import unicodedata
+from bisect import bisect_left
+from contextlib import contextmanager
 from difflib import SequenceMatcher
 from pathlib import Path
 import pdfplumber
 
 BASE_DIR = Path(__file__).parent
 
+# Bump whenever a change alters extract_outline's output, so cached outlines
+# produced by older extractor code are not served again.
+EXTRACTOR_VERSION = "4"
+
 def similar(a, b):
     return SequenceMatcher(None, a, b).ratio() > 0.85
 
@@ -34,15 +46,280 @@ def is_within_bboxes(line_bbox, table_bboxes, allow_above_margin=15):
     return None
 
 
+class TableBBoxIndex:
+    """
+    Interval index over a page's table bboxes for is_within_bboxes queries.
+    Each table is registered in the fixed-height y bands its header and inside
+    zones can reach, so a line only checks the tables near its baseline.
+    """
+
+    BAND_HEIGHT = 32
+
+    def __init__(self, table_bboxes, allow_above_margin=15):
+        self.table_bboxes = list(table_bboxes)
+        self.allow_above_margin = allow_above_margin
+        self._bands = {}
+        for order, bbox in enumerate(self.table_bboxes):
+            # A line can only match via its bottom edge (y1) falling in
+            # [top - margin, top + 5] (header) or [top, bottom] (inside).
+            low = bbox[1] - allow_above_margin
+            high = max(bbox[3], bbox[1] + 5)
+            for band in range(int(low // self.BAND_HEIGHT), int(high // self.BAND_HEIGHT) + 1):
+                self._bands.setdefault(band, []).append(order)
+
+    def classify(self, line_bbox):
+        """Same result as is_within_bboxes(line_bbox, table_bboxes)."""
+        if not self.table_bboxes:
+            return None
+        orders = self._bands.get(int(line_bbox[3] // self.BAND_HEIGHT))
+        if not orders:
+            return None
+        # Bands keep insertion order, so the first matching table still wins.
+        candidates = [self.table_bboxes[o] for o in orders]
+        return is_within_bboxes(line_bbox, candidates, self.allow_above_margin)
+
+
+class WordIndex:
+    """
+    A page's words (as returned by get_text("words")) sorted in reading order
+    by their top edge, so each content slice is a bisect range lookup instead
+    of a full scan of the page.
+    """
+
+    def __init__(self, words):
+        # Stable sort: identical to sorting each filtered slice by (y0, x0).
+        self.words = sorted(words, key=lambda w: (w[1], w[0]))
+        self._tops = [w[1] for w in self.words]
+        self._max_height = max((w[3] - w[1] for w in self.words), default=0)
+
+    def words_between(self, start_y, end_y):
+        """Words with bottom > start_y and top < end_y, in reading order."""
+        hi = bisect_left(self._tops, end_y)
+        # Only words starting within one word-height above start_y can still
+        # reach below it; everything further up is excluded by the bisect.
+        lo = bisect_left(self._tops, start_y - self._max_height)
+        return [w for w in self.words[lo:hi] if w[3] > start_y]
 
-def get_true_table_bboxes(plumber_page, fitz_page):
+    def text_between(self, start_y, end_y):
+        return " ".join(w[4] for w in self.words_between(start_y, end_y))
+
+
+def page_may_contain_tables(fitz_page):
+    """
+    Cheap pre-check for pdfplumber's line-based table finder. A table needs at
+    least two horizontal and two vertical ruling edges, so a page whose vector
+    drawings cannot supply them is skipped without calling find_tables().
+    """
+    try:
+        drawings = fitz_page.get_drawings()
+    except Exception:
+        return True  # Can't tell, let pdfplumber decide.
+
+    horizontal = vertical = 0
+    for path in drawings:
+        for item in path.get("items", []):
+            kind = item[0]
+            if kind == "l":
+                p1, p2 = item[1], item[2]
+                if abs(p1.y - p2.y) < 1:
+                    horizontal += 1
+                elif abs(p1.x - p2.x) < 1:
+                    vertical += 1
+            elif kind in ("re", "qu"):
+                horizontal += 2
+                vertical += 2
+            elif kind == "c":
+                # pdfplumber also turns curves into edges; don't second-guess them.
+                return True
+            if horizontal >= 2 and vertical >= 2:
+                return True
+    return False
+
+
+class SpanStyle:
+    """The only span fields the map & extract phase needs, without the rest of the span dict."""
+    __slots__ = ("size", "font", "flags")
+
+    def __init__(self, size=10, font="", flags=0):
+        self.size = size
+        self.font = font
+        self.flags = flags
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+
+class HeadingCandidate:
+    """
+    Compact heading candidate used in low-memory mode. Supports the same
+    candidate['key'] / candidate.get('key') access as the dict candidates.
+    """
+    __slots__ = ("text", "page_num", "bbox", "span", "level", "content", "ocr")
+
+    def __init__(self, text, page_num, bbox, span, level=None, content=None, ocr=None):
+        self.text = text
+        self.page_num = page_num
+        self.bbox = tuple(bbox)
+        self.span = span
+        self.level = level
+        self.content = content
+        self.ocr = ocr
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None)
+        return default if value is None else value
+
+    @classmethod
+    def from_dict(cls, candidate):
+        span = candidate['span']
+        return cls(
+            candidate['text'], candidate['page_num'], candidate['bbox'],
+            SpanStyle(span.get('size', 10), span.get('font', ''), span.get('flags', 0)),
+            candidate.get('level'), candidate.get('content'), candidate.get('ocr'),
+        )
+
+
+def compact_candidates(candidates):
+    return [HeadingCandidate.from_dict(c) for c in candidates]
+
+
+class PageLayoutCache:
+    """
+    Per-document cache of page layout data. Each page's text dict, words,
+    base font size and true table bboxes are computed lazily on first use and
+    then shared by every stage of extract_outline.
+    The pdfplumber document is only opened once a page actually needs table
+    analysis, so documents without ruled tables never pay for it.
+
+    Callers release() each page once it has been mapped, so only the pages
+    in flight stay cached; document-level memos (form XObject text) are kept.
+    pdfplumber page caches are flushed once a page's tables are found; in
+    low-memory mode the pdfplumber document is also reopened every
+    PLUMBER_RECYCLE_PAGES analyzed pages, since pdfminer keeps every object
+    it has parsed.
+    """
+
+    PLUMBER_RECYCLE_PAGES = 20
+    _PAGE_KINDS = ("dict", "words", "base_font_size", "table_bboxes", "table_index", "word_index")
+
+    def __init__(self, doc, plumber_doc=None, pdf_path=None, low_memory=False, repeating_form_text=None):
+        self.doc = doc
+        self.plumber_doc = plumber_doc
+        self.pdf_path = pdf_path
+        self.low_memory = low_memory
+        # Switched off by the RSS ceiling fallback in iter_outline.
+        self.table_detection = True
+        self._owns_plumber_doc = False
+        self._plumber_pages_used = 0
+        self._store = {}
+        self.hits = 0
+        self.misses = 0
+        self.tables_skipped = 0
+        self.tables_analyzed = 0
+        # Document-level xref -> form text memo, shared by every page.
+        self.form_text_memo = {}
+        # Given when the parent process has already run the pre-pass (parallel shards).
+        self._repeating_form_text = repeating_form_text
+
+    def _get(self, kind, page_index, compute):
+        key = (kind, page_index)
+        if key in self._store:
+            self.hits += 1
+            return self._store[key]
+        self.misses += 1
+        value = compute()
+        self._store[key] = value
+        return value
+
+    def text_dict(self, page_index):
+        return self._get("dict", page_index, lambda: self.doc[page_index].get_text("dict"))
+
+    def words(self, page_index):
+        return self._get("words", page_index, lambda: self.doc[page_index].get_text("words"))
+
+    def base_font_size(self, page_index):
+        return self._get("base_font_size", page_index, lambda: get_base_font_size(
+            self.doc[page_index], blocks_dict=self.text_dict(page_index)))
+
+    def plumber_page(self, page_index):
+        if self.plumber_doc is None:
+            self.plumber_doc = pdfplumber.open(self.pdf_path)
+            self._owns_plumber_doc = True
+        return self.plumber_doc.pages[page_index]
+
+    def _compute_table_bboxes(self, page_index):
+        fitz_page = self.doc[page_index]
+        if not self.table_detection or not page_may_contain_tables(fitz_page):
+            self.tables_skipped += 1
+            return []
+        self.tables_analyzed += 1
+        try:
+            plumber_page = self.plumber_page(page_index)
+        except Exception:
+            # Same policy as a failing find_tables(): treat the page as table-free.
+            return []
+        bboxes = get_true_table_bboxes(plumber_page, fitz_page, base_font_size=self.base_font_size(page_index))
+        plumber_page.close()  # Flushes the page's parsed chars/objects; its bboxes are all we keep.
+        if self.low_memory:
+            self._plumber_pages_used += 1
+            if self._plumber_pages_used >= self.PLUMBER_RECYCLE_PAGES:
+                self.close()
+        return bboxes
+
+    def table_bboxes(self, page_index):
+        return self._get("table_bboxes", page_index, lambda: self._compute_table_bboxes(page_index))
+
+    def table_index(self, page_index):
+        return self._get("table_index", page_index, lambda: TableBBoxIndex(self.table_bboxes(page_index)))
+
+    def word_index(self, page_index):
+        return self._get("word_index", page_index, lambda: WordIndex(self.words(page_index)))
+
+    def repeating_form_text(self):
+        if self._repeating_form_text is None:
+            self._repeating_form_text = find_repeating_form_text(self.doc, self.form_text_memo)
+        return self._repeating_form_text
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "tables_skipped": self.tables_skipped,
+            "tables_analyzed": self.tables_analyzed,
+        }
+
+    def release(self, page_index):
+        """Drops everything cached for a page that has been fully mapped."""
+        for kind in self._PAGE_KINDS:
+            self._store.pop((kind, page_index), None)
+        if self.low_memory:
+            fitz.TOOLS.store_shrink(100)  # Empty MuPDF's own object store too.
+
+    def release_all(self):
+        self._store.clear()
+        self.close()
+        fitz.TOOLS.store_shrink(100)
+
+    def close(self):
+        if self._owns_plumber_doc:
+            self.plumber_doc.close()
+            self.plumber_doc = None
+            self._owns_plumber_doc = False
+            self._plumber_pages_used = 0
+
+
+def get_true_table_bboxes(plumber_page, fitz_page, base_font_size=None):
     """
     Identifies "true" tables by robustly filtering out single-cell boxes that
     are visually identifiable as styled headings.
     """
     true_table_bboxes = []
     # We need the page's base font size to know if text is "larger than normal".
-    base_font_size = get_base_font_size(fitz_page) 
+    if base_font_size is None:
+        base_font_size = get_base_font_size(fitz_page)
 
     try:
         # Find all potential tables on the page.
@@ -138,16 +415,17 @@ def determine_heading_level(text, span, base_font_size=10):
 
 
 
-def extract_title_from_first_page(doc, plumber_doc):
+def extract_title_from_first_page(doc, plumber_doc, layout=None):
     """
     Extracts the title from the visual layout of the first page.
     This version is now robust against pages with no text blocks.
     """
+    if layout is None:
+        layout = PageLayoutCache(doc, plumber_doc)
     page = doc[0]
-    plumber_page = plumber_doc.pages[0] 
 
     # --- Stage 1: Try to find prominent text (large font size) ---
-    blocks_dict = page.get_text("dict")
+    blocks_dict = layout.text_dict(0)
     
     if blocks_dict and 'blocks' in blocks_dict:
         line_candidates = []
@@ -170,16 +448,13 @@ def extract_title_from_first_page(doc, plumber_doc):
     # --- Stage 2: Fallback for forms (find first non-table text) ---
     print("Info: No prominent title candidate found on page 1. Using fallback for forms.")
     
-    # --- THIS IS THE FIX ---
-    # The 'page' object (which is a fitz_page) is now correctly passed.
-    table_bboxes = get_true_table_bboxes(plumber_page, page)
-    # -----------------------
+    table_index = layout.table_index(0)
 
     if blocks_dict and 'blocks' in blocks_dict:
         for l in (line for b in blocks_dict["blocks"] for line in b.get("lines", [])):
             if not l.get("spans") or l['bbox'][1] > page.rect.height * 0.5:
                 continue
-            if is_within_bboxes(l['bbox'], table_bboxes) is None:
+            if table_index.classify(l['bbox']) is None:
                 title = clean_text("".join(s['text'] for s in l['spans']))
                 if title:
                     return title
@@ -193,26 +468,34 @@ def is_bbox_inside(bbox1, bbox2, tolerance=1):
             bbox1[2] <= bbox2[2] + tolerance and
             bbox1[3] <= bbox2[3] + tolerance)
 
-def process_page_for_candidates(fitz_page, plumber_page, page_num, seen_headings):
+def process_page_for_candidates(fitz_page, plumber_page, page_num, seen_headings, layout=None):
     """
     Processes a single page to find all potential heading candidates.
     It returns a list of dictionaries, each containing the raw text, location (bbox),
     and style (span) information needed for post-processing.
+    When a PageLayoutCache is given, the page's layout data is read from it.
     """
     heading_candidates = []
-    
+
     # --- 1. SETUP ---
-    base_font_size = get_base_font_size(fitz_page)
-    table_bboxes = get_true_table_bboxes(plumber_page, fitz_page)
-    
+    if layout is not None:
+        base_font_size = layout.base_font_size(page_num - 1)
+        table_index = layout.table_index(page_num - 1)
+    else:
+        base_font_size = get_base_font_size(fitz_page)
+        table_index = TableBBoxIndex(get_true_table_bboxes(plumber_page, fitz_page, base_font_size))
+
     # Proactively identify and ignore repeating header/footer content
-    form_content = get_form_xobject_text(fitz_page)
+    if layout is not None:
+        form_content = layout.repeating_form_text()
+    else:
+        form_content = get_form_xobject_text(fitz_page)
     for text in form_content:
         seen_headings.add(text)
 
     # --- 2. LINE-BY-LINE ANALYSIS ---
     # Safely get all text lines from the page
-    blocks_dict = fitz_page.get_text("dict")
+    blocks_dict = layout.text_dict(page_num - 1) if layout is not None else fitz_page.get_text("dict")
     if not blocks_dict or 'blocks' not in blocks_dict:
         return [] # Return empty if no text on page
     all_lines = [line for block in blocks_dict['blocks'] for line in block.get("lines", []) if line.get("spans")]
@@ -221,7 +504,7 @@ def process_page_for_candidates(fitz_page, plumber_page, page_num, seen_headings
     
     # Pass 1: Find headings that are structurally positioned just above a table.
     for line in all_lines:
-        status = is_within_bboxes(line['bbox'], table_bboxes)
+        status = table_index.classify(line['bbox'])
         if status == 'is_header':
             line_text = "".join(span["text"] for span in line["spans"]).strip()
             cleaned = clean_text(line_text)
@@ -245,7 +528,7 @@ def process_page_for_candidates(fitz_page, plumber_page, page_num, seen_headings
             continue
             
         # Skip if the line is inside a table's content area
-        if is_within_bboxes(line['bbox'], table_bboxes) in ['is_header', 'is_inside']:
+        if table_index.classify(line['bbox']) in ['is_header', 'is_inside']:
             continue
         
         first_span = line['spans'][0]
@@ -262,13 +545,14 @@ def process_page_for_candidates(fitz_page, plumber_page, page_num, seen_headings
             
     return heading_candidates
 
-def extract_text_between_y_coords(page, start_y, end_y):
+def extract_text_between_y_coords(page, start_y, end_y, words=None):
     """
     Extracts all text on a page that falls vertically between two y-coordinates.
     This is the core of the content extraction logic.
     """
     # Get all words on the page with their coordinates
-    words = page.get_text("words")
+    if words is None:
+        words = page.get_text("words")
     
     # Filter for words that are vertically between the start and end boundaries
     content_words = [w for w in words if w[3] > start_y and w[1] < end_y]
@@ -306,118 +590,520 @@ def extract_outline_from_toc(doc):
         level = f"H{entry[0]}" # Level is the first item
         text = clean_text(entry[1])  # Title is the second item
         page_num = entry[2]        # Page number is the third item
-        
-        if text:
-            headings.append({"level": level, "text": text, "page": page_num})
+        # The bookmark's own destination point, used when the title can't be found on the page
+        dest = entry[3] if len(entry) > 3 else {}
+        dest_point = dest.get('to') if dest.get('kind') == fitz.LINK_GOTO else None
+
+        if text and 1 <= page_num <= len(doc):
+            headings.append({"level": level, "text": text, "page": page_num, "dest": dest_point})
             
     return headings if headings else None
 
-def extract_outline(pdf_path, max_pages=None, dpi=300):
+def normalize_heading_text(text):
+    """Case, width and punctuation-insensitive form of a heading for matching."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return " ".join(re.findall(r"\w+", text))
+
+class PageLineIndex:
     """
-    Main extraction engine. Implements the full hybrid strategy and returns a
-    detailed outline including the content for each section, formatted as requested.
+    The text lines of one page, normalized once, so that all ToC titles that
+    point at the page can be located in a single pass instead of a full-page
+    search_for() per title. Titles are matched by normalized containment (also
+    across up to MAX_WINDOW consecutive lines, for wrapped headings), then
+    fuzzily, then by the bookmark's destination point.
     """
-    try:
-        doc = fitz.open(pdf_path)
-        plumber_doc = pdfplumber.open(pdf_path)
-    except Exception as e:
-        return {"error": f"Failed to open PDF: {e}"}
-
-    # --- 1. TITLE EXTRACTION (Hybrid Approach) ---
-    title = extract_title_from_metadata(doc)
-    if not title:
-        title = clean_text(extract_title_from_first_page(doc, plumber_doc))
 
-    # --- 2. OUTLINE EXTRACTION (Structure-First) ---
-    headings_from_toc = extract_outline_from_toc(doc)
-    
-    all_heading_candidates = []
-    if headings_from_toc:
-        print("Info: Found a Table of Contents. Using it as the primary source.")
-        # We still need the bbox to extract content, so we find it.
-        for heading in headings_from_toc:
-            page = doc[heading['page'] - 1]
-            search_results = page.search_for(heading['text'])
-            if search_results:
-                # Add the necessary info for the next steps
-                heading['bbox'] = search_results[0]
-                # A trick to get the span for style info
-                heading['span'] = page.get_text("dict", clip=search_results[0])['blocks'][0]['lines'][0]['spans'][0]
-                heading['page_num'] = heading['page']
-                all_heading_candidates.append(heading)
-    else:
-        # --- VISUAL FALLBACK (If no ToC) ---
-        print("Info: No ToC found. Falling back to page-by-page visual analysis.")
-        seen_headings = set()
-        if title: seen_headings.add(title.lower())
-        
-        page_count = min(len(doc), max_pages if max_pages else len(doc))
-        for i in range(page_count):
-            fitz_page, plumber_page = doc[i], plumber_doc.pages[i]
+    MAX_WINDOW = 3
+    FUZZY_CUTOFF = 0.85
+
+    def __init__(self, text_dict):
+        self.lines = []  # (normalized text, rect, first span)
+        for block in text_dict.get('blocks', []):
+            for line in block.get('lines', []):
+                spans = [s for s in line['spans'] if s['text'].strip()]
+                if not spans:
+                    continue
+                norm = normalize_heading_text("".join(s['text'] for s in spans))
+                if norm:
+                    self.lines.append((norm, fitz.Rect(line['bbox']), spans[0]))
+        self.used = set()
+
+    def _windows(self):
+        """Yields (first, last, text) for every run of up to MAX_WINDOW lines, shortest runs first."""
+        for width in range(self.MAX_WINDOW):
+            for i in range(len(self.lines) - width):
+                text = " ".join(line[0] for line in self.lines[i:i + width + 1])
+                yield i, i + width, text
+
+    def _hit(self, first, last):
+        self.used.update(range(first, last + 1))
+        rect = fitz.Rect(self.lines[first][1])
+        for line in self.lines[first + 1:last + 1]:
+            rect |= line[1]
+        return rect, self.lines[first][2]
+
+    def locate(self, title, dest_point=None):
+        """Returns (bbox, span) for a ToC title on this page, or None if it can't be placed."""
+        norm = normalize_heading_text(title)
+        if norm:
+            # Prefer lines not already claimed by another title (repeated headings).
+            fallback = None
+            for first, last, text in self._windows():
+                if norm in text:
+                    if not self.used.intersection(range(first, last + 1)):
+                        return self._hit(first, last)
+                    if fallback is None:
+                        fallback = (first, last)
+            if fallback:
+                return self._hit(*fallback)
+
+            best, best_ratio = None, self.FUZZY_CUTOFF
+            matcher = SequenceMatcher(None, b=norm)
+            for first, last, text in self._windows():
+                matcher.set_seq1(text)
+                if matcher.real_quick_ratio() > best_ratio and matcher.quick_ratio() > best_ratio:
+                    ratio = matcher.ratio()
+                    if ratio > best_ratio:
+                        best, best_ratio = (first, last), ratio
+            if best:
+                return self._hit(*best)
+
+        if dest_point is not None:
+            # Snap to the first free line at the bookmark's target point, if one starts there.
+            below = [i for i, line in enumerate(self.lines)
+                     if line[1].y1 > dest_point.y and i not in self.used]
+            if below:
+                first = min(below, key=lambda i: (self.lines[i][1].y0, self.lines[i][1].x0))
+                rect = self.lines[first][1]
+                if rect.y0 - dest_point.y <= rect.height:
+                    return self._hit(first, first)
+        return None
+
+def _iter_toc_candidates(doc, headings, layout):
+    """
+    Places ToC entries on their pages, one page at a time: each page's lines
+    are indexed once and all of its titles are matched against that index.
+    Yields (page_num, candidates) in page order; unplaced titles are dropped.
+    """
+    by_page = {}
+    for heading in headings:
+        by_page.setdefault(heading['page'], []).append(heading)
+
+    for page_num in sorted(by_page):
+        page_index = page_num - 1
+        line_index = PageLineIndex(layout.text_dict(page_index))
+        candidates = []
+        for heading in by_page[page_num]:
+            hit = line_index.locate(heading['text'], heading.get('dest'))
+            if hit is None and heading.get('dest') is not None:
+                # No matching text at the destination; keep the bookmark at its target point.
+                point = heading['dest']
+                hit = (fitz.Rect(point, point),
+                       {"size": layout.base_font_size(page_index), "font": "", "flags": 0})
+            if hit is None:
+                continue
+            heading['bbox'], heading['span'] = hit
+            heading['page_num'] = page_num
+            candidates.append(heading)
+        if layout.low_memory:
+            candidates = compact_candidates(candidates)
+        yield page_num, candidates
+
+def _process_page_shard(pdf_path, page_indices, title, dpi=300, low_memory=False, form_text=None):
+    """
+    Worker entry point for parallel visual analysis. Opens its own fitz and
+    pdfplumber handles and runs the candidate finder on each page of the shard
+    with only page-local dedup. Returns one (page_num, candidates, seen) tuple
+    per text page, where 'seen' is the page's local seen_headings set, the OCR
+    results of the shard's scanned pages (see ocr_scanned_pages), and the
+    shard's layout cache stats.
+    form_text is the document's repeating header/footer text, computed once by
+    the parent so the shards don't each redo the XObject pre-pass.
+    """
+    doc = fitz.open(pdf_path)
+    layout = PageLayoutCache(doc, pdf_path=pdf_path, low_memory=low_memory, repeating_form_text=form_text)
+    results = []
+    try:
+        # Scanned pages are detected and OCRed here rather than in the parent,
+        # so neither pass runs serially over the whole document.
+        scanned_pages = [i for i in page_indices if is_scanned_page(doc[i])]
+        ocr_results = ocr_scanned_pages(pdf_path, doc, scanned_pages, dpi, workers=1) if scanned_pages else {}
+        for i in page_indices:
+            if i in ocr_results:
+                continue
+            fitz_page = doc[i]
             if is_toc_page(fitz_page):
                 print(f"Info: Page {i + 1} detected as a Table of Contents, skipping visual analysis.")
                 continue
-            # Use the candidate finder to get raw heading info
-            page_candidates = process_page_for_candidates(fitz_page, plumber_page, i + 1, seen_headings)
-            all_heading_candidates.extend(page_candidates)
+            seen_headings = {title.lower()} if title else set()
+            page_candidates = process_page_for_candidates(fitz_page, None, i + 1, seen_headings, layout)
+            if low_memory:
+                page_candidates = compact_candidates(page_candidates)
+            layout.release(i)
+            results.append((i + 1, page_candidates, seen_headings))
+    finally:
+        layout.close()
+        doc.close()
+    return results, ocr_results, layout.stats()
+
+def iter_candidates_parallel(pdf_path, page_count, title, workers, dpi=300, low_memory=False,
+                             form_text=None, layout=None):
+    """
+    Runs the visual fallback across a process pool, one shard of pages per task,
+    and merges the results so they match the serial page-by-page run.
+    Yields (page_num, candidates) in page order as soon as each shard finishes.
+    Each shard finds and OCRs (at `dpi`) its own scanned pages; their
+    candidates are built during the merge, in page order.
+    form_text (see PageLayoutCache.repeating_form_text) is handed to every shard;
+    if the parent's layout cache is given, the shards' table counts are added to it.
+
+    A page's candidates are only ever removed, never added, by headings seen on
+    earlier pages. Replaying the per-page results in page order against a
+    document-wide seen set therefore reproduces the serial dedup exactly.
+    """
+    from concurrent.futures import ProcessPoolExecutor
 
-    # --- 3. MAP & EXTRACT PHASE ---
-    # Sort all found headings by their position in the document
-    all_heading_candidates.sort(key=lambda h: (h['page_num'], h['bbox'][1]))
+    # Several small shards per worker keep the pool balanced when some pages
+    # (e.g. table-heavy ones) are much slower than others.
+    shard_size = max(1, -(-page_count // (workers * 4)))
+    shards = [list(range(start, min(start + shard_size, page_count)))
+              for start in range(0, page_count, shard_size)]
 
-    outline = []
-    base_font_size_map = {i: get_base_font_size(doc[i-1]) for i in range(1, len(doc) + 1)}
+    seen_headings = set()
+    if title: seen_headings.add(title.lower())
 
-    for i, current_heading in enumerate(all_heading_candidates):
+    executor = ProcessPoolExecutor(max_workers=workers)
+    finished = False
+    try:
+        shard_iter = executor.map(_process_page_shard, [pdf_path] * len(shards), shards,
+                                  [title] * len(shards), [dpi] * len(shards),
+                                  [low_memory] * len(shards), [form_text] * len(shards))
+        for shard, (shard_results, ocr_results, shard_stats) in zip(shards, shard_iter):
+            if layout is not None:
+                layout.tables_skipped += shard_stats["tables_skipped"]
+                layout.tables_analyzed += shard_stats["tables_analyzed"]
+            page_results = {page_num: (cands, seen) for page_num, cands, seen in shard_results}
+            for page_num in (i + 1 for i in shard):
+                if page_num - 1 in ocr_results:
+                    yield page_num, ocr_result_to_candidates(ocr_results[page_num - 1], page_num, seen_headings)
+                    continue
+                if page_num not in page_results:
+                    yield page_num, []  # ToC page
+                    continue
+                page_candidates, page_seen = page_results[page_num]
+                merged = []
+                for candidate in page_candidates:
+                    if candidate['text'].lower() not in seen_headings:
+                        merged.append(candidate)
+                        seen_headings.add(candidate['text'].lower())
+                seen_headings.update(page_seen)
+                yield page_num, merged
+        finished = True
+    finally:
+        if not finished:
+            # The caller stopped early (e.g. the RSS ceiling): don't wait for shards nobody will read.
+            for process in list((executor._processes or {}).values()):
+                process.terminate()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def _map_page_sections(page_candidates, layout):
+    """
+    Map & extract for one page: turns the page's heading candidates (sorted by
+    position) into outline sections whose content runs from each heading down
+    to the next heading on the same page, or to the bottom of the page.
+    """
+    sections = []
+    for i, current_heading in enumerate(page_candidates):
         page_num = current_heading['page_num']
+        if current_heading.get('ocr'):
+            # OCR candidates carry their own level and content (no text layer to slice).
+            sections.append({
+                "level": current_heading['level'],
+                "text": current_heading['text'],
+                "content": clean_text(current_heading['content']),
+                "page": page_num
+            })
+            continue
         start_y = current_heading['bbox'][3] # The bottom of the current heading's bbox
-        
+
         # Default end boundary is the bottom of the current page
-        end_y = doc[page_num - 1].rect.height
-        
+        end_y = layout.doc[page_num - 1].rect.height
+
         # If there is a next heading, the content ends at its top
-        if i + 1 < len(all_heading_candidates):
-            next_heading = all_heading_candidates[i+1]
-            if next_heading['page_num'] == page_num:
-                end_y = next_heading['bbox'][1] # Top of the next heading's bbox
-            
+        if i + 1 < len(page_candidates):
+            end_y = page_candidates[i + 1]['bbox'][1] # Top of the next heading's bbox
+
         # Extract the text content from the calculated space
-        content = extract_text_between_y_coords(doc[page_num - 1], start_y, end_y)
-        
+        content = layout.word_index(page_num - 1).text_between(start_y, end_y)
+
         # Determine the heading level using our relative analyzer
-        base_size = base_font_size_map.get(page_num, 10)
+        base_size = layout.base_font_size(page_num - 1)
         level = determine_heading_level(current_heading['text'], current_heading['span'], base_size)
-        
+
         # Append the final, rich section object to our outline
-        outline.append({
+        sections.append({
             "level": level,
             "text": current_heading['text'],
             "content": clean_text(content),
             "page": page_num
         })
+    return sections
 
-    # --- 4. CLEANUP AND RETURN ---
-    doc.close()
-    plumber_doc.close()
-    
-    # Final filter to remove the title if it was accidentally picked up as a heading
-    final_outline = [h for h in outline if not similar(h['text'], title)]
-    
-    return {
+def count_pages(pdf_path):
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+def current_rss_mb(include_children=False):
+    """
+    Resident set size of this process in MB, plus that of its child processes
+    (e.g. page shard workers) if include_children, or None if psutil is unavailable.
+    """
+    try:
+        import psutil
+    except ImportError:
+        return None
+    process = psutil.Process(os.getpid())
+    rss = process.memory_info().rss
+    if include_children:
+        for child in process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                pass  # Exited since it was listed.
+    return rss / 1024 / 1024
+
+class PhaseTimer:
+    """
+    Accumulates wall-clock seconds per extraction phase into a dict. Phases
+    that run inside a lazy iterator are timed per next() call, so time the
+    consumer spends between items is not charged to the phase.
+    """
+
+    def __init__(self, timings=None):
+        self.timings = timings if timings is not None else {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    def iterate(self, name, iterable):
+        iterator = iter(iterable)
+        try:
+            while True:
+                with self.phase(name):
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                yield item
+        finally:
+            # Stopping early closes the source too (e.g. cancels pending page shards).
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+def iter_outline(pdf_path, max_pages=None, dpi=300, workers=1, ocr_workers=None,
+                 low_memory=False, max_rss_mb=None, timings=None, layout_stats=None):
+    """
+    Streaming form of extract_outline. Yields event dicts as extraction
+    progresses, so callers can show sections before the whole PDF is done:
+
+      {"event": "title", "title": ...}              once, before any section
+      {"event": "page", "page": n, "pages": total}  after each page (visual fallback)
+      {"event": "section", "section": {...}}        each final outline section
+      {"event": "warning", "warning": ..., "truncated": bool}
+                                                    if the RSS ceiling forced a fallback;
+                                                    truncated when the remaining pages were skipped
+      {"event": "error", "error": ...}              if the PDF can't be opened
+
+    Sections are mapped page by page, as soon as all of a page's headings are
+    known, and come out in the same order as extract_outline's outline.
+
+    Each page's cached layout is released as soon as the page is mapped.
+    low_memory further bounds per-page state: candidates are stored as
+    compact records and the pdfplumber document is recycled. max_rss_mb sets an RSS ceiling; when it is
+    crossed, table detection is switched off and all caches are dropped, and
+    if that is not enough the remaining pages are skipped. With workers > 1
+    the shard workers' RSS counts towards the ceiling, and skipping cancels
+    the shards that have not started.
+
+    If a timings dict is passed, seconds spent per phase ("title", "toc",
+    "ocr", "candidates", "mapping") are accumulated into it; with workers > 1
+    OCR runs inside the shards and counts towards "candidates". If a
+    layout_stats dict is passed, it receives the page layout cache's hit,
+    miss and table detection counts once extraction ends.
+    """
+    timer = PhaseTimer(timings)
+    try:
+        doc = fitz.open(pdf_path)
+    except Exception as e:
+        yield {"event": "error", "error": f"Failed to open PDF: {e}"}
+        return
+
+    # Every stage below shares one lazily-populated view of each page's layout.
+    # pdfplumber is opened by the cache only if some page needs table analysis.
+    layout = PageLayoutCache(doc, pdf_path=pdf_path, low_memory=low_memory)
+    try:
+        # --- 1. TITLE EXTRACTION (Hybrid Approach) ---
+        with timer.phase("title"):
+            title = extract_title_from_metadata(doc)
+            if not title:
+                title = clean_text(extract_title_from_first_page(doc, None, layout))
+
+        # --- 2. OUTLINE EXTRACTION (Structure-First) ---
+        with timer.phase("toc"):
+            headings_from_toc = extract_outline_from_toc(doc)
+        page_count = None
+        parallel = False
+
+        if headings_from_toc:
+            print("Info: Found a Table of Contents. Using it as the primary source.")
+            # We still need each heading's bbox to extract content, so we locate it on its page.
+            page_batches = timer.iterate("toc", _iter_toc_candidates(doc, headings_from_toc, layout))
+        else:
+            # --- VISUAL FALLBACK (If no ToC) ---
+            print("Info: No ToC found. Falling back to page-by-page visual analysis.")
+            page_count = min(len(doc), max_pages if max_pages else len(doc))
+            parallel = bool(workers and workers > 1 and page_count > 1)
+            if parallel:
+                # The shards detect and OCR their own scanned pages.
+                page_batches = iter_candidates_parallel(str(pdf_path), page_count, title, workers, dpi,
+                                                        low_memory, layout.repeating_form_text(), layout)
+            else:
+                with timer.phase("ocr"):
+                    scanned_pages = [i for i in range(page_count) if is_scanned_page(doc[i])]
+                    ocr_results = ocr_scanned_pages(pdf_path, doc, scanned_pages, dpi, ocr_workers) if scanned_pages else {}
+                page_batches = _iter_candidates_serial(doc, page_count, title, layout, ocr_results)
+            page_batches = timer.iterate("candidates", page_batches)
+
+        # --- 3. MAP & EXTRACT PHASE (page by page) ---
+        title_sent = False
+        for page_num, page_candidates in page_batches:
+            # Sort the page's headings by their vertical position
+            page_candidates = sorted(page_candidates, key=lambda h: h['bbox'][1])
+            if not title_sent:
+                # A scanned first page has no text layer to take a title from; use its first OCR heading.
+                if title == "Untitled Document" and page_num == 1 and page_candidates and page_candidates[0].get('ocr'):
+                    title = page_candidates[0]['text']
+                yield {"event": "title", "title": title}
+                title_sent = True
+            with timer.phase("mapping"):
+                sections = _map_page_sections(page_candidates, layout)
+            for section in sections:
+                # Filter out the title if it was accidentally picked up as a heading
+                if not similar(section['text'], title):
+                    yield {"event": "section", "section": section}
+            if page_count:
+                yield {"event": "page", "page": page_num, "pages": page_count}
+            layout.release(page_num - 1)
+
+            # --- RSS CEILING (graceful fallback) ---
+            rss = current_rss_mb(include_children=parallel) if max_rss_mb else None
+            if rss is not None and rss > max_rss_mb:
+                if layout.table_detection:
+                    warning = (f"RSS {rss:.0f} MB exceeds {max_rss_mb} MB after page {page_num}; "
+                               "dropping caches and disabling table detection.")
+                    print(f"Warning: {warning}")
+                    layout.table_detection = False
+                    layout.release_all()
+                    yield {"event": "warning", "warning": warning, "truncated": False}
+                else:
+                    warning = (f"RSS {rss:.0f} MB still exceeds {max_rss_mb} MB after page {page_num}; "
+                               "skipping the remaining pages.")
+                    print(f"Warning: {warning}")
+                    yield {"event": "warning", "warning": warning, "truncated": True}
+                    page_batches.close()  # Cancels page shards that have not started.
+                    break
+        if not title_sent:
+            yield {"event": "title", "title": title}
+    finally:
+        # --- 4. CLEANUP ---
+        stats = layout.stats()
+        print(f"Info: Page layout cache: {stats['hits']} hits, {stats['misses']} misses.")
+        print(f"Info: Table detection: {stats['tables_analyzed']} pages analyzed, {stats['tables_skipped']} skipped.")
+        if layout_stats is not None:
+            layout_stats.update(stats)
+        layout.close()
+        doc.close()
+
+def _iter_candidates_serial(doc, page_count, title, layout, ocr_results):
+    """Serial visual fallback: yields (page_num, candidates) for each page in order."""
+    if layout.low_memory:
+        for page_num, candidates in _iter_candidates_serial_full(doc, page_count, title, layout, ocr_results):
+            yield page_num, compact_candidates(candidates)
+        return
+    yield from _iter_candidates_serial_full(doc, page_count, title, layout, ocr_results)
+
+def _iter_candidates_serial_full(doc, page_count, title, layout, ocr_results):
+    seen_headings = set()
+    if title: seen_headings.add(title.lower())
+    for i in range(page_count):
+        fitz_page = doc[i]
+        if i in ocr_results:
+            yield i + 1, ocr_result_to_candidates(ocr_results[i], i + 1, seen_headings)
+            continue
+        if is_toc_page(fitz_page):
+            print(f"Info: Page {i + 1} detected as a Table of Contents, skipping visual analysis.")
+            yield i + 1, []
+            continue
+        # Use the candidate finder to get raw heading info
+        yield i + 1, process_page_for_candidates(fitz_page, None, i + 1, seen_headings, layout)
+
+def extract_outline(pdf_path, max_pages=None, dpi=300, workers=1, ocr_workers=None,
+                    low_memory=False, max_rss_mb=None, timings=None, on_event=None, layout_stats=None):
+    """
+    Main extraction engine. Implements the full hybrid strategy and returns a
+    detailed outline including the content for each section, formatted as requested.
+    With workers > 1 the visual fallback is split into page shards across a
+    process pool; the result is identical to the serial run.
+    Scanned (image-only) pages are OCRed at `dpi` by up to `ocr_workers` processes,
+    or by the shard workers when workers > 1. See iter_outline for low_memory, max_rss_mb, timings and layout_stats. on_event, if
+    given, is called with each iter_outline event as it happens.
+    If the RSS ceiling forced a fallback, the result also carries its
+    "warnings" and whether the outline was "truncated" (pages skipped).
+    """
+    title = None
+    outline = []
+    warnings = []
+    truncated = False
+    for event in iter_outline(pdf_path, max_pages, dpi, workers, ocr_workers, low_memory, max_rss_mb, timings,
+                              layout_stats):
+        if on_event is not None:
+            on_event(event)
+        if event["event"] == "error":
+            return {"error": event["error"]}
+        if event["event"] == "title":
+            title = event["title"]
+        elif event["event"] == "section":
+            outline.append(event["section"])
+        elif event["event"] == "warning":
+            warnings.append(event["warning"])
+            truncated = truncated or event["truncated"]
+
+    result = {
         "title": title,
-        "outline": final_outline
+        "outline": outline
     }
+    if warnings:
+        result["warnings"] = warnings
+        result["truncated"] = truncated
+    return result
 
 
-def get_base_font_size(page, percentile=50):
+def get_base_font_size(page, percentile=50, blocks_dict=None):
     """
     Calculates the most common (median) font size on the page, now with a
     defensive check for pages with no text blocks.
+    An already-parsed text dict can be passed to avoid re-parsing the page.
     """
     try:
         # --- THIS IS THE FIX ---
         # 1. Get the text dictionary safely.
-        blocks_dict = page.get_text("dict")
+        if blocks_dict is None:
+            blocks_dict = page.get_text("dict")
         
         # 2. Add the defensive check. If it's None or has no 'blocks' key, return a default.
         if not blocks_dict or 'blocks' not in blocks_dict:
@@ -441,34 +1127,98 @@ def get_base_font_size(page, percentile=50):
         # Return a default on any other unexpected error
         return 10
 
-def get_form_xobject_text(page):
+def _form_xobject_placements(page, max_height_ratio=0.2):
+    """
+    Yields (xref, rect) for each Form XObject drawn directly by the page whose
+    on-page footprint is a header/footer-sized band. Full-page forms (e.g.
+    imposed or wrapped pages) are ignored so their body text is kept.
+    """
+    doc = page.parent
+    placements = {}
+    for xref, _, invoker, bbox in page.get_xobjects():
+        try:
+            if doc.xref_get_key(xref, "Subtype")[1] != "/Form":
+                continue
+        except Exception:
+            continue
+        if invoker == 0:
+            rect = fitz.Rect(bbox) * page.transformation_matrix
+        elif invoker in placements:
+            # A nested form is shared across pages more often than its
+            # per-page wrapper; locate it through the wrapper's footprint.
+            rect = placements[invoker]
+        else:
+            continue
+        placements[xref] = rect
+        if rect.is_empty or rect.height > page.rect.height * max_height_ratio:
+            continue
+        yield xref, rect
+
+def _form_text_lines(page, rect):
+    """Cleaned, lower-cased lines of text drawn inside rect on the page."""
+    lines = set()
+    for line in page.get_text("text", clip=rect).split("\n"):
+        cleaned = clean_text(line)
+        if cleaned:
+            lines.add(cleaned.lower())
+    return lines
+
+def get_form_xobject_text(page, memo=None):
     """
     Analyzes a page to find all text that originates from a Form XObject.
     This is a reliable way to identify and filter repeating content like headers and footers.
     Returns a set of cleaned text strings found within forms.
+    An xref -> text memo shared across a document parses each form only once.
     """
+    if memo is None:
+        memo = {}
     form_text_content = set()
-    # A page's resources include its XObjects (which can be Forms or Images)
-    xobjects = page.get_xobjects()
-    
-    for _, xref in xobjects:
+    try:
+        placements = list(_form_xobject_placements(page))
+    except Exception:
+        return form_text_content
+
+    for xref, rect in placements:
+        if xref not in memo:
+            try:
+                memo[xref] = _form_text_lines(page, rect)
+            except Exception:
+                # If we fail to parse an XObject, just skip it.
+                memo[xref] = set()
+        form_text_content.update(memo[xref])
+
+    return form_text_content
+
+def find_repeating_form_text(doc, memo=None, min_pages=2):
+    """
+    Single pre-pass over the document that collects the text of header/footer
+    Form XObjects reused on at least `min_pages` pages. Reading a page's
+    XObject list is cheap; each unique form is parsed once via the memo.
+    """
+    if memo is None:
+        memo = {}
+    pages_per_xref = {}
+    first_use = {}
+    for page in doc:
         try:
-            # An XObject is a stream. We can load it to inspect it.
-            stream = fitz.open("pdf", page.parent.xref_stream(xref))
-            
-            # fitz has a property to check if the XObject is a Form
-            if stream[0].is_form_xobject:
-                # If it is, extract all of its text content
-                form_text = stream[0].get_text("text")
-                cleaned_text = clean_text(form_text)
-                if cleaned_text:
-                    form_text_content.add(cleaned_text.lower())
-            stream.close()
+            for xref, rect in _form_xobject_placements(page):
+                pages_per_xref[xref] = pages_per_xref.get(xref, 0) + 1
+                first_use.setdefault(xref, (page.number, rect))
         except Exception:
-            # If we fail to parse an XObject, just skip it.
             continue
-            
-    return form_text_content
+
+    repeating_text = set()
+    for xref, count in pages_per_xref.items():
+        if count < min_pages:
+            continue
+        if xref not in memo:
+            page_index, rect = first_use[xref]
+            try:
+                memo[xref] = _form_text_lines(doc[page_index], rect)
+            except Exception:
+                memo[xref] = set()
+        repeating_text.update(memo[xref])
+    return repeating_text
 
 def parse_poster_page_as_headings(page, page_num, seen_headings):
     """
@@ -588,6 +1338,178 @@ def ocr_page(fitz_page, dpi=300):
         print(f"Error: OCR failed on page {fitz_page.number + 1}: {e}")
         return ""
 
+# --- OCR STAGE FOR SCANNED PAGES ---
+OCR_CACHE_DIR = Path(os.getenv("OCR_CACHE_DIR", BASE_DIR / "cache" / "ocr"))
+# Rendered page size cap; large-format pages are OCRed at a lower DPI to stay under it.
+OCR_MAX_PIXELS = 12_000_000
+OCR_MIN_DPI = 150
+OCR_MAX_DPI = 450
+# Mean Tesseract word confidence (0-100) below which a page is retried at a higher DPI.
+OCR_RETRY_CONFIDENCE = 60
+
+def is_scanned_page(fitz_page, words=None, min_chars=20, min_image_coverage=0.5):
+    """
+    A page is treated as scanned when it has (almost) no text layer and its
+    images cover most of the page area.
+    """
+    page_area = abs(fitz_page.rect)
+    if not page_area:
+        return False
+    # Image coverage first: it is cheap and rules out almost every text page
+    # without parsing its words.
+    covered = 0
+    for info in fitz_page.get_image_info():
+        covered += abs(fitz.Rect(info["bbox"]) & fitz_page.rect)
+    if covered / page_area < min_image_coverage:
+        return False
+    if words is None:
+        words = fitz_page.get_text("words")
+    return sum(len(w[4]) for w in words) < min_chars
+
+def adaptive_ocr_dpi(fitz_page, dpi=300):
+    """Lowers the requested DPI for large pages so the rendered image stays under OCR_MAX_PIXELS."""
+    area_in_sq_inches = (fitz_page.rect.width / 72) * (fitz_page.rect.height / 72)
+    if area_in_sq_inches <= 0:
+        return dpi
+    max_dpi_for_page = int((OCR_MAX_PIXELS / area_in_sq_inches) ** 0.5)
+    return max(OCR_MIN_DPI, min(dpi, max_dpi_for_page))
+
+def ocr_page_lines(fitz_page, dpi=300):
+    """
+    Performs OCR on a Fitz page and returns (lines, mean_confidence), where
+    lines is a list of (text, top, bottom) in page coordinates (points).
+    """
+    try:
+        from PIL import Image
+        import pytesseract
+        import io
+        pix = fitz_page.get_pixmap(dpi=dpi)
+        image = Image.open(io.BytesIO(pix.tobytes("png")))
+        data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+    except Exception as e:
+        print(f"Error: OCR failed on page {fitz_page.number + 1}: {e}")
+        return [], 0.0
+
+    scale = 72 / dpi
+    grouped = {}
+    confidences = []
+    for i, word in enumerate(data["text"]):
+        if not word.strip():
+            continue
+        conf = float(data["conf"][i])
+        if conf >= 0:
+            confidences.append(conf)
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        top, bottom = data["top"][i], data["top"][i] + data["height"][i]
+        if key not in grouped:
+            grouped[key] = [[word], top, bottom]
+        else:
+            grouped[key][0].append(word)
+            grouped[key][1] = min(grouped[key][1], top)
+            grouped[key][2] = max(grouped[key][2], bottom)
+
+    lines = [(" ".join(words), top * scale, bottom * scale) for words, top, bottom in grouped.values()]
+    lines.sort(key=lambda l: l[1])
+    mean_conf = sum(confidences) / len(confidences) if confidences else 0.0
+    return lines, mean_conf
+
+def _ocr_page_task(pdf_path, page_index, dpi):
+    """Worker entry point: OCRs one page with adaptive DPI and a low-confidence retry."""
+    doc = fitz.open(pdf_path)
+    try:
+        page = doc[page_index]
+        page_dpi = adaptive_ocr_dpi(page, dpi)
+        lines, conf = ocr_page_lines(page, page_dpi)
+        if conf < OCR_RETRY_CONFIDENCE and page_dpi < OCR_MAX_DPI:
+            retry_dpi = min(OCR_MAX_DPI, int(page_dpi * 1.5))
+            retry_lines, retry_conf = ocr_page_lines(page, retry_dpi)
+            if retry_conf > conf:
+                lines, conf, page_dpi = retry_lines, retry_conf, retry_dpi
+        return {"lines": lines, "confidence": conf, "dpi": page_dpi}
+    finally:
+        doc.close()
+
+def ocr_page_hash(fitz_page, dpi):
+    """Hash of a page's content stream and image data, used as the OCR cache key."""
+    doc = fitz_page.parent
+    digest = hashlib.sha256(f"{EXTRACTOR_VERSION}:{dpi}:{tuple(fitz_page.rect)}".encode())
+    digest.update(fitz_page.read_contents())
+    for img in fitz_page.get_images(full=True):
+        digest.update(doc.xref_stream_raw(img[0]) or b"")
+    return digest.hexdigest()
+
+def ocr_scanned_pages(pdf_path, doc, page_indices, dpi=300, workers=None):
+    """
+    OCRs the given (scanned) pages, in a process pool when possible. Results
+    are cached on disk per page hash, so re-running on the same PDF is free.
+    Returns {page_index: {"lines", "confidence", "dpi"}}.
+    """
+    results = {}
+    pending = {}  # first page index -> cache path, one per unique page hash
+    duplicates = {}  # page index -> first page index with the same hash
+    first_by_key = {}
+    for i in page_indices:
+        key = ocr_page_hash(doc[i], dpi)
+        cache_path = OCR_CACHE_DIR / f"{key}.json"
+        if key in first_by_key:
+            duplicates[i] = first_by_key[key]
+        elif cache_path.exists():
+            with open(cache_path, encoding="utf-8") as f:
+                results[i] = json.load(f)
+        else:
+            pending[i] = cache_path
+        first_by_key.setdefault(key, i)
+    if not pending:
+        results.update({i: results[first] for i, first in duplicates.items()})
+        return results
+
+    workers = workers or os.cpu_count() or 1
+    print(f"Info: Running OCR on {len(pending)} scanned page(s).")
+    # Pool workers (e.g. the server's extraction pool) are daemonic and cannot
+    # start their own children, so OCR runs in-process there.
+    if workers > 1 and len(pending) > 1 and not multiprocessing.current_process().daemon:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as executor:
+            futures = {i: executor.submit(_ocr_page_task, str(pdf_path), i, dpi) for i in pending}
+            fresh = {i: future.result() for i, future in futures.items()}
+    else:
+        fresh = {i: _ocr_page_task(str(pdf_path), i, dpi) for i in pending}
+
+    OCR_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    for i, result in fresh.items():
+        results[i] = result
+        if result["lines"]:
+            with open(pending[i], "w", encoding="utf-8") as f:
+                json.dump(result, f)
+    results.update({i: results[first] for i, first in duplicates.items()})
+    return results
+
+def ocr_result_to_candidates(ocr_result, page_num, seen_headings):
+    """
+    Turns a page's OCR lines into heading candidates for the map & extract
+    phase, using parse_ocr_text_as_headings on each line. The body lines
+    following a heading become its content, since there is no text layer to
+    slice by coordinates.
+    """
+    candidates = []
+    for text, top, bottom in ocr_result["lines"]:
+        headings = parse_ocr_text_as_headings(text, page_num, seen_headings)
+        if headings:
+            candidates.append({
+                "text": headings[0]["text"],
+                "page_num": page_num,
+                "bbox": (0, top, 0, bottom),
+                "span": {"size": bottom - top},
+                "level": headings[0]["level"],
+                "content": [],
+                "ocr": True,
+            })
+        elif candidates:
+            candidates[-1]["content"].append(text)
+    for candidate in candidates:
+        candidate["content"] = " ".join(candidate["content"])
+    return candidates
+
 def parse_ocr_text_as_headings(ocr_text, page_num, seen_headings):
     """
     A simple parser for OCR text. It treats any short, non-sentence line as a heading.
@@ -630,7 +1552,6 @@ def post_process_and_level_headings(heading_candidates):
     return leveled_headings
 
 import argparse
-import json
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
@@ -646,10 +1567,34 @@ if __name__ == '__main__':
         default=300,
         help="Resolution (DPI) for OCR processing on scanned pages. Default: 300."
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes for page-parallel visual analysis. Default: 1 (serial)."
+    )
+    parser.add_argument(
+        "--ocr_workers",
+        type=int,
+        default=None,
+        help="Number of tesseract processes for scanned pages when --workers is 1. Default: CPU count."
+    )
+    parser.add_argument(
+        "--low_memory",
+        action="store_true",
+        help="Bounded-memory mode for very large PDFs (releases per-page state as it goes)."
+    )
+    parser.add_argument(
+        "--max_rss_mb",
+        type=int,
+        default=None,
+        help="Optional RSS ceiling in MB; above it table detection is disabled, then remaining pages are skipped."
+    )
     args = parser.parse_args()
 
     try:
-        extracted_data = extract_outline(args.pdf_path, args.max_pages, args.dpi)
+        extracted_data = extract_outline(args.pdf_path, args.max_pages, args.dpi, args.workers, args.ocr_workers,
+                                         args.low_memory, args.max_rss_mb)
         
         if "error" in extracted_data:
             print(f"\nAn error occurred: {extracted_data['error']}")
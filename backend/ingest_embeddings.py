@@ -0,0 +1,114 @@
+# ingest_embeddings.py - Background section embedding right after Stage 1
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import metrics
+from batching import encode_bucketed
+from embedding_store import passage_texts, sidecar_path, store_for, texts_digest, write_sidecar
+from model_registry import DEFAULT_MODEL, get_model, model_key
+
+# Set INGEST_EMBEDDINGS=0 to leave all encoding to /analyze/.
+INGEST_EMBEDDINGS = os.getenv("INGEST_EMBEDDINGS", "1") == "1"
+# Most recent failures kept for status(); older ones are reported as "off".
+INGEST_MAX_ERRORS = int(os.getenv("INGEST_MAX_ERRORS", 256))
+
+INGEST_EMBED_SECONDS = metrics.histogram(
+    "ingest_embedding_seconds", "Time to embed one Stage 1 outline in the background.")
+
+
+def embed_outline(outline_path, model_name=DEFAULT_MODEL):
+    """
+    Encodes one outline's section titles and contents (through the shared
+    embedding store) and writes <stem>.embeddings.npz next to it. Returns
+    the number of sections.
+    """
+    outline_path = Path(outline_path)
+    model_id = model_key(model_name)
+    with open(outline_path, "r", encoding="utf-8") as f:
+        sections = json.load(f).get("outline", [])
+    titles, contents = passage_texts(sections)
+    model = get_model(model_name)
+    vectors = store_for(model_id).encode(titles + contents, lambda texts: encode_bucketed(model, texts)[0])
+    write_sidecar(outline_path, model_id, vectors[:len(titles)], vectors[len(titles):],
+                  texts_digest(titles, contents))
+    return len(sections)
+
+
+class IngestEmbedder:
+    """
+    Runs embed_outline for freshly extracted outlines on one background
+    thread, so uploads return as soon as Stage 1 is done and the first
+    /analyze/ afterwards only has to encode the query.
+    """
+
+    def __init__(self, model_name=DEFAULT_MODEL, enabled=None):
+        self.model_name = model_name
+        self.enabled = INGEST_EMBEDDINGS if enabled is None else enabled
+        # Only queued and running outlines; a finished one is "ready" through its sidecar.
+        self._states = {}
+        self._errors = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def start(self):
+        if self.enabled:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def submit(self, outline_paths):
+        if self._executor is None:
+            return
+        for path in outline_paths:
+            path = Path(path)
+            with self._lock:
+                self._states[str(path)] = "pending"
+                self._errors.pop(str(path), None)
+            self._executor.submit(self._embed, path)
+
+    def _set(self, path, state):
+        with self._lock:
+            self._states[str(path)] = state
+
+    def _finish(self, path, error=False):
+        with self._lock:
+            self._states.pop(str(path), None)
+            if error:
+                self._errors[str(path)] = "error"
+                while len(self._errors) > INGEST_MAX_ERRORS:
+                    self._errors.popitem(last=False)
+
+    def _embed(self, path):
+        self._set(path, "running")
+        start = time.perf_counter()
+        try:
+            count = embed_outline(path, self.model_name)
+        except FileNotFoundError:
+            # Replaced by a newer upload before we got to it.
+            self._finish(path)
+            return
+        except Exception as exc:
+            logging.warning(f"[WARN] Background embedding failed for {path.name}: {exc}")
+            self._finish(path, error=True)
+            return
+        elapsed = time.perf_counter() - start
+        INGEST_EMBED_SECONDS.observe(elapsed)
+        logging.info(f"🧠 Embedded {count} sections of {path.name} in {elapsed:.2f}s")
+        self._finish(path)
+
+    def status(self, outline_path):
+        """ready, pending, running, error, or off (disabled / never submitted)."""
+        with self._lock:
+            state = self._states.get(str(outline_path)) or self._errors.get(str(outline_path))
+        if state is not None:
+            return state
+        return "ready" if sidecar_path(outline_path).exists() else "off"
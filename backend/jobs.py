@@ -0,0 +1,211 @@
+# jobs.py - Background job queue for Stage 1 and analysis work
+import asyncio
+import functools
+import itertools
+import logging
+import os
+import shutil
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from fastapi.concurrency import run_in_threadpool
+
+BASE_DIR = Path(__file__).parent
+JOBS_DIR = Path(os.getenv("JOBS_DIR", BASE_DIR / "jobs"))
+# How many jobs run at once; everything else waits in the queue.
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", 2))
+# Submissions beyond this many queued jobs are rejected.
+JOB_QUEUE_LIMIT = int(os.getenv("JOB_QUEUE_LIMIT", 200))
+# "priority" runs lower priority numbers first (FIFO within a priority); "fifo" ignores priority.
+JOB_QUEUE_POLICY = os.getenv("JOB_QUEUE_POLICY", "priority")
+# Finished jobs (and their working directories) are kept this long for polling.
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", 3600))
+# How often expired jobs are swept even when no one submits or polls.
+JOB_GC_INTERVAL_SECONDS = float(os.getenv("JOB_GC_INTERVAL_SECONDS", 300))
+
+TERMINAL_STATES = ("done", "error")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    """
+    One unit of queued work. Progress is an append-only list of event dicts;
+    handlers running in a worker thread report through emit(), which hands
+    the event to the event loop so SSE subscribers are woken up there.
+    """
+
+    def __init__(self, kind, func, args, priority=0, loop=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.priority = priority
+        self.seq = 0
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.events = []
+        self.dir = JOBS_DIR / self.id
+        # Whatever the submit-time prepare() step returned (e.g. the saved uploads).
+        self.payload = None
+        self._func = func
+        self._args = args
+        self._loop = loop
+        self._changed = asyncio.Condition()
+
+    def emit(self, event):
+        """Thread-safe: records a progress event for this job."""
+        self._loop.call_soon_threadsafe(self._append, event)
+
+    def _append(self, event):
+        self.events.append({**event, "job_id": self.id})
+        self._loop.create_task(self._notify())
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def wait_for_events(self, seen, timeout):
+        """Waits until there are more than `seen` events or the timeout expires."""
+        async with self._changed:
+            if len(self.events) <= seen and self.status not in TERMINAL_STATES:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    def _set_status(self, status, **extra):
+        self.status = status
+        self._append({"event": "status", "status": status, **extra})
+
+    def describe(self, position=None):
+        progress = next((e for e in reversed(self.events) if e["event"] != "status"), None)
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "priority": self.priority,
+            "position": position,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "events": len(self.events),
+            "progress": progress,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobScheduler:
+    """
+    Runs submitted jobs on at most `concurrency` worker tasks. Each job's
+    handler is a blocking function executed on the scheduler's own thread
+    pool, so long jobs neither block the event loop nor take threads from
+    the pool that FastAPI uses for sync endpoints.
+    """
+
+    def __init__(self, concurrency=None, queue_limit=None, policy=None, retention=None):
+        self.concurrency = concurrency or JOB_CONCURRENCY
+        self.queue_limit = queue_limit or JOB_QUEUE_LIMIT
+        self.policy = policy or JOB_QUEUE_POLICY
+        self.retention = retention if retention is not None else JOB_RETENTION_SECONDS
+        self.jobs = {}
+        self._seq = itertools.count()
+        self._queue = None
+        self._workers = []
+        self._loop = None
+        self._executor = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.PriorityQueue()
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="job")
+        # Job state lives in memory, so working dirs left by a previous run are orphans.
+        shutil.rmtree(JOBS_DIR, ignore_errors=True)
+        JOBS_DIR.mkdir(parents=True, exist_ok=True)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        logging.info(f"🗂️ Job scheduler started with concurrency {self.concurrency} ({self.policy})")
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def submit(self, kind, func, *args, priority=0, prepare=None):
+        """
+        Queues func(job, *args) and returns the Job. `prepare(job)`, if given,
+        runs first in the threadpool (e.g. to save uploads into job.dir).
+        """
+        self.gc()
+        if self.queued_count() >= self.queue_limit:
+            raise QueueFull(f"Job queue is full ({self.queue_limit} jobs waiting)")
+        job = Job(kind, func, args, priority, self._loop)
+        job.dir.mkdir(parents=True, exist_ok=True)
+        if prepare is not None:
+            try:
+                job.payload = await run_in_threadpool(prepare, job)
+            except Exception:
+                shutil.rmtree(job.dir, ignore_errors=True)
+                raise
+        job.seq = next(self._seq)
+        self.jobs[job.id] = job
+        self._queue.put_nowait((self._rank(job), job.seq, job))
+        job._set_status("queued", position=self.position(job))
+        return job
+
+    def get(self, job_id):
+        self.gc()
+        return self.jobs.get(job_id)
+
+    def queued_count(self):
+        return sum(1 for job in self.jobs.values() if job.status == "queued")
+
+    def position(self, job):
+        """1-based place in the queue, or None once the job has started."""
+        if job.status != "queued":
+            return None
+        key = (self._rank(job), job.seq)
+        ahead = sum(
+            1 for other in self.jobs.values()
+            if other.status == "queued" and (self._rank(other), other.seq) < key
+        )
+        return ahead + 1
+
+    def _rank(self, job):
+        return job.priority if self.policy == "priority" else 0
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self._queue.get()
+            job.started_at = time.time()
+            job._set_status("running")
+            try:
+                job.result = await self._loop.run_in_executor(
+                    self._executor, functools.partial(job._func, job, *job._args))
+                job.finished_at = time.time()
+                job._set_status("done", result=job.result)
+            except Exception as exc:
+                logging.error(f"❌ Job {job.id} ({job.kind}) failed: {exc}")
+                job.error = {"exception": str(exc), "traceback": traceback.format_exc()}
+                job.finished_at = time.time()
+                job._set_status("error", error=job.error)
+            finally:
+                self._queue.task_done()
+
+    def gc(self):
+        """Forgets finished jobs older than the retention period and removes their files."""
+        cutoff = time.time() - self.retention
+        for job_id, job in list(self.jobs.items()):
+            if job.status in TERMINAL_STATES and job.finished_at < cutoff:
+                del self.jobs[job_id]
+                shutil.rmtree(job.dir, ignore_errors=True)
@@ -0,0 +1,277 @@
+# lexical_index.py - Persistent BM25 inverted index over outline sections
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+from embedding_store import passage_texts, texts_digest
+from vector_index import top_k
+
+# Sections /analyze/ hands to semantic re-ranking per query (e.g. 200); 0, the default, ranks
+# every section semantically, so it keeps its exhaustive vector-index path. /explain/ has its
+# own EXPLAIN_SHORTLIST.
+LEXICAL_SHORTLIST = int(os.getenv("LEXICAL_SHORTLIST", 0))
+# Share of the final score that comes from (max-normalised) BM25; the rest is cosine similarity.
+LEXICAL_FUSION_WEIGHT = float(os.getenv("LEXICAL_FUSION_WEIGHT", 0))
+BM25_K1 = float(os.getenv("BM25_K1", 1.2))
+BM25_B = float(os.getenv("BM25_B", 0.75))
+# Outlines directories whose index stays loaded in this process (least recently used go first).
+LEXICAL_INDEX_CACHE_SIZE = int(os.getenv("LEXICAL_INDEX_CACHE_SIZE", 8))
+
+# Next to the vector indexes rank_sections keeps, relative to an outlines directory.
+LEXICAL_INDEX_PATH = Path("retrieval_index") / "bm25.json"
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in ENGLISH_STOP_WORDS]
+
+
+def section_terms(section):
+    """Title and content tokens of one outline section (Stage 1 'text' or Stage 2 'section_title')."""
+    title = section.get('section_title', section.get('text', ''))
+    return tokenize(f"{title} {section.get('content', '')}")
+
+
+def fuse(semantic, lexical, weight=None):
+    """(1 - weight) * semantic + weight * lexical / max(lexical), elementwise."""
+    weight = LEXICAL_FUSION_WEIGHT if weight is None else weight
+    semantic = np.asarray(semantic, dtype=np.float32)
+    lexical = np.asarray(lexical, dtype=np.float32)
+    peak = lexical.max() if lexical.size else 0
+    if weight <= 0 or peak <= 0:
+        return semantic
+    return (1 - weight) * semantic + weight * lexical / peak
+
+
+class BM25Index:
+    """
+    Okapi BM25 over sections, added and replaced a document at a time like
+    the vector indexes. Each document keeps its own postings
+    ({term: [[row, tf], ...]}) and section lengths; the merged postings are
+    rebuilt lazily on the next search after a change, and a query only
+    touches the postings of its own terms.
+    """
+
+    def __init__(self, k1=None, b=None):
+        self.k1 = BM25_K1 if k1 is None else k1
+        self.b = BM25_B if b is None else b
+        self._docs = {}
+        self._postings = None
+
+    def __len__(self):
+        return sum(len(d["lengths"]) for d in self._docs.values())
+
+    def documents(self):
+        return {doc: d["tag"] for doc, d in self._docs.items()}
+
+    def add(self, doc, sections, tag=None):
+        """Indexes a document's sections (rows in outline order), replacing any previous version."""
+        postings = {}
+        lengths = []
+        for row, section in enumerate(sections):
+            terms = section_terms(section)
+            lengths.append(len(terms))
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append([row, tf])
+        self._docs[doc] = {"tag": tag, "lengths": lengths, "postings": postings}
+        self._postings = None
+
+    def delete(self, doc):
+        if self._docs.pop(doc, None) is not None:
+            self._postings = None
+
+    def _build(self):
+        if self._postings is None:
+            self._owners = [(doc, row) for doc, d in self._docs.items() for row in range(len(d["lengths"]))]
+            self._doc_ids = {doc: i for i, doc in enumerate(self._docs)}
+            self._owner_docs = np.array([self._doc_ids[doc] for doc, _ in self._owners], dtype=np.int32)
+            lengths = np.array([n for d in self._docs.values() for n in d["lengths"]], dtype=np.float32)
+            self._norms = self.k1 * (1 - self.b + self.b * lengths / max(lengths.mean(), 1e-9)) \
+                if len(lengths) else lengths
+            merged = {}
+            offset = 0
+            for d in self._docs.values():
+                for term, entries in d["postings"].items():
+                    merged.setdefault(term, []).extend([offset + row, tf] for row, tf in entries)
+                offset += len(d["lengths"])
+            self._postings = {term: np.array(entries, dtype=np.int64) for term, entries in merged.items()}
+        return self._postings
+
+    def scores(self, query, documents=None):
+        """(section ids, BM25 scores) of the sections sharing a term with query (optionally within documents)."""
+        postings = self._build()
+        total = len(self._owners)
+        allowed = None
+        if documents is not None:
+            allowed = np.zeros(len(self._doc_ids), dtype=bool)
+            allowed[[self._doc_ids[d] for d in documents if d in self._doc_ids]] = True
+        ids, contributions = [], []
+        for term in set(tokenize(query)):
+            entries = postings.get(term)
+            if entries is None:
+                continue
+            rows, tf = entries[:, 0], entries[:, 1].astype(np.float32)
+            idf = np.log(1 + (total - len(rows) + 0.5) / (len(rows) + 0.5))
+            ids.append(rows)
+            contributions.append(idf * tf * (self.k1 + 1) / (tf + self._norms[rows]))
+        if not ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        ids = np.concatenate(ids)
+        contributions = np.concatenate(contributions)
+        if allowed is not None:
+            keep = allowed[self._owner_docs[ids]]
+            ids, contributions = ids[keep], contributions[keep]
+        unique, inverse = np.unique(ids, return_inverse=True)
+        return unique, np.bincount(inverse, weights=contributions).astype(np.float32)
+
+    def search(self, query, k, documents=None):
+        """Returns [(score, document, row)] for the k best-matching sections, best first."""
+        ids, scores = self.scores(query, documents)
+        return [(float(scores[i]), *self._owners[ids[i]]) for i in top_k(scores, k)]
+
+    def shortlist(self, query, size, documents=None):
+        """
+        The size best-matching sections as [(score, document, row)], topped
+        up with non-matching sections (score 0, in index order) when fewer
+        than size share a term with the query, so small corpora are ranked
+        in full. A size of 0 or less shortlists every section.
+        """
+        size = size if size > 0 else len(self)
+        hits = self.search(query, size, documents)
+        if len(hits) < size:
+            seen = {(doc, row) for _, doc, row in hits}
+            wanted = self._docs.keys() if documents is None else [d for d in documents if d in self._docs]
+            for doc in wanted:
+                for row in range(len(self._docs[doc]["lengths"])):
+                    if len(hits) >= size:
+                        return hits
+                    if (doc, row) not in seen:
+                        hits.append((0.0, doc, row))
+        return hits
+
+    # --- persistence ---
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"k1": self.k1, "b": self.b, "documents": self._docs}, f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        """Loads a saved index, or returns a new empty one if it is missing or unreadable."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            index = cls(data["k1"], data["b"])
+            index._docs = data["documents"]
+            return index
+        except FileNotFoundError:
+            pass
+        except Exception as exc:
+            logging.warning(f"[WARN] Rebuilding unreadable lexical index {path}: {exc}")
+        return cls()
+
+
+def lexical_index_path(outlines_dir):
+    return Path(outlines_dir) / LEXICAL_INDEX_PATH
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def _remember(path, mtime, index):
+    """Caches an index, dropping ones whose directory is gone and the least recently used."""
+    _indexes[path] = (mtime, index)
+    _indexes.move_to_end(path)
+    for cached in [p for p in _indexes if not p.parent.parent.exists()]:
+        del _indexes[cached]
+    while len(_indexes) > LEXICAL_INDEX_CACHE_SIZE:
+        _indexes.popitem(last=False)
+
+
+def forget_index(outlines_dir):
+    """Drops an outlines directory's index from this process (e.g. a deleted workspace or finished job)."""
+    with _indexes_lock:
+        _indexes.pop(lexical_index_path(outlines_dir), None)
+
+
+def _sync(outlines_dir, paths):
+    """index_outlines without the lock."""
+    outlines_dir = Path(outlines_dir)
+    path = lexical_index_path(outlines_dir)
+    paths = sorted(outlines_dir.glob("*.json")) if paths is None else [Path(p) for p in paths]
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    cached = _indexes.get(path)
+    index = cached[1] if cached and cached[0] == mtime else BM25Index.load(path)
+    indexed = index.documents()
+    changed = False
+    for doc in indexed:
+        if not (outlines_dir / f"{doc}.json").exists():
+            index.delete(doc)
+            changed = True
+    for outline_path in paths:
+        try:
+            with open(outline_path, "r", encoding="utf-8") as f:
+                sections = json.load(f).get("outline", [])
+        except FileNotFoundError:
+            continue
+        except Exception as exc:
+            logging.warning(f"[WARN] Not indexing unreadable outline {outline_path.name}: {exc}")
+            continue
+        tag = texts_digest(*passage_texts(sections))
+        if indexed.get(outline_path.stem) != tag:
+            index.add(outline_path.stem, sections, tag=tag)
+            changed = True
+    if changed:
+        index.save(path)
+        mtime = path.stat().st_mtime_ns
+        logging.info(f"🔤 Lexical index of {outlines_dir.name}: {len(index.documents())} documents, "
+                     f"{len(index)} sections")
+    _remember(path, mtime, index)
+    return index
+
+
+def index_outlines(outlines_dir, paths=None):
+    """
+    Brings the BM25 index of an outlines directory up to date with the
+    given outline JSONs (all of them by default): new or changed outlines
+    are re-indexed, ones whose file is gone are dropped, and the index is
+    saved if anything changed. The index stays cached in this process
+    (up to LEXICAL_INDEX_CACHE_SIZE directories) until the file is
+    rewritten by someone else.
+    """
+    with _indexes_lock:
+        _sync(outlines_dir, paths)
+
+
+def lexical_shortlist(outlines_dir, query, size, paths=None):
+    """
+    index_outlines(outlines_dir, paths), then the BM25 shortlist for query
+    over the documents of paths (all outlines by default) as
+    [(score, outline stem, row)].
+    """
+    with _indexes_lock:
+        index = _sync(outlines_dir, paths)
+        documents = None if paths is None else [Path(p).stem for p in paths]
+        return index.shortlist(query, size, documents)
@@ -1,18 +1,30 @@
 # main.py - Stage 1 only (PDF Structure Extraction)
-import sys
-import subprocess
+import asyncio
+from contextlib import ExitStack, asynccontextmanager
 from pathlib import Path
-from fastapi import FastAPI, UploadFile, File, Request
-from fastapi.responses import JSONResponse
+from fastapi import Depends, FastAPI, UploadFile, File, Form, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import shutil
 import json
 import logging
-import os
 import glob
 import urllib.parse
-import traceback
-import re
+import shutil
+
+import metrics
+from extraction_pool import ExtractionPool
+from jobs import JOB_GC_INTERVAL_SECONDS, JobScheduler, QueueFull, TERMINAL_STATES
+from outline_cache import OutlineCache, save_and_hash
+from services import WarmServices
+from embedding_store import SIDECAR_SUFFIX
+from lexical_index import LEXICAL_INDEX_PATH, forget_index, index_outlines
+from ingest_embeddings import IngestEmbedder
+from file_serving import ContentHashIndex, serve_file
+from workspaces import (
+    WORKSPACE_GC_INTERVAL_SECONDS, WORKSPACE_HEADER, InvalidWorkspaceId, UnknownWorkspace, Workspace,
+    WorkspaceBusy, WorkspaceManager,
+)
 
 # ------------------ CONFIG ------------------
 BASE_DIR = Path(__file__).parent
@@ -28,7 +40,48 @@ INTERMEDIATE_DIR.mkdir(parents=True, exist_ok=True)
 logging.basicConfig(level=logging.INFO)
 
 # ------------------ FASTAPI SETUP ------------------
-app = FastAPI(title="PDF Processing API (Combined)")
+extraction_pool = ExtractionPool()
+outline_cache = OutlineCache()
+job_scheduler = JobScheduler()
+services = WarmServices()
+ingest_embedder = IngestEmbedder()
+# SHA-256 of uploaded PDFs, used as the ETag when /pdfs/ serves them.
+pdf_hashes = ContentHashIndex()
+workspace_manager = WorkspaceManager()
+
+metrics.REGISTRY.gauge("jobs_queued", "Jobs waiting in the job queue.", job_scheduler.queued_count)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start the warm Stage 1 workers once, before the first upload arrives.
+    extraction_pool.start()
+    await job_scheduler.start()
+    # Load the summary model once so /summary/ and /explain/ only pay for their own work.
+    await services.start()
+    ingest_embedder.start()
+    gc_task = asyncio.create_task(collect_idle_workspaces())
+    job_gc_task = asyncio.create_task(collect_finished_jobs())
+    yield
+    job_gc_task.cancel()
+    gc_task.cancel()
+    ingest_embedder.stop()
+    await services.stop()
+    await job_scheduler.stop()
+    extraction_pool.close()
+
+async def collect_idle_workspaces():
+    """Periodically deletes session workspaces that outlived their TTL."""
+    while True:
+        await run_in_threadpool(workspace_manager.gc)
+        await asyncio.sleep(WORKSPACE_GC_INTERVAL_SECONDS)
+
+async def collect_finished_jobs():
+    """Periodically forgets finished jobs that outlived their retention period."""
+    while True:
+        await asyncio.sleep(JOB_GC_INTERVAL_SECONDS)
+        job_scheduler.gc()
+
+app = FastAPI(title="PDF Processing API (Combined)", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -38,95 +91,221 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# ------------------ UPLOAD & STAGE 1 ------------------
-@app.post("/upload/")
-async def upload_files(request: Request, files: list[UploadFile] = File(...)):
+# ------------------ WORKSPACES ------------------
+def get_workspace(request: Request, workspace_id: str = Query(None)) -> Workspace:
     """
-    Upload only PDF files, then run Stage 1 only.
+    Resolves the caller's workspace from ?workspace_id= or the X-Workspace-Id
+    header, creating it on first use. Without either, the shared input/ and
+    output/ dirs are used as before.
     """
-    logging.info("📥 Upload request received (PDFs only)")
+    return resolve_workspace(request, workspace_id, create=True)
+
+def find_workspace(request: Request, workspace_id: str = Query(None)) -> Workspace:
+    """Like get_workspace for read-only routes: an unknown id is a 404 and creates nothing."""
+    return resolve_workspace(request, workspace_id, create=False)
 
+def resolve_workspace(request, workspace_id, create):
+    workspace_id = workspace_id or request.headers.get(WORKSPACE_HEADER)
+    try:
+        return workspace_manager.get(workspace_id, create=create)
+    except InvalidWorkspaceId as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    except UnknownWorkspace as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+
+@app.exception_handler(WorkspaceBusy)
+async def workspace_busy(request: Request, exc: WorkspaceBusy):
+    # Deleting a workspace in use, or using one while it is being deleted.
+    return JSONResponse(status_code=409, content={"error": str(exc)})
+
+@app.post("/workspaces/")
+def create_workspace():
+    """Creates a fresh workspace and returns its id for use in later requests."""
+    workspace = workspace_manager.get(workspace_manager.new_id())
+    return {"workspace_id": workspace.id, "ttl_seconds": workspace_manager.ttl}
+
+@app.delete("/workspaces/{workspace_id}")
+def delete_workspace(workspace_id: str):
+    if not workspace_manager.delete(workspace_id):
+        return JSONResponse(status_code=404, content={"error": "Unknown workspace id"})
+    return {"status": "deleted", "workspace_id": workspace_id}
+
+# ------------------ UPLOAD & STAGE 1 ------------------
+def save_uploaded_pdfs(files, input_dir=INPUT_DIR):
+    """
+    Clears the input dir and saves the uploaded PDF files into it, hashing them
+    on the way to disk for the outline cache. Returns (filenames, hashes).
+    """
     # Clear old files in input dir
-    for f in INPUT_DIR.glob("*"):
+    input_dir.mkdir(parents=True, exist_ok=True)
+    for f in input_dir.glob("*"):
         f.unlink()
 
-    # Save uploaded PDF files
     uploaded_files = []
+    file_hashes = {}
     for file in files:
         if not file.filename.lower().endswith('.pdf'):
             logging.warning(f"⛔ Skipping non-PDF file: {file.filename}")
             continue
-        dest = INPUT_DIR / file.filename
-        with open(dest, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        dest = input_dir / file.filename
+        file_hashes[file.filename] = save_and_hash(file.file, dest)
+        pdf_hashes.remember(dest, file_hashes[file.filename])
         uploaded_files.append(file.filename)
+    return uploaded_files, file_hashes
 
-    if not uploaded_files:
-        return JSONResponse(status_code=400, content={"error": "No PDF files uploaded."})
-
-    logging.info(f"✅ Uploaded PDF files: {uploaded_files}")
-
-    # Run Stage 1 script (heading_extractor.py) once per uploaded PDF
-    stage1_output_dir = OUTPUT_DIR / "1a_outlines"
+def reset_stage1_outputs(stage1_output_dir=INTERMEDIATE_DIR):
+    """Clears previous Stage 1 JSON outputs (and their embeddings) to avoid mixing stale data."""
     stage1_output_dir.mkdir(parents=True, exist_ok=True)
-
-    # Clear previous JSON outputs to avoid mixing stale data
-    for old_json in stage1_output_dir.glob("*.json"):
+    stale = list(stage1_output_dir.glob("*.json")) + list(stage1_output_dir.glob(f"*{SIDECAR_SUFFIX}"))
+    for old_json in stale:
         try:
             old_json.unlink()
         except Exception as del_exc:
             logging.warning(f"[WARN] Could not delete old output {old_json}: {del_exc}")
+    return stage1_output_dir
 
-    script_path = BASE_DIR / "heading_extractor.py"
-    logging.info(f"[DEBUG] Checking if script exists: {script_path.exists()}")
-    if not script_path.exists():
-        logging.error(f"[ERROR] {script_path} not found")
-        raise FileNotFoundError(f"{script_path} not found")
+def make_pdf_url(filename, base_url, workspace_id=None):
+    url = f"{base_url.rstrip('/')}/pdfs/{urllib.parse.quote(filename)}"
+    if workspace_id and workspace_id != "default":
+        url += f"?workspace_id={urllib.parse.quote(workspace_id)}"
+    logging.info(f"[DEBUG] Constructed PDF URL: {url}")
+    return url
 
-    failures = []
+@app.api_route("/pdfs/{filename}", methods=["GET", "HEAD"])
+def serve_pdf(request: Request, filename: str, workspace: Workspace = Depends(find_workspace)):
+    """
+    Serves an uploaded PDF from the workspace's input dir with Range/206,
+    content-hash ETags and If-None-Match, streaming it in constant memory.
+    """
+    path = workspace.input_dir / filename
+    if Path(filename).name != filename or not filename.lower().endswith(".pdf") or not path.is_file():
+        return JSONResponse(status_code=404, content={"error": "PDF not found"})
+    return serve_file(request, path, pdf_hashes, media_type="application/pdf", filename=filename)
+
+def describe_document(data, original_name, base_url, cache, workspace_id=None):
+    """Adds the fields the frontend and Stage 2 expect to a Stage 1 outline dict."""
+    if isinstance(data, dict):
+        # Ensure original filename is present for Stage 2
+        data.setdefault('document', original_name)
+        data.setdefault('filename', original_name)
+        # Optional: add a derived PDF URL
+        data['pdf_url'] = make_pdf_url(original_name, base_url, workspace_id)
+        data['cache'] = cache
+    return data
+
+def run_stage1(uploaded_files, file_hashes, input_dir, stage1_output_dir, base_url, on_event=None,
+               workspace_id=None):
+    """
+    Blocking Stage 1 for a set of saved PDFs: cache hits are copied, misses run
+    on the extraction pool. Returns (documents, failures). on_event, if given,
+    receives a file_done event as each file finishes.
+    """
+    total = len(uploaded_files)
+    completed = 0
+
+    def report(fname, status, cache):
+        nonlocal completed
+        completed += 1
+        if on_event is not None:
+            on_event({"event": "file_done", "file": fname, "status": status, "cache": cache,
+                      "completed": completed, "total": total})
+
+    # Stage 2 expects files named '<stem>.json' in the rich sections dir.
+    # Outlines already in the cache are copied there; only misses are extracted.
+    cache_status = {}
+    jobs = []
     for fname in uploaded_files:
-        input_pdf = INPUT_DIR / fname
-        # Stage 2 expects files named '<stem>.json' in the rich sections dir
         out_path = stage1_output_dir / f"{Path(fname).stem}.json"
-        cmd = [
-            sys.executable,
-            str(script_path),
-            str(input_pdf),
-            "-o",
-            str(out_path),
-        ]
-        logging.info(f"🚀 Running Stage 1 for: {fname}")
-        logging.info(f"[DEBUG] Subprocess command: {cmd}")
-        try:
-            result = subprocess.run(
-                cmd,
-                cwd=str(BASE_DIR),
-                capture_output=True,
-                text=True,
-                env=os.environ.copy(),
-            )
-        except Exception as sub_exc:
-            logging.error(f"[ERROR] Exception during subprocess for {fname}: {sub_exc}")
-            logging.error(traceback.format_exc())
-            failures.append({
-                "file": fname,
-                "exception": str(sub_exc),
-                "traceback": traceback.format_exc(),
-            })
+        if outline_cache.get(file_hashes[fname], out_path):
+            logging.info(f"⚡ Outline cache hit for {fname}")
+            metrics.STAGE1_DOCUMENTS.inc(status="cache_hit")
+            cache_status[fname] = "hit"
+            report(fname, "ok", "hit")
+        else:
+            cache_status[fname] = "miss"
+            jobs.append((input_dir / fname, out_path))
+
+    results = []
+    if jobs:
+        logging.info(f"🚀 Running Stage 1 for {len(jobs)} file(s) on the extraction pool")
+        results = extraction_pool.run_batch(
+            jobs, on_result=lambda result: report(result["file"], result["status"], "miss"))
+
+    failures = []
+    for (_, out_path), result in zip(jobs, results):
+        fname = result["file"]
+        if result["status"] == "ok":
+            logging.info(f"✅ Stage 1 finished for {fname} in {result['elapsed']:.2f}s")
+            try:
+                outline_cache.put(file_hashes[fname], out_path)
+            except Exception as cache_exc:
+                logging.warning(f"[WARN] Could not cache outline for {fname}: {cache_exc}")
             continue
+        logging.error(f"❌ Stage 1 failed for {fname}: {result.get('error') or result.get('exception')}")
+        if result.get("traceback"):
+            logging.error(result["traceback"])
+        failures.append({k: v for k, v in result.items() if k not in ("status", "elapsed")})
+
+    # Load Stage 1 output JSON(s)
+    # Map stem -> original uploaded filename
+    name_map = {Path(n).stem: n for n in uploaded_files}
+    documents = []
+    for path in stage1_output_dir.glob("*.json"):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        stem = path.stem
+        original_name = name_map.get(stem, f"{stem}.pdf")
+        documents.append(describe_document(
+            data, original_name, base_url, cache_status.get(original_name, "miss"), workspace_id))
+    return documents, failures
+
+def index_stage1_outputs(stage1_output_dir, documents):
+    """
+    Adds fresh outlines to the workspace's BM25 index, starts their
+    background embedding and records its status on each document.
+    """
+    paths = [stage1_output_dir / f"{Path(doc['filename']).stem}.json" for doc in documents]
+    try:
+        index_outlines(stage1_output_dir, paths)
+    except Exception as exc:
+        # /analyze/ and /explain/ index whatever is missing on their own.
+        logging.warning(f"[WARN] Could not update the lexical index: {exc}")
+    ingest_embedder.submit(paths)
+    for doc, path in zip(documents, paths):
+        doc['embeddings'] = ingest_embedder.status(path)
+
+def stage1_into_workspace(files, workspace, base_url):
+    """
+    Saves the uploads into a workspace and runs Stage 1 there, holding the
+    workspace lock so two uploads to the same workspace don't interleave.
+    Returns (uploaded_files, documents, failures).
+    """
+    with workspace_manager.in_use(workspace), workspace.lock:
+        uploaded_files, file_hashes = save_uploaded_pdfs(files, workspace.input_dir)
+        if not uploaded_files:
+            return uploaded_files, [], []
+        logging.info(f"✅ Uploaded PDF files: {uploaded_files}")
+        # Run Stage 1 (heading_extractor.extract_outline) once per uploaded PDF
+        stage1_output_dir = reset_stage1_outputs(workspace.outlines_dir)
+        documents, failures = run_stage1(
+            uploaded_files, file_hashes, workspace.input_dir, stage1_output_dir, base_url,
+            workspace_id=workspace.id)
+        index_stage1_outputs(stage1_output_dir, documents)
+    return uploaded_files, documents, failures
+
+@app.post("/upload/")
+async def upload_files(request: Request, files: list[UploadFile] = File(...),
+                       workspace: Workspace = Depends(get_workspace)):
+    """
+    Upload only PDF files, then run Stage 1 only.
+    """
+    logging.info("📥 Upload request received (PDFs only)")
 
-        logging.info(f"✅ Subprocess finished for {fname}")
-        logging.info(f"📤 STDOUT ({fname}):\n{result.stdout}")
-        logging.info(f"📥 STDERR ({fname}):\n{result.stderr}")
-        logging.info(f"[DEBUG] Return code ({fname}): {result.returncode}")
-        if result.returncode != 0:
-            logging.error(f"❌ Stage 1 failed for {fname} with code {result.returncode}")
-            failures.append({
-                "file": fname,
-                "returncode": result.returncode,
-                "stderr": result.stderr,
-                "stdout": result.stdout,
-            })
+    # The pool call blocks until the batch is done, so keep it off the event loop.
+    uploaded_files, outputs, failures = await run_in_threadpool(
+        stage1_into_workspace, files, workspace, str(request.base_url))
+    if not uploaded_files:
+        return JSONResponse(status_code=400, content={"error": "No PDF files uploaded."})
 
     if failures and len(failures) == len(uploaded_files):
         # All failed → return error details
@@ -135,89 +314,156 @@ async def upload_files(request: Request, files: list[UploadFile] = File(...)):
             "details": failures,
         })
 
-    # Load Stage 1 output JSON(s)
-    output_json_files = list(stage1_output_dir.glob("*.json"))
-    if output_json_files:
-        # Map stem -> original uploaded filename
-        name_map = {Path(n).stem: n for n in uploaded_files}
-        outputs = []
-        for path in output_json_files:
-            with open(path, encoding="utf-8") as f:
-                data = json.load(f)
-            stem = path.stem
-            original_name = name_map.get(stem, f"{stem}.pdf")
-            # Ensure original filename is present for Stage 2
-            if isinstance(data, dict):
-                data.setdefault('document', original_name)
-                data.setdefault('filename', original_name)
-                # Optional: add a derived PDF URL
-                def make_pdf_url(filename, request):
-                    base_url = str(request.base_url).rstrip('/')
-                    url = f"{base_url}/pdfs/{urllib.parse.quote(filename)}"
-                    logging.info(f"[DEBUG] Constructed PDF URL: {url}")
-                    return url
-                data['pdf_url'] = make_pdf_url(original_name, request)
-            outputs.append(data)
+    if outputs:
         return outputs
     else:
-        logging.warning(f"[WARNING] No Stage 1 output JSONs found in: {stage1_output_dir}")
+        logging.warning(f"[WARNING] No Stage 1 output JSONs found in: {workspace.outlines_dir}")
         return {"status": "done", "message": "Stage 1 complete, but no output files found."}
 
 # ------------------ Stage 2+ Features (Merged from features.py) ------------------
 # Keep the old Stage 1 route available at /upload/ (above), and expose a namespaced
 # alias at /stage1/upload/ to match the frontend expectations.
 @app.post("/stage1/upload/")
-async def stage1_upload(request: Request, files: list[UploadFile] = File(...)):
-    return await upload_files(request, files)
-
-def run_script(script_name, output_file=None, args=None):
-    """Run a Python script and optionally return JSON output.
-    script_name: file name of the script in the same directory.
-    output_file: Path object for expected JSON output to return.
-    args: list of additional CLI arguments to pass to the script.
+async def stage1_upload(request: Request, files: list[UploadFile] = File(...),
+                        workspace: Workspace = Depends(get_workspace)):
+    return await upload_files(request, files, workspace)
+
+def ndjson(event):
+    return json.dumps(event, ensure_ascii=False) + "\n"
+
+def hold_workspace(workspace):
+    """Marks a workspace in use and takes its lock; closing the returned stack releases both."""
+    hold = ExitStack()
+    hold.enter_context(workspace_manager.in_use(workspace))
+    hold.enter_context(workspace.lock)
+    return hold
+
+def stream_stage1(uploaded_files, file_hashes, workspace, base_url, hold=None):
     """
-    cmd = [sys.executable, str(BASE_DIR / script_name)]
-    if args:
-        cmd.extend(map(str, args))
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        return {"status": "error", "stderr": result.stderr}
-    
-    if output_file and output_file.exists():
-        with open(output_file, "r", encoding="utf-8") as f:
-            return {"status": "success", "data": json.load(f)}
-    
-    return {"status": "success", "stdout": result.stdout}
+    Runs Stage 1 file by file on the extraction pool and yields NDJSON events
+    as they happen:
+    file_start, title, page, section, file_done / file_error, and a final done.
+    Outputs are still written to the workspace's 1a_outlines for Stage 2.
+    `hold` (from hold_workspace) is released once the stream ends or is abandoned.
+    """
+    with hold or ExitStack():
+        yield from _stream_stage1(uploaded_files, file_hashes, workspace, base_url)
+
+def _stream_stage1(uploaded_files, file_hashes, workspace, base_url):
+    stage1_output_dir = workspace.outlines_dir
+    total = len(uploaded_files)
+    failures = []
+    for index, fname in enumerate(uploaded_files):
+        out_path = stage1_output_dir / f"{Path(fname).stem}.json"
+        cache_hit = outline_cache.get(file_hashes[fname], out_path)
+        yield ndjson({"event": "file_start", "file": fname, "index": index, "total": total,
+                      "cache": "hit" if cache_hit else "miss"})
+
+        if cache_hit:
+            metrics.STAGE1_DOCUMENTS.inc(status="cache_hit")
+            with open(out_path, encoding="utf-8") as f:
+                data = json.load(f)
+            yield ndjson({"event": "title", "file": fname, "title": data.get("title")})
+            for section in data.get("outline", []):
+                yield ndjson({"event": "section", "file": fname, "section": section})
+        else:
+            logging.info(f"🚀 Streaming Stage 1 for: {fname}")
+            result = None
+            for event in extraction_pool.stream(workspace.input_dir / fname, out_path):
+                if event["event"] == "result":
+                    result = event["result"]
+                elif event["event"] != "error":  # reported below as file_error
+                    yield ndjson({**event, "file": fname})
+            if result["status"] != "ok":
+                logging.error(f"❌ Stage 1 failed for {fname}: {result.get('error') or result.get('exception')}")
+                if result.get("traceback"):
+                    logging.error(result["traceback"])
+                failure = {k: v for k, v in result.items() if k not in ("status", "elapsed")}
+                failures.append(failure)
+                yield ndjson({"event": "file_error", **failure})
+                continue
+            logging.info(f"✅ Stage 1 finished for {fname} in {result['elapsed']:.2f}s")
+            with open(out_path, encoding="utf-8") as f:
+                data = json.load(f)
+            try:
+                outline_cache.put(file_hashes[fname], out_path)
+            except Exception as cache_exc:
+                logging.warning(f"[WARN] Could not cache outline for {fname}: {cache_exc}")
+
+        document = describe_document(data, fname, base_url, "hit" if cache_hit else "miss", workspace.id)
+        index_stage1_outputs(stage1_output_dir, [document])
+        yield ndjson({"event": "file_done", "file": fname, "index": index, "total": total, "document": document})
+
+    yield ndjson({"event": "done", "files": total, "failures": failures})
+
+@app.post("/stage1/upload/stream")
+async def stage1_upload_stream(request: Request, files: list[UploadFile] = File(...),
+                               workspace: Workspace = Depends(get_workspace)):
+    """
+    Same as /stage1/upload/, but returns newline-delimited JSON events so the
+    client sees progress and the first outline sections while extraction runs.
+    """
+    logging.info("📥 Streaming upload request received (PDFs only)")
+    # Held like /upload/ does, but until the stream finishes rather than the request handler.
+    hold = await run_in_threadpool(hold_workspace, workspace)
+    try:
+        uploaded_files, file_hashes = await run_in_threadpool(save_uploaded_pdfs, files, workspace.input_dir)
+        if not uploaded_files:
+            hold.close()
+            return JSONResponse(status_code=400, content={"error": "No PDF files uploaded."})
+        reset_stage1_outputs(workspace.outlines_dir)
+    except BaseException:
+        hold.close()
+        raise
+    # A sync generator is iterated in the threadpool, so extraction doesn't block the loop.
+    return StreamingResponse(
+        stream_stage1(uploaded_files, file_hashes, workspace, str(request.base_url), hold),
+        media_type="application/x-ndjson",
+    )
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    """Prometheus scrape endpoint: stage timings, throughput and RSS histograms."""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/cache/outlines/")
+def outline_cache_stats():
+    """Reports the Stage 1 outline cache contents, size budget and hit/miss counts."""
+    return outline_cache.stats()
+
+@app.delete("/cache/outlines/")
+def purge_outline_cache():
+    """Removes every cached Stage 1 outline."""
+    return {"status": "purged", "removed": outline_cache.purge()}
 
 @app.get("/summary/")
-def run_summary():
-    return run_script("summary.py", OUTPUT_DIR / "summary.json")
+async def run_summary(workspace: Workspace = Depends(find_workspace)):
+    with workspace_manager.in_use(workspace):
+        return await services.summarize(workspace.outlines_dir)
 
 @app.get("/documents/")
-def list_stage1_documents():
+def list_stage1_documents(workspace: Workspace = Depends(find_workspace)):
     """
-    Lists available Stage 1 outline files from output/1a_outlines as document entries.
-    Returns a list of { filename, title } objects where filename is inferred as '<stem>.pdf'.
+    Lists available Stage 1 outline files from the workspace's 1a_outlines as document entries.
+    Returns a list of { filename, title, embeddings } objects where filename is inferred as
+    '<stem>.pdf' and embeddings is the ingest-time embedding status (ready, pending, running, error, off).
     """
-    outlines = OUTPUT_DIR / "1a_outlines"
+    outlines = workspace.outlines_dir
     docs = []
     if outlines.exists():
         for p in sorted(outlines.glob("*.json")):
             stem = p.stem
-            docs.append({"filename": f"{stem}.pdf", "title": stem})
+            docs.append({"filename": f"{stem}.pdf", "title": stem, "embeddings": ingest_embedder.status(p)})
     return {"documents": docs}
 
-@app.post("/analyze/")
-async def run_analyze(config: UploadFile = File(...)):
+def run_analysis(contents, config_path, rich_sections_dir, output_dir):
     """
-    Accepts a JSON config file from the frontend, saves it as input/challenge1b_input.json,
-    then runs analyze_collection() directly against Stage 1 outputs in output/1a_outlines.
+    Blocking body of /analyze/: saves the config bytes to config_path, fills in
+    the documents list from rich_sections_dir if it is missing, then runs
+    analyze_collection() and returns the response dict.
     """
     # 1) Save uploaded config
-    input_dir = BASE_DIR / "input"
-    input_dir.mkdir(parents=True, exist_ok=True)
-    config_path = input_dir / "challenge1b_input.json"
-    contents = await config.read()
+    config_path.parent.mkdir(parents=True, exist_ok=True)
     with open(config_path, "wb") as f:
         f.write(contents)
 
@@ -230,7 +476,7 @@ async def run_analyze(config: UploadFile = File(...)):
         cfg = {}
     docs = cfg.get("documents")
     if not isinstance(docs, list) or len(docs) == 0:
-        outlines = OUTPUT_DIR / "1a_outlines"
+        outlines = rich_sections_dir
         auto_docs = []
         if outlines.exists():
             for p in sorted(outlines.glob("*.json")):
@@ -244,8 +490,6 @@ async def run_analyze(config: UploadFile = File(...)):
     # 2) Run analysis programmatically to avoid relying on CLI defaults
     try:
         from analyze_collections import analyze_collection
-        rich_sections_dir = OUTPUT_DIR / "1a_outlines"
-        output_dir = OUTPUT_DIR
         output_dir.mkdir(parents=True, exist_ok=True)
         analyze_collection(
             input_config_path=config_path,
@@ -255,22 +499,167 @@ async def run_analyze(config: UploadFile = File(...)):
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
-    out_file = OUTPUT_DIR / "challenge1b_output.json"
+    out_file = output_dir / "challenge1b_output.json"
     if out_file.exists():
         with open(out_file, "r", encoding="utf-8") as f:
             return {"status": "success", "data": json.load(f)}
     return {"status": "error", "message": "Analysis did not produce output."}
 
+def run_analysis_in_workspace(contents, workspace):
+    # Under the workspace lock, like Stage 1 uploads: concurrent /analyze/ calls
+    # would otherwise overwrite each other's input config and output files.
+    with workspace_manager.in_use(workspace), workspace.lock:
+        return run_analysis(contents, workspace.input_dir / "challenge1b_input.json",
+                            workspace.outlines_dir, workspace.output_dir)
+
+@app.post("/analyze/")
+async def run_analyze(config: UploadFile = File(...), workspace: Workspace = Depends(get_workspace)):
+    """
+    Accepts a JSON config file from the frontend, saves it as input/challenge1b_input.json,
+    then runs analyze_collection() directly against Stage 1 outputs in output/1a_outlines
+    (both inside the caller's workspace).
+    """
+    contents = await config.read()
+    # Model loading and encoding block, so run them off the event loop.
+    return await run_in_threadpool(run_analysis_in_workspace, contents, workspace)
+
 @app.get("/explain/")
-async def run_explain(topic: str = ""):
-    # Sanitize topic for filename so we can safely write the output file
-    safe_topic = re.sub(r'[^A-Za-z0-9._-]+', '_', topic).strip('_') or 'topic'
-    out_path = OUTPUT_DIR / f"explain_{safe_topic}.json"
-    return run_script(
-        "explain.py",
-        output_file=out_path,
-        args=["--topic", topic, "--out", str(out_path)]
-    )
+async def run_explain(topic: str = "", workspace: Workspace = Depends(find_workspace)):
+    with workspace_manager.in_use(workspace):
+        return await services.explain(topic, workspace.outlines_dir)
+
+# ------------------ JOBS ------------------
+def publish_stage1(input_dir, stage1_output_dir, workspace):
+    """Makes a finished Stage 1 job's PDFs and outlines the workspace's current set."""
+    with workspace.lock:
+        reset_stage1_outputs(workspace.outlines_dir)
+        for target, source, pattern in ((workspace.input_dir, input_dir, "*"),
+                                        (workspace.outlines_dir, stage1_output_dir, "*.json")):
+            for old in target.glob(pattern):
+                old.unlink()
+            for path in source.glob(pattern):
+                shutil.copy2(path, target / path.name)
+
+def stage1_job(job, base_url, workspace):
+    """Job handler: Stage 1 in the job's own directory, then publish the results."""
+    uploaded_files, file_hashes = job.payload
+    input_dir = job.dir / "input"
+    stage1_output_dir = job.dir / "1a_outlines"
+    stage1_output_dir.mkdir(parents=True, exist_ok=True)
+    with workspace_manager.in_use(workspace):
+        documents, failures = run_stage1(
+            uploaded_files, file_hashes, input_dir, stage1_output_dir, base_url, on_event=job.emit,
+            workspace_id=workspace.id)
+        if failures and len(failures) == len(uploaded_files):
+            raise RuntimeError("Stage 1 failed for all files: " + "; ".join(
+                f"{f['file']}: {f.get('error') or f.get('exception')}" for f in failures))
+        publish_stage1(input_dir, stage1_output_dir, workspace)
+        index_stage1_outputs(workspace.outlines_dir, documents)
+    return {"documents": documents, "failures": failures}
+
+def analyze_job(job, contents, workspace):
+    """Job handler: /analyze/ against a snapshot of the workspace's Stage 1 outlines."""
+    rich_sections_dir = job.dir / "1a_outlines"
+    rich_sections_dir.mkdir(parents=True, exist_ok=True)
+    with workspace_manager.in_use(workspace), workspace.lock:
+        for pattern in ("*.json", f"*{SIDECAR_SUFFIX}", str(LEXICAL_INDEX_PATH)):
+            for path in workspace.outlines_dir.glob(pattern):
+                target = rich_sections_dir / path.relative_to(workspace.outlines_dir)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(path, target)
+    job.emit({"event": "progress", "stage": "analyze", "documents": len(list(rich_sections_dir.glob("*.json")))})
+    try:
+        response = run_analysis(contents, job.dir / "challenge1b_input.json", rich_sections_dir, job.dir)
+    finally:
+        # The snapshot is never searched again; don't keep its index loaded.
+        forget_index(rich_sections_dir)
+    if response["status"] != "success":
+        raise RuntimeError(response.get("message", "Analysis failed"))
+    return response["data"]
+
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    request: Request,
+    kind: str = Form("stage1"),
+    priority: int = Form(0),
+    files: list[UploadFile] = File(None),
+    config: UploadFile = File(None),
+    workspace: Workspace = Depends(get_workspace),
+):
+    """
+    Queues Stage 1 (kind=stage1, PDF `files`) or analysis (kind=analyze, JSON
+    `config`) and returns the job id at once. Lower priority numbers run first.
+    Poll GET /jobs/{id} or follow /jobs/{id}/events (SSE) for progress.
+    """
+    try:
+        if kind == "stage1":
+            if not files:
+                return JSONResponse(status_code=400, content={"error": "No PDF files uploaded."})
+
+            def prepare(job):
+                saved = save_uploaded_pdfs(files, job.dir / "input")
+                if not saved[0]:
+                    raise ValueError("No PDF files uploaded.")
+                return saved
+
+            job = await job_scheduler.submit(
+                kind, stage1_job, str(request.base_url), workspace, priority=priority, prepare=prepare)
+        elif kind == "analyze":
+            if config is None:
+                return JSONResponse(status_code=400, content={"error": "No config file uploaded."})
+            job = await job_scheduler.submit(kind, analyze_job, await config.read(), workspace, priority=priority)
+        else:
+            return JSONResponse(status_code=400, content={"error": f"Unknown job kind: {kind}"})
+    except ValueError as exc:
+        return JSONResponse(status_code=400, content={"error": str(exc)})
+    except QueueFull as exc:
+        return JSONResponse(status_code=429, content={"error": str(exc)})
+
+    logging.info(f"🗂️ Queued {kind} job {job.id} (priority {priority})")
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "position": job_scheduler.position(job),
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events",
+    }
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_scheduler.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Unknown job id"})
+    return job.describe(job_scheduler.position(job))
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """
+    Server-sent events for a job: every status change and progress event,
+    replayed from the start (or after Last-Event-ID), until the job finishes.
+    """
+    job = job_scheduler.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Unknown job id"})
+    try:
+        seen = int(request.headers.get("last-event-id", -1)) + 1
+    except ValueError:
+        seen = 0
+
+    async def stream():
+        nonlocal seen
+        while True:
+            while seen < len(job.events):
+                event = job.events[seen]
+                yield f"id: {seen}\nevent: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+                seen += 1
+            if job.status in TERMINAL_STATES or await request.is_disconnected():
+                return
+            await job.wait_for_events(seen, timeout=15)
+            if seen == len(job.events):
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # ------------------ ROOT ------------------
 @app.get("/", include_in_schema=False)
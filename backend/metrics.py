@@ -0,0 +1,217 @@
+# metrics.py - Lightweight timers, counters and histograms in Prometheus text format
+#
+# Recording an observation is a lock plus a few additions; nothing is formatted
+# until /metrics is scraped. Work done in extraction worker processes is
+# shipped back with each result as a snapshot and merged here.
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+RSS_MB_BUCKETS = (64, 128, 256, 384, 512, 768, 1024, 1536, 2048, 4096)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _label_str(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _drain(self):
+        with self._lock:
+            values, self._values = self._values, {}
+        return [[list(k), v] for k, v in values.items()]
+
+    def _merge(self, items):
+        with self._lock:
+            for key, value in items:
+                key = tuple(key)
+                self._values[key] = self._values.get(key, 0) + value
+
+    def _render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}_total{self._label_str(k)} {v}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, plus +Inf, then sum and count.
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _drain(self):
+        with self._lock:
+            values, self._values = self._values, {}
+        return [[list(k), v] for k, v in values.items()]
+
+    def _merge(self, items):
+        with self._lock:
+            for key, (counts, total, count) in items:
+                key = tuple(key)
+                state = self._values.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0, 0])
+                for i, c in enumerate(counts):
+                    state[0][i] += c
+                state[1] += total
+                state[2] += count
+
+    def _render(self):
+        with self._lock:
+            items = sorted((k, [list(s[0]), s[1], s[2]]) for k, s in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append(f"{self.name}_bucket{self._label_str(key, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_str(key)} {total}")
+            lines.append(f"{self.name}_count{self._label_str(key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._gauges = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def gauge(self, name, help_text, func):
+        """A gauge whose value is read from func() only when scraped."""
+        self._gauges[name] = (help_text, func)
+
+    def drain(self):
+        """Takes and resets everything recorded so far, as a JSON-able snapshot."""
+        return {name: metric._drain() for name, metric in self._metrics.items()}
+
+    def merge(self, snapshot):
+        for name, items in (snapshot or {}).items():
+            metric = self._metrics.get(name)
+            if metric is not None and items:
+                metric._merge(items)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric._render())
+        for name, (help_text, func) in self._gauges.items():
+            try:
+                value = func()
+            except Exception:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def histogram(name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, help_text, labelnames, buckets))
+
+
+def counter(name, help_text, labelnames=()):
+    return REGISTRY.register(Counter(name, help_text, labelnames))
+
+
+def rss_mb():
+    import psutil
+    return psutil.Process(os.getpid()).memory_info().rss / 1024 / 1024
+
+
+# --- Metrics recorded by the pipeline ---
+STAGE1_PHASE_SECONDS = histogram(
+    "stage1_phase_seconds", "Time spent in each extract_outline phase per document.", ["phase"])
+STAGE1_DOCUMENT_SECONDS = histogram(
+    "stage1_document_seconds", "End-to-end Stage 1 extraction time per document.", ["mode"])
+STAGE1_PAGES_PER_SECOND = histogram(
+    "stage1_pages_per_second", "Stage 1 extraction throughput per document.", buckets=RATE_BUCKETS)
+STAGE1_DOCUMENTS = counter(
+    "stage1_documents", "Stage 1 documents by outcome (ok, error, timeout, cache_hit).", ["status"])
+STAGE1_TABLE_PAGES = counter(
+    "stage1_table_detection_pages", "Pages by table detection outcome (analyzed, skipped by the pre-check).",
+    ["result"])
+ANALYZE_STAGE_SECONDS = histogram(
+    "analyze_stage_seconds", "Time spent in analyze_collection stages (model_load, lexical, encode, rank).", ["stage"])
+ANALYZE_SECTIONS_PER_SECOND = histogram(
+    "analyze_sections_encoded_per_second", "Section texts encoded per second by the embedding model.",
+    buckets=RATE_BUCKETS)
+EXPLAIN_STAGE_SECONDS = histogram(
+    "explain_stage_seconds", "Time spent in explain.py stages (lexical, rerank, summarize).", ["stage"])
+SUMMARY_STAGE_SECONDS = histogram(
+    "summary_stage_seconds", "Time spent in summary stages (model_load, summarize per document).", ["stage"])
+STAGE_RSS_MB = histogram(
+    "stage_rss_megabytes", "Process RSS at the end of each pipeline stage.", ["component"],
+    buckets=RSS_MB_BUCKETS)
+
+REGISTRY.gauge("process_resident_memory_megabytes", "RSS of the API server process.", rss_mb)
+
+
+def record_stage1(timings, elapsed, pages, mode, layout_stats=None):
+    """
+    Records one extracted document's phase timings, latency, throughput and
+    RSS, plus its table detection counts if extract_outline's layout_stats are given.
+    """
+    for phase, seconds in timings.items():
+        STAGE1_PHASE_SECONDS.observe(seconds, phase=phase)
+    if layout_stats:
+        STAGE1_TABLE_PAGES.inc(layout_stats.get("tables_analyzed", 0), result="analyzed")
+        STAGE1_TABLE_PAGES.inc(layout_stats.get("tables_skipped", 0), result="skipped")
+    STAGE1_DOCUMENT_SECONDS.observe(elapsed, mode=mode)
+    if pages and elapsed > 0:
+        STAGE1_PAGES_PER_SECOND.observe(pages / elapsed)
+    STAGE_RSS_MB.observe(rss_mb(), component="stage1")
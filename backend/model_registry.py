@@ -0,0 +1,293 @@
+# model_registry.py - Loads each embedding model once per process and shares it
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+import metrics
+
+BASE_DIR = Path(__file__).parent
+DEFAULT_MODEL = "sentence-transformers/paraphrase-MiniLM-L3-v2"
+# Intra-op threads for torch; 0 means "the CPUs this process may run on",
+# which avoids oversubscription when the host has more cores than the container.
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", 0))
+# torch (fp32), torch-dynamic-int8 (Linear layers quantised at load) or onnxruntime
+# (needs the export made by setup_offline_assets.py, or makes it on first use).
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+BACKENDS = ("torch", "torch-dynamic-int8", "onnxruntime")
+
+MODEL_LOAD_SECONDS = metrics.histogram(
+    "embedding_model_load_seconds", "Time to load an embedding model into the process.", ["model"])
+
+
+def canonical_model_id(name):
+    """'paraphrase-MiniLM-L3-v2' and 'sentence-transformers/paraphrase-MiniLM-L3-v2' are the same model."""
+    return name if "/" in name else f"sentence-transformers/{name}"
+
+
+def model_key(name, backend=None):
+    """
+    Identifies the vectors a model produces: the canonical id for fp32 torch,
+    '<id>@<backend>' otherwise, so caches never mix backends' embeddings.
+    """
+    backend = backend or EMBEDDING_BACKEND
+    model_id = canonical_model_id(name)
+    return model_id if backend == "torch" else f"{model_id}@{backend}"
+
+
+def cache_folders():
+    """
+    Where setup_offline_assets.py may have put the models, in lookup order:
+    SENTENCE_TRANSFORMERS_HOME (the Docker image sets /app/model_cache), the
+    backend's model_cache/ (the script's default), then the user cache.
+    """
+    folders = [
+        os.getenv("SENTENCE_TRANSFORMERS_HOME"),
+        BASE_DIR / "model_cache",
+        Path.home() / ".cache" / "sentence_transformers",
+    ]
+    seen = []
+    for folder in folders:
+        if folder and Path(folder) not in seen:
+            seen.append(Path(folder))
+    return seen
+
+
+def onnx_dir(model_id, folder=None):
+    return Path(folder or cache_folders()[0]) / "onnx" / model_id
+
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def configure_torch_threads(num_threads=None):
+    import torch
+    num_threads = num_threads or TORCH_NUM_THREADS or available_cpus()
+    if torch.get_num_threads() != num_threads:
+        torch.set_num_threads(num_threads)
+    return num_threads
+
+
+def parameter_megabytes(model):
+    if isinstance(model, OnnxEmbedder):
+        return model.size_mb()
+    total = sum(p.numel() * p.element_size() for p in model.parameters())
+    # Dynamically quantised Linear layers keep their int8 weights outside parameters().
+    for module in model.modules():
+        if hasattr(module, "_packed_params"):
+            weight, bias = module._packed_params._weight_bias()
+            total += weight.numel() * weight.element_size() + (bias.numel() * 4 if bias is not None else 0)
+    return total / 1024 / 1024
+
+
+def load_sentence_transformer(model_id):
+    """The fp32 torch model, from the first cache folder that has it."""
+    from sentence_transformers import SentenceTransformer
+    errors = []
+    for folder in cache_folders():
+        # setup_offline_assets.py saves a full copy at <cache>/<model id>; load it without the hub.
+        saved = folder / model_id
+        source = str(saved) if (saved / "modules.json").exists() else model_id
+        try:
+            return SentenceTransformer(source, cache_folder=str(folder)), source
+        except Exception as exc:
+            errors.append(f"{folder}: {exc}")
+            logging.warning(f"[WARN] Could not load {model_id} from {folder}: {exc}")
+    raise RuntimeError(f"Could not load embedding model {model_id}: " + "; ".join(errors))
+
+
+def quantize_dynamic_int8(model):
+    """int8 weights and dynamically quantised activations for every Linear layer."""
+    import torch
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _require(module, purpose):
+    """Imports an optional dependency, or raises an ImportError naming the package to install."""
+    import importlib
+    try:
+        return importlib.import_module(module)
+    except ImportError as exc:
+        raise ImportError(f"{purpose} needs the '{module}' package "
+                          f"(pip install -r requirements-onnx.txt)") from exc
+
+
+def export_onnx(model_id, out_dir=None):
+    """
+    Exports the transformer of a cached SentenceTransformer to ONNX, with
+    its tokenizer and pooling settings, for OnnxEmbedder. Runs offline.
+    """
+    import torch
+    from sentence_transformers.models import Normalize, Pooling
+    # torch.onnx.export imports onnx lazily; check up front for a clear error.
+    _require("onnx", "ONNX export")
+    model, _ = load_sentence_transformer(model_id)
+    out_dir = Path(out_dir or onnx_dir(model_id))
+    out_dir.mkdir(parents=True, exist_ok=True)
+    transformer = model[0]
+    tokenizer = transformer.tokenizer
+    sample = tokenizer(["passage: an example sentence"], return_tensors="pt", padding=True)
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    transformer.auto_model.eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer.auto_model, tuple(sample[name] for name in input_names), str(out_dir / "model.onnx"),
+            input_names=input_names, output_names=["last_hidden_state"], dynamic_axes=dynamic,
+            opset_version=14)
+    tokenizer.save_pretrained(str(out_dir))
+    pooling = next(m for m in model if isinstance(m, Pooling))
+    config = {
+        "model": model_id,
+        "max_seq_length": model.max_seq_length,
+        "pooling": "cls" if pooling.pooling_mode_cls_token else "mean",
+        "normalize": any(isinstance(m, Normalize) for m in model),
+    }
+    (out_dir / "embedder.json").write_text(json.dumps(config, indent=2))
+    logging.info(f"📦 Exported {model_id} to ONNX at {out_dir}")
+    return out_dir
+
+
+class OnnxEmbedder:
+    """
+    Runs an exported MiniLM under onnxruntime and mirrors the parts of
+    SentenceTransformer.encode the pipelines use (str or list input, numpy
+    output, batch_size).
+    """
+
+    def __init__(self, path, num_threads=None):
+        onnxruntime = _require("onnxruntime", "EMBEDDING_BACKEND=onnxruntime")
+        from transformers import AutoTokenizer
+        self.path = Path(path)
+        self.config = json.loads((self.path / "embedder.json").read_text())
+        self.tokenizer = AutoTokenizer.from_pretrained(str(self.path))
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = num_threads or TORCH_NUM_THREADS or available_cpus()
+        self.session = onnxruntime.InferenceSession(
+            str(self.path / "model.onnx"), options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    @property
+    def max_seq_length(self):
+        return self.config["max_seq_length"]
+
+    def size_mb(self):
+        return (self.path / "model.onnx").stat().st_size / 1024 / 1024
+
+    def _encode_batch(self, texts):
+        encoded = self.tokenizer(texts, padding=True, truncation=True,
+                                 max_length=self.max_seq_length, return_tensors="np")
+        feeds = {name: encoded[name].astype(np.int64) for name in self.input_names if name in encoded}
+        hidden = self.session.run(["last_hidden_state"], feeds)[0]
+        if self.config["pooling"] == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.config["normalize"]:
+            pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.astype(np.float32)
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, convert_to_numpy=True,
+               convert_to_tensor=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        # Longest first, like SentenceTransformer, so batches pad little.
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        out = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            for i, vector in zip(batch, self._encode_batch([texts[i] for i in batch])):
+                out[i] = vector
+        embeddings = np.stack(out)
+        return embeddings[0] if single else embeddings
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of embedding models keyed by canonical id and
+    inference backend. The first get() for a model loads it (under a
+    per-model lock, so concurrent requests wait instead of loading twice);
+    later calls return the same instance.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._footprints = {}
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def _lock_for(self, key):
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def get(self, name=DEFAULT_MODEL, backend=None):
+        backend = backend or EMBEDDING_BACKEND
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {BACKENDS}")
+        key = model_key(name, backend)
+        model = self._models.get(key)
+        if model is not None:
+            return model
+        with self._lock_for(key):
+            if key not in self._models:
+                self._models[key] = self._load(canonical_model_id(name), backend, key)
+        return self._models[key]
+
+    def _load(self, model_id, backend, key):
+        threads = configure_torch_threads() if backend != "onnxruntime" else None
+        rss_before = metrics.rss_mb()
+        start = time.perf_counter()
+        if backend == "onnxruntime":
+            path = next((onnx_dir(model_id, folder) for folder in cache_folders()
+                         if (onnx_dir(model_id, folder) / "model.onnx").exists()), None)
+            if path is None:
+                path = export_onnx(model_id)
+            model = OnnxEmbedder(path)
+            source = str(path)
+            threads = model.session.get_session_options().intra_op_num_threads
+        else:
+            model, source = load_sentence_transformer(model_id)
+            if backend == "torch-dynamic-int8":
+                model = quantize_dynamic_int8(model)
+        elapsed = time.perf_counter() - start
+        MODEL_LOAD_SECONDS.observe(elapsed, model=key)
+        self._footprints[key] = {
+            "load_seconds": round(elapsed, 3),
+            "parameters_mb": round(parameter_megabytes(model), 1),
+            "rss_delta_mb": round(metrics.rss_mb() - rss_before, 1),
+            "source": source,
+            "backend": backend,
+            "threads": threads,
+        }
+        logging.info(f"🧠 Loaded {key} in {elapsed:.2f}s "
+                     f"({self._footprints[key]['parameters_mb']} MB weights, "
+                     f"+{self._footprints[key]['rss_delta_mb']} MB RSS, {threads} threads)")
+        return model
+
+    def loaded(self):
+        return dict(self._footprints)
+
+    def memory_mb(self):
+        return sum(f["parameters_mb"] for f in self._footprints.values())
+
+
+models = ModelRegistry()
+metrics.REGISTRY.gauge(
+    "embedding_models_parameter_megabytes", "Parameter memory of the embedding models loaded in this process.",
+    models.memory_mb)
+
+
+def get_model(name=DEFAULT_MODEL, backend=None):
+    return models.get(name, backend)
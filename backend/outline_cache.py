@@ -0,0 +1,122 @@
+# outline_cache.py - Content-addressed cache of Stage 1 outlines
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+
+from heading_extractor import EXTRACTOR_VERSION
+
+BASE_DIR = Path(__file__).parent
+DEFAULT_CACHE_DIR = Path(os.getenv("OUTLINE_CACHE_DIR", BASE_DIR / "cache" / "outlines"))
+DEFAULT_MAX_BYTES = int(os.getenv("OUTLINE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def save_and_hash(src, dest):
+    """
+    Streams an uploaded file object to dest while computing its SHA-256,
+    so the cache key costs no extra pass over the PDF bytes.
+    """
+    digest = hashlib.sha256()
+    with open(dest, "wb") as buffer:
+        while True:
+            chunk = src.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            buffer.write(chunk)
+    return digest.hexdigest()
+
+
+class OutlineCache:
+    """
+    Stores Stage 1 outline JSON files keyed by the PDF's SHA-256 and the
+    extractor version. Entries are evicted least-recently-used first once the
+    total size exceeds the disk budget; file mtimes record recency.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = Path(cache_dir or DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes if max_bytes is not None else DEFAULT_MAX_BYTES
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path(self, sha256):
+        return self.cache_dir / f"{sha256}-v{EXTRACTOR_VERSION}.json"
+
+    def get(self, sha256, dest):
+        """Copies the cached outline to dest. Returns True on a hit."""
+        path = self._path(sha256)
+        with self._lock:
+            try:
+                shutil.copyfile(path, dest)
+                os.utime(path)  # Mark as most recently used.
+            except FileNotFoundError:
+                self.misses += 1
+                return False
+            self.hits += 1
+            return True
+
+    def put(self, sha256, src):
+        """Adds an extracted outline file to the cache, then enforces the budget."""
+        path = self._path(sha256)
+        tmp_path = path.with_suffix(".tmp")
+        with self._lock:
+            shutil.copyfile(src, tmp_path)
+            os.replace(tmp_path, path)
+            self._evict()
+
+    def _entries(self):
+        entries = []
+        for p in self.cache_dir.glob("*.json"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, p in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                p.unlink()
+                total -= size
+                logging.info(f"🧹 Evicted cached outline {p.name}")
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            entries = self._entries()
+            return {
+                "entries": len(entries),
+                "bytes": sum(size for _, size, _ in entries),
+                "max_bytes": self.max_bytes,
+                "extractor_version": EXTRACTOR_VERSION,
+                "hits": self.hits,
+                "misses": self.misses,
+                "items": [
+                    {"key": p.stem, "bytes": size, "last_used": mtime}
+                    for mtime, size, p in sorted(entries, reverse=True)
+                ],
+            }
+
+    def purge(self):
+        with self._lock:
+            removed = 0
+            for _, _, p in self._entries():
+                try:
+                    p.unlink()
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+            return removed
@@ -0,0 +1,61 @@
+# services.py - Warm, in-process summary and explain services for the API
+import asyncio
+import functools
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import explain
+from summary import SummaryService
+
+# Threads serving /summary/ and /explain/; model inference releases the GIL.
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", 2))
+
+
+class WarmServices:
+    """
+    Loads the summary model and the explain dependencies once, at startup,
+    and runs requests on a dedicated thread pool so they neither block the
+    event loop nor pay a new interpreter and model load per call.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or SERVICE_WORKERS
+        self.summary = SummaryService()
+        self._executor = None
+
+    async def start(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="service")
+        await self.run(self._warm)
+
+    def _warm(self):
+        start = time.perf_counter()
+        try:
+            self.summary.load()
+        except Exception as exc:
+            # /summary/ retries the load on first use and reports the error there.
+            logging.warning(f"[WARN] Summary model not loaded at startup: {exc}")
+        logging.info(f"🔥 Summary/explain services warmed in {time.perf_counter() - start:.2f}s")
+
+    async def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def summarize(self, outlines_dir):
+        try:
+            return {"status": "success", "data": await self.run(self.summary.summarize, outlines_dir)}
+        except Exception as exc:
+            logging.error(f"❌ Summary failed: {exc}")
+            return {"status": "error", "error": str(exc)}
+
+    async def explain(self, topic, outlines_dir):
+        result = await self.run(explain.explain_topic, topic, outlines_dir=outlines_dir)
+        if "error" in result:
+            return {"status": "error", "error": result["error"]}
+        return {"status": "success", "data": result}
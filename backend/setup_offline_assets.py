@@ -56,6 +56,15 @@ def download_models():
         logger.error(f"Error downloading embedder: {str(e)}")
         ok = False
 
+    # 2️⃣ Optional ONNX export for EMBEDDING_BACKEND=onnxruntime
+    if ok and (os.getenv('EXPORT_ONNX') == '1' or os.getenv('EMBEDDING_BACKEND') == 'onnxruntime'):
+        try:
+            from model_registry import export_onnx, onnx_dir
+            export_onnx(embedder_name, onnx_dir(embedder_name, cache_dir))
+        except Exception as e:
+            # The torch backends still work; onnxruntime will retry the export on first use.
+            logger.warning(f"ONNX export skipped: {str(e)}")
+
     return ok
 
 def download_nltk_data():
@@ -2,28 +2,31 @@ import json
 import glob
 from pathlib import Path
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from sklearn.metrics.pairwise import cosine_similarity
 import nltk
 import psutil
 import os
 
-# Ensure NLTK sentence tokenizer is available
-nltk.download('punkt', quiet=True)
+import metrics
+from model_registry import DEFAULT_MODEL, get_model
 
-# Load lightweight embedding model
-model = SentenceTransformer('sentence-transformers/paraphrase-MiniLM-L3-v2')
+MODEL_NAME = DEFAULT_MODEL
 
-# Debug: Print memory usage after model load
 process = psutil.Process(os.getpid())
-print(f"[DEBUG] Memory usage after model load: {process.memory_info().rss / 1024 / 1024:.2f} MB")
 
-def extractive_summary(text, num_sentences=2):
+def ensure_punkt():
+    """Downloads the NLTK sentence tokenizer only if it isn't installed yet."""
+    try:
+        nltk.data.find('tokenizers/punkt')
+    except LookupError:
+        nltk.download('punkt', quiet=True)
+
+def extractive_summary(text, model, num_sentences=2):
     """Generate extractive summary by picking most central sentences."""
     sentences = nltk.sent_tokenize(text)
     if len(sentences) <= num_sentences:
         return " ".join(sentences)
-    
+
     embeddings = model.encode(sentences)
     sim_matrix = cosine_similarity(embeddings)
 
@@ -34,7 +37,7 @@ def extractive_summary(text, num_sentences=2):
     ]
     return " ".join(ranked_sentences)
 
-def process_json_file(filepath):
+def process_json_file(filepath, model):
     with open(filepath, 'r', encoding='utf-8') as f:
         data = json.load(f)
 
@@ -46,7 +49,7 @@ def process_json_file(filepath):
     for item in outline:
         heading = item.get("text", "").strip()
         content = item.get("content", "").strip()
-        summary = extractive_summary(content, num_sentences=2)
+        summary = extractive_summary(content, model, num_sentences=2)
         headings_data.append({
             "heading": heading,
             "summary": summary
@@ -58,24 +61,48 @@ def process_json_file(filepath):
         "headings": headings_data
     }
 
-def main():
+class SummaryService:
+    """
+    Holds a reference to the shared embedding model; the API loads it at
+    startup and calls summarize() for each request.
+    """
+
+    def __init__(self):
+        self.model = None
+
+    def load(self):
+        if self.model is not None:
+            return self.model
+        ensure_punkt()
+        with metrics.SUMMARY_STAGE_SECONDS.time(stage="model_load"):
+            # Shared with /analyze/: the registry hands out the same instance.
+            self.model = get_model(MODEL_NAME)
+        return self.model
+
+    def summarize(self, stage1_folder):
+        """Summarizes every outline JSON in stage1_folder and returns the list."""
+        model = self.load()
+        final_output = []
+        for filepath in sorted(Path(stage1_folder).glob("*.json")):
+            print(f"[DEBUG] Summarizing {filepath.name} (memory: {process.memory_info().rss / 1024 / 1024:.2f} MB)")
+            with metrics.SUMMARY_STAGE_SECONDS.time(stage="summarize"):
+                final_output.append(process_json_file(filepath, model))
+        metrics.STAGE_RSS_MB.observe(metrics.rss_mb(), component="summary")
+        return final_output
+
+def main(stage1_folder=None, output_file=None):
     # Detect if running in Docker/Render (deployment) or local
     # If /app exists and is the parent, use /app paths; else use local project paths
     if Path('/app').exists() and str(Path(__file__).parent).startswith('/app'):
-        stage1_folder = Path('/app/output/1a_outlines')
-        output_file = Path('/app/output/summary.json')
+        default_root = Path('/app/output')
     else:
-        stage1_folder = Path(__file__).parent / "output" / "1a_outlines"
-        output_file = Path(__file__).parent / "output" / "summary.json"
+        default_root = Path(__file__).parent / "output"
+    stage1_folder = Path(stage1_folder) if stage1_folder else default_root / "1a_outlines"
+    output_file = Path(output_file) if output_file else default_root / "summary.json"
 
-    process = psutil.Process(os.getpid())
     print(f"[DEBUG] Memory usage before summarization: {process.memory_info().rss / 1024 / 1024:.2f} MB")
 
-    final_output = []
-    for filepath in stage1_folder.glob("*.json"):
-        print(f"[DEBUG] Summarizing {filepath.name} (memory: {process.memory_info().rss / 1024 / 1024:.2f} MB)")
-        final_output.append(process_json_file(filepath))
-        print(f"[DEBUG] Finished {filepath.name} (memory: {process.memory_info().rss / 1024 / 1024:.2f} MB)")
+    final_output = SummaryService().summarize(stage1_folder)
 
     with open(output_file, "w", encoding="utf-8") as f:
         json.dump(final_output, f, ensure_ascii=False, indent=2)
@@ -85,4 +112,9 @@ def main():
     # This script now works both locally and on Render/Docker
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(description="Summarize Stage 1 outlines.")
+    parser.add_argument("--outlines", default=None, help="Directory of Stage 1 outline JSONs")
+    parser.add_argument("--out", default=None, help="Output JSON file path")
+    args = parser.parse_args()
+    main(args.outlines, args.out)
@@ -0,0 +1,46 @@
+# test_embedding_backends.py - Backend and storage-dtype parity with fp32 embeddings
+import numpy as np
+import pytest
+
+from benchmarks.embedding_backends import load_passages, row_cosines
+from embedding_store import pack, unpack
+
+# Same default as `python -m benchmarks.embedding_backends --tolerance`.
+TOLERANCE = 0.99
+
+
+@pytest.fixture(scope="module")
+def reference():
+    pytest.importorskip("torch")
+    pytest.importorskip("sentence_transformers")
+    from model_registry import get_model
+
+    texts = load_passages(None, 64)
+    return texts, get_model(backend="torch").encode(texts, show_progress_bar=False, convert_to_numpy=True)
+
+
+@pytest.mark.parametrize("backend", ["torch-dynamic-int8", "onnxruntime"])
+def test_backend_matches_fp32(reference, backend):
+    if backend == "onnxruntime":
+        pytest.importorskip("onnxruntime")
+    from model_registry import get_model
+
+    texts, expected = reference
+    vectors = get_model(backend=backend).encode(texts, show_progress_bar=False, convert_to_numpy=True)
+    assert row_cosines(vectors, expected).min() >= TOLERANCE
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_pack_unpack_round_trip(dtype):
+    matrix = np.random.default_rng(0).standard_normal((50, 384)).astype(np.float32)
+    stored, scales = pack(matrix, dtype)
+    assert stored.dtype == np.dtype(dtype)
+    assert (scales is not None) == (dtype == "int8")
+    restored = unpack(stored, scales)
+    assert restored.dtype == np.float32 and restored.shape == matrix.shape
+    assert row_cosines(restored, matrix).min() >= TOLERANCE
+
+
+def test_pack_int8_zero_rows():
+    stored, scales = pack(np.zeros((2, 8), dtype=np.float32), "int8")
+    assert np.all(unpack(stored, scales) == 0)
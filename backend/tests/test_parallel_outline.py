@@ -0,0 +1,74 @@
+# test_parallel_outline.py - The sharded visual fallback must match the serial run exactly
+import random
+
+import fitz
+import pytest
+
+import heading_extractor
+from heading_extractor import extract_outline
+
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor".split()
+
+
+def build_pdf(path, pages=12, toc=False, tables=False, header_xobject=False, scanned=False, seed=0):
+    """
+    Manual-like PDF: numbered headings with body text, optional ruled tables,
+    shared header and ToC. With scanned=True every third page is an image only.
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+    header = None
+    if header_xobject:
+        header = fitz.open()
+        header.new_page(width=595, height=40).insert_text((20, 25), "ACME Corp Internal Handbook", fontsize=9)
+    toc_entries = []
+    for i in range(pages):
+        page = doc.new_page()
+        if i == 0:
+            page.insert_text((72, 80), "Synthetic Manual Title", fontsize=22, fontname="hebo")
+        y = 120
+        for s in range(3):
+            heading = f"{i + 1}.{s + 1} Section {i}-{s} topic"
+            page.insert_text((72, y), heading, fontsize=14, fontname="hebo")
+            toc_entries.append([1 if s == 0 else 2, heading, i + 1])
+            y += 20
+            for _ in range(4):
+                page.insert_text((72, y), " ".join(rng.choice(WORDS) for _ in range(10)) + ".", fontsize=10)
+                y += 14
+            y += 10
+        if tables and i % 2 == 0:
+            page.insert_text((72, y + 15), "Table Summary Header", fontsize=11, fontname="hebo")
+            for r in range(4):
+                for c in range(3):
+                    rect = fitz.Rect(72 + c * 120, y + 20 + r * 20, 72 + (c + 1) * 120, y + 40 + r * 20)
+                    page.draw_rect(rect, color=(0, 0, 0), width=0.8)
+                    page.insert_text((rect.x0 + 4, rect.y1 - 6), rng.choice(WORDS).title(), fontsize=9)
+        if header is not None:
+            page.show_pdf_page(fitz.Rect(0, 0, 595, 40), header, 0)
+        if scanned and i % 3 == 1:
+            pix = page.get_pixmap(dpi=100)
+            doc.delete_page(i)
+            doc.new_page(i).insert_image(fitz.Rect(0, 0, 595, 842), pixmap=pix)
+    if toc:
+        doc.set_toc(toc_entries)
+    doc.save(str(path))
+    doc.close()
+    return path
+
+
+CASES = {
+    "toc": {"toc": True},
+    "no_toc": {},
+    "tables": {"tables": True},
+    "header_xobject": {"header_xobject": True},
+    "scanned": {"scanned": True},
+}
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_parallel_outline_matches_serial(tmp_path, monkeypatch, case):
+    monkeypatch.setattr(heading_extractor, "OCR_CACHE_DIR", tmp_path / "ocr")
+    pdf = build_pdf(tmp_path / f"{case}.pdf", **CASES[case])
+    serial = extract_outline(str(pdf))
+    assert serial["outline"]
+    assert extract_outline(str(pdf), workers=3) == serial
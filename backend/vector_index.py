@@ -0,0 +1,239 @@
+# vector_index.py - Top-k inner-product retrieval over per-document vector blocks
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# "exact" (NumPy matmul + argpartition) or "ivf" (k-means inverted lists, approximate).
+RETRIEVAL_INDEX = os.getenv("RETRIEVAL_INDEX", "exact")
+# IVF lists searched per query; higher is slower and closer to exact.
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", 16))
+# Below this many vectors IVF just scans everything; clustering would not pay off.
+IVF_MIN_TRAIN = int(os.getenv("IVF_MIN_TRAIN", 4096))
+
+
+def normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def top_k(scores, k):
+    """Indices of the k largest scores, best first, without sorting the whole array."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class ExactIndex:
+    """
+    Exact maximum inner-product search. Vectors are added and deleted a
+    document at a time; the blocks are concatenated lazily on the next
+    search. Callers normalise vectors (and queries) for cosine similarity.
+    """
+    kind = "exact"
+
+    def __init__(self):
+        self._blocks = {}
+        self._tags = {}
+        self._matrix = None
+        self._owners = None
+
+    def __len__(self):
+        return sum(len(block) for block in self._blocks.values())
+
+    def documents(self):
+        """{document: tag} for every indexed document (tags identify the content version)."""
+        return dict(self._tags)
+
+    def add(self, doc, vectors, tag=None):
+        """Indexes a document's vectors, replacing any previous version of it."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self._blocks[doc] = vectors.reshape(len(vectors), -1)
+        self._tags[doc] = tag
+        self._invalidate()
+
+    def delete(self, doc):
+        if self._blocks.pop(doc, None) is not None:
+            self._tags.pop(doc, None)
+            self._invalidate()
+
+    def _invalidate(self):
+        self._matrix = None
+        self._owners = None
+
+    def _build(self):
+        if self._matrix is None:
+            docs = list(self._blocks)
+            blocks = [self._blocks[d] for d in docs if len(self._blocks[d])]
+            dim = blocks[0].shape[1] if blocks else 0
+            self._matrix = np.concatenate(blocks) if blocks else np.zeros((0, dim), dtype=np.float32)
+            # (document, row) for every matrix row.
+            self._owners = [(d, r) for d in docs for r in range(len(self._blocks[d]))]
+        return self._matrix
+
+    def search(self, query, k):
+        """Returns [(score, document, row)] for the k best rows, best first."""
+        matrix = self._build()
+        if not len(matrix):
+            return []
+        scores = matrix @ np.asarray(query, dtype=np.float32).reshape(-1)
+        return [(float(scores[i]), *self._owners[i]) for i in top_k(scores, k)]
+
+    # --- persistence ---
+    def _meta(self):
+        return {"kind": self.kind, "documents": list(self._blocks), "tags": self._tags}
+
+    def _arrays(self):
+        return {f"doc_{i}": self._blocks[d] for i, d in enumerate(self._blocks)}
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, meta=np.array(json.dumps(self._meta())), **self._arrays())
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def _restore(self, meta, data):
+        for i, doc in enumerate(meta["documents"]):
+            self.add(doc, data[f"doc_{i}"], meta["tags"].get(doc))
+
+
+class IVFIndex(ExactIndex):
+    """
+    Approximate search with an inverted-file layout: vectors are assigned to
+    the nearest of ~sqrt(n) k-means centroids and a query only scans the
+    nprobe closest lists. Centroids are trained once the index holds
+    IVF_MIN_TRAIN vectors and retrained when it has grown 4x since; adds
+    and deletes in between just update the lists.
+    """
+    kind = "ivf"
+
+    def __init__(self, nprobe=None, min_train=None, seed=0):
+        super().__init__()
+        self.nprobe = nprobe or IVF_NPROBE
+        self.min_train = min_train or IVF_MIN_TRAIN
+        self.seed = seed
+        self.centroids = None
+        self._trained_size = 0
+        self._assign = {}
+        self._order = None
+        self._offsets = None
+
+    def add(self, doc, vectors, tag=None):
+        super().add(doc, vectors, tag)
+        if self.centroids is not None:
+            self._assign[doc] = self._nearest(self._blocks[doc])
+
+    def delete(self, doc):
+        super().delete(doc)
+        self._assign.pop(doc, None)
+
+    def _invalidate(self):
+        super()._invalidate()
+        self._order = None
+        self._offsets = None
+
+    def _nearest(self, vectors, chunk=8192):
+        if not len(vectors):
+            return np.zeros(0, dtype=np.int32)
+        return np.concatenate([
+            np.argmax(vectors[i:i + chunk] @ self.centroids.T, axis=1).astype(np.int32)
+            for i in range(0, len(vectors), chunk)])
+
+    def train(self, iterations=10):
+        """Spherical k-means over (a sample of) the indexed vectors."""
+        matrix = ExactIndex._build(self)
+        nlist = max(1, min(4096, int(np.sqrt(len(matrix)))))
+        rng = np.random.default_rng(self.seed)
+        sample = matrix[rng.choice(len(matrix), min(len(matrix), 64 * nlist), replace=False)]
+        centroids = normalize_rows(sample[rng.choice(len(sample), nlist, replace=False)])
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            # Empty lists keep their old centroid.
+            centroids = np.where(counts[:, None] > 0, normalize_rows(sums), centroids)
+        self.centroids = centroids.astype(np.float32)
+        self._trained_size = len(matrix)
+        self._assign = {doc: self._nearest(block) for doc, block in self._blocks.items()}
+        self._order = None
+        self._offsets = None
+        logging.info(f"🧭 IVF index trained: {nlist} lists over {len(matrix)} vectors")
+
+    def _build(self):
+        size = len(self)
+        if size >= self.min_train and (self.centroids is None or size > 4 * self._trained_size):
+            self.train()
+        matrix = super()._build()
+        if self.centroids is not None and self._order is None:
+            labels = np.concatenate([self._assign[d] for d in self._blocks]) if self._blocks else np.zeros(0, np.int32)
+            self._order = np.argsort(labels, kind="stable")
+            self._offsets = np.searchsorted(labels[self._order], np.arange(len(self.centroids) + 1))
+        return matrix
+
+    def search(self, query, k):
+        matrix = self._build()
+        if self.centroids is None or not len(matrix):
+            return super().search(query, k)
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        lists = top_k(self.centroids @ query, self.nprobe)
+        candidates = np.concatenate([self._order[self._offsets[c]:self._offsets[c + 1]] for c in lists])
+        scores = matrix[candidates] @ query
+        return [(float(scores[i]), *self._owners[candidates[i]]) for i in top_k(scores, k)]
+
+    def _meta(self):
+        return {**super()._meta(), "nprobe": self.nprobe, "trained_size": self._trained_size}
+
+    def _arrays(self):
+        arrays = super()._arrays()
+        if self.centroids is not None:
+            arrays["centroids"] = self.centroids
+        return arrays
+
+    def _restore(self, meta, data):
+        if "centroids" in data:
+            self.centroids = data["centroids"]
+            self._trained_size = meta["trained_size"]
+        super()._restore(meta, data)
+
+
+INDEX_TYPES = {"exact": ExactIndex, "ivf": IVFIndex}
+
+
+def make_index(kind=None):
+    kind = kind or RETRIEVAL_INDEX
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown retrieval index {kind!r}; expected one of {sorted(INDEX_TYPES)}")
+    return INDEX_TYPES[kind]()
+
+
+def load_index(path, kind=None):
+    """Loads a saved index, or returns a new empty one if it is missing, unreadable or of another kind."""
+    kind = kind or RETRIEVAL_INDEX
+    index = make_index(kind)
+    try:
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta["kind"] == kind:
+                index._restore(meta, data)
+    except FileNotFoundError:
+        pass
+    except Exception as exc:
+        logging.warning(f"[WARN] Rebuilding unreadable retrieval index {path}: {exc}")
+        index = make_index(kind)
+    return index
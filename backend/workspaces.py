@@ -0,0 +1,199 @@
+# workspaces.py - Per-session input/output directories with idle-time garbage collection
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent
+WORKSPACES_DIR = Path(os.getenv("WORKSPACES_DIR", BASE_DIR / "workspaces"))
+# Workspaces untouched for this long are deleted by gc().
+WORKSPACE_TTL_SECONDS = float(os.getenv("WORKSPACE_TTL_SECONDS", 6 * 3600))
+WORKSPACE_GC_INTERVAL_SECONDS = float(os.getenv("WORKSPACE_GC_INTERVAL_SECONDS", 600))
+
+WORKSPACE_HEADER = "X-Workspace-Id"
+WORKSPACE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+# Requests without a workspace id keep using the original shared input/ and output/ dirs.
+DEFAULT_WORKSPACE_ID = "default"
+
+_LAST_USED_MARKER = ".last_used"
+
+
+class InvalidWorkspaceId(ValueError):
+    pass
+
+
+class UnknownWorkspace(LookupError):
+    pass
+
+
+class WorkspaceBusy(RuntimeError):
+    pass
+
+
+class Workspace:
+    """
+    The directories one session's requests read and write: uploaded PDFs
+    and the analysis config in input/, Stage 1 outlines in
+    output/1a_outlines/, and Stage 2/summary/explain results in output/.
+    """
+
+    def __init__(self, workspace_id, root, lock):
+        self.id = workspace_id
+        self.root = Path(root)
+        self.input_dir = self.root / "input"
+        self.output_dir = self.root / "output"
+        self.outlines_dir = self.output_dir / "1a_outlines"
+        # Serialises replacing this workspace's outlines against reading them.
+        self.lock = lock
+
+    @property
+    def is_default(self):
+        return self.id == DEFAULT_WORKSPACE_ID
+
+    def ensure_dirs(self):
+        for path in (self.input_dir, self.output_dir, self.outlines_dir):
+            path.mkdir(parents=True, exist_ok=True)
+        return self
+
+    def touch(self):
+        (self.root / _LAST_USED_MARKER).touch()
+
+    def last_used(self):
+        try:
+            return (self.root / _LAST_USED_MARKER).stat().st_mtime
+        except FileNotFoundError:
+            return self.root.stat().st_mtime
+
+
+class WorkspaceManager:
+    """
+    Resolves workspace ids to Workspace objects, creating them on first use,
+    and deletes workspaces that have been idle for longer than the TTL.
+    Workspaces with a request in flight (see in_use) are never deleted, and
+    a workspace being deleted can't be used until its removal is done.
+    """
+
+    def __init__(self, root=None, ttl=None, default_root=BASE_DIR):
+        self.root = Path(root or WORKSPACES_DIR)
+        self.ttl = ttl if ttl is not None else WORKSPACE_TTL_SECONDS
+        self.default_root = Path(default_root)
+        self._locks = {}
+        self._active = {}
+        self._deleting = set()
+        self._guard = threading.Lock()
+
+    def _lock_for(self, workspace_id):
+        with self._guard:
+            return self._locks.setdefault(workspace_id, threading.Lock())
+
+    def new_id(self):
+        return uuid.uuid4().hex
+
+    def get(self, workspace_id=None, create=True):
+        """
+        Returns the workspace for an id; None means the default one. It is
+        created if needed, unless create is False, in which case an id with
+        no workspace raises UnknownWorkspace and nothing is written.
+        """
+        workspace_id = workspace_id or DEFAULT_WORKSPACE_ID
+        if not WORKSPACE_ID_PATTERN.match(workspace_id):
+            raise InvalidWorkspaceId(f"Invalid workspace id: {workspace_id!r}")
+        if not create and workspace_id != DEFAULT_WORKSPACE_ID and not self.exists(workspace_id):
+            raise UnknownWorkspace(f"Unknown workspace id: {workspace_id!r}")
+        with self._guard:
+            if workspace_id in self._deleting:
+                raise WorkspaceBusy(f"Workspace {workspace_id!r} is being deleted")
+        root = self.default_root if workspace_id == DEFAULT_WORKSPACE_ID else self.root / workspace_id
+        workspace = Workspace(workspace_id, root, self._lock_for(workspace_id)).ensure_dirs()
+        if not workspace.is_default:
+            workspace.touch()
+        return workspace
+
+    def exists(self, workspace_id):
+        return bool(WORKSPACE_ID_PATTERN.match(workspace_id)) and (self.root / workspace_id).is_dir()
+
+    @contextmanager
+    def in_use(self, workspace):
+        """
+        Marks a workspace busy for the duration of a request or job. Raises
+        WorkspaceBusy if it is being deleted, and recreates its directories
+        if it was deleted since it was resolved.
+        """
+        with self._guard:
+            if workspace.id in self._deleting:
+                raise WorkspaceBusy(f"Workspace {workspace.id!r} is being deleted")
+            self._active[workspace.id] = self._active.get(workspace.id, 0) + 1
+        try:
+            workspace.ensure_dirs()
+            yield workspace
+        finally:
+            with self._guard:
+                self._active[workspace.id] -= 1
+                if not self._active[workspace.id]:
+                    del self._active[workspace.id]
+            if not workspace.is_default:
+                workspace.touch()
+
+    def _remove(self, workspace_id):
+        """
+        Deletes a workspace unless a request holds its lock or has it in use.
+        It is marked as deleting under the lock first, so nothing can start
+        using it while it is removed. Returns False if it was busy.
+        """
+        lock = self._lock_for(workspace_id)
+        if not lock.acquire(blocking=False):
+            return False
+        try:
+            with self._guard:
+                if workspace_id in self._active:
+                    return False
+                self._deleting.add(workspace_id)
+            try:
+                shutil.rmtree(self.root / workspace_id, ignore_errors=True)
+            finally:
+                with self._guard:
+                    self._deleting.discard(workspace_id)
+                    self._locks.pop(workspace_id, None)
+            return True
+        finally:
+            lock.release()
+
+    def delete(self, workspace_id):
+        """Deletes a workspace. Returns False if there is none; raises WorkspaceBusy if it is in use."""
+        if workspace_id == DEFAULT_WORKSPACE_ID or not self.exists(workspace_id):
+            return False
+        if not self._remove(workspace_id):
+            raise WorkspaceBusy(f"Workspace {workspace_id!r} is in use")
+        return True
+
+    def gc(self):
+        """Deletes idle workspaces past the TTL. Returns the ids removed."""
+        if not self.root.exists():
+            return []
+        cutoff = time.time() - self.ttl
+        removed = []
+        for path in self.root.iterdir():
+            if not path.is_dir() or not WORKSPACE_ID_PATTERN.match(path.name):
+                continue
+            workspace = Workspace(path.name, path, None)
+            # Busy workspaces are skipped; _remove re-checks under the lock.
+            if workspace.last_used() < cutoff and self._remove(path.name):
+                removed.append(path.name)
+        if removed:
+            logging.info(f"🧹 Removed {len(removed)} idle workspace(s)")
+        return removed
+
+    def list(self):
+        if not self.root.exists():
+            return []
+        items = []
+        for path in sorted(self.root.iterdir()):
+            if path.is_dir():
+                items.append({"workspace_id": path.name,
+                              "last_used": Workspace(path.name, path, None).last_used()})
+        return items
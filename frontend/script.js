@@ -1,6 +1,17 @@
 document.addEventListener('DOMContentLoaded', () => {
   const API_BASE = 'http://localhost:9000'; // Single base URL (combined app)
 
+  // Per-tab workspace so concurrent sessions don't overwrite each other's uploads and results
+  const WORKSPACE_HEADER = 'X-Workspace-Id';
+  let workspaceId = sessionStorage.getItem('workspaceId');
+  if (!workspaceId) {
+    workspaceId = (window.crypto && crypto.randomUUID)
+      ? crypto.randomUUID().replace(/-/g, '')
+      : Math.random().toString(36).slice(2) + Date.now().toString(36);
+    sessionStorage.setItem('workspaceId', workspaceId);
+  }
+  const wsHeaders = { [WORKSPACE_HEADER]: workspaceId };
+
   const uBtn = document.getElementById('uBtn');
   const aBtn = document.getElementById('aBtn');
   const sBtn = document.getElementById('sBtn');
@@ -576,7 +587,7 @@ document.addEventListener('DOMContentLoaded', () => {
     hideModals();
     try {
       showThinking('Summarizing your PDFs…');
-      const resp = await fetch(`${API_BASE}/summary/`);
+      const resp = await fetch(`${API_BASE}/summary/`, { headers: wsHeaders });
       if (!resp.ok) throw new Error(`Summary failed ${resp.status}`);
       console.debug('[HTTP] /summary status', resp.status);
       const data = await resp.json();
@@ -621,48 +632,105 @@ document.addEventListener('DOMContentLoaded', () => {
       const data = await new Promise((resolve, reject) => {
         try {
           const xhr = new XMLHttpRequest();
-          xhr.open('POST', `${API_BASE}/stage1/upload/`);
+          // Streaming endpoint: newline-delimited JSON events while Stage 1 runs
+          xhr.open('POST', `${API_BASE}/stage1/upload/stream`);
+          xhr.setRequestHeader(WORKSPACE_HEADER, workspaceId);
+          const documents = [];
+          let parsedUpTo = 0;
+          let sectionsShown = 0;
+          let finished = false;
+          let current = { index: 0, total: 1 };
+          const stopCreep = () => { if (creepTimer) { clearInterval(creepTimer); creepTimer = null; } };
+          // Processing maps to 40-100%: each file gets an equal slice, filled by its pages
+          const processingPct = (index, total, fraction) => 40 + ((index + fraction) / Math.max(1, total)) * 60;
+          const handleEvent = (ev) => {
+            switch (ev.event) {
+              case 'file_start':
+                current = { index: ev.index, total: ev.total };
+                setUploadLabel(`Processing ${ev.file}…`);
+                displayPct = Math.max(displayPct, processingPct(ev.index, ev.total, 0));
+                setUploadProgress(displayPct);
+                break;
+              case 'page':
+                stopCreep();
+                if (ev.pages) {
+                  displayPct = Math.max(displayPct, processingPct(current.index, current.total, ev.page / ev.pages));
+                  setUploadProgress(displayPct);
+                }
+                break;
+              case 'section':
+                // Show the first sections as soon as they arrive
+                if (sectionsShown < 3 && ev.section?.text) {
+                  sectionsShown += 1;
+                  resultsEl.textContent = `📄 ${ev.file}: ${ev.section.text}`;
+                }
+                break;
+              case 'file_done':
+                documents.push(ev.document);
+                displayPct = Math.max(displayPct, processingPct(ev.index, ev.total, 1));
+                setUploadProgress(displayPct);
+                break;
+              case 'file_error':
+                console.error(`Stage 1 failed for ${ev.file}:`, ev.exception || ev.error);
+                break;
+              case 'done':
+                finished = true;
+                stopCreep();
+                if (!documents.length && ev.failures?.length) {
+                  reject(new Error('Stage 1 failed for all files'));
+                  return;
+                }
+                setUploadProgress(100);
+                setUploadLabel('Complete');
+                resolve(documents);
+                break;
+            }
+          };
+          const consume = () => {
+            const text = xhr.responseText || '';
+            let nl;
+            while ((nl = text.indexOf('\n', parsedUpTo)) !== -1) {
+              const line = text.slice(parsedUpTo, nl).trim();
+              parsedUpTo = nl + 1;
+              if (!line) continue;
+              try { handleEvent(JSON.parse(line)); } catch (err) { console.warn('Bad stream line', err); }
+            }
+          };
           xhr.upload.addEventListener('progress', (e) => {
             if (e.lengthComputable) {
-              // Drive upload portion up to 80%
-              const pct = Math.min(80, Math.max(2, (e.loaded / e.total) * 80));
+              // Drive upload portion up to 40%
+              const pct = Math.min(40, Math.max(2, (e.loaded / e.total) * 40));
               displayPct = pct;
               setUploadProgress(pct);
             }
           });
           xhr.upload.addEventListener('load', () => {
-            // Upload finished; hold ~80% while backend processes
-            displayPct = Math.max(displayPct, 80);
+            // Upload finished; creep slowly until the first page event arrives
+            displayPct = Math.max(displayPct, 40);
             setUploadProgress(displayPct);
             setUploadLabel('Processing…');
             if (!creepTimer) {
               creepTimer = setInterval(() => {
-                displayPct = Math.min(95, displayPct + 1);
+                displayPct = Math.min(45, displayPct + 0.5);
                 setUploadProgress(displayPct);
               }, 400);
             }
           });
+          xhr.addEventListener('progress', () => {
+            if (xhr.status >= 200 && xhr.status < 300) consume();
+          });
           xhr.onreadystatechange = () => {
             if (xhr.readyState === 4) {
+              stopCreep();
               if (xhr.status >= 200 && xhr.status < 300) {
-                try {
-                  const json = JSON.parse(xhr.responseText || 'null');
-                  if (creepTimer) { clearInterval(creepTimer); creepTimer = null; }
-                  // Mark 100% on completion
-                  setUploadProgress(100);
-                  setUploadLabel('Complete');
-                  resolve(json);
-                } catch (err) {
-                  if (creepTimer) { clearInterval(creepTimer); creepTimer = null; }
-                  reject(new Error('Invalid JSON response from backend.'));
-                }
+                consume();
+                if (!finished) reject(new Error('Stage 1 stream ended unexpectedly.'));
               } else {
-                if (creepTimer) { clearInterval(creepTimer); creepTimer = null; }
                 reject(new Error(`Backend error ${xhr.status}: ${xhr.responseText}`));
               }
             }
           };
-          xhr.onerror = () => { if (creepTimer) { clearInterval(creepTimer); creepTimer = null; } reject(new Error('Network error')); };
+          xhr.onerror = () => { stopCreep(); reject(new Error('Network error')); };
           xhr.send(formData);
         } catch (err) {
           reject(err);
@@ -796,7 +864,7 @@ document.addEventListener('DOMContentLoaded', () => {
         setAnalyzeProgress(aDisplayPct);
       }, 400);
 
-      const resp = await fetch(`${API_BASE}/analyze/`, { method: 'POST', body: fd });
+      const resp = await fetch(`${API_BASE}/analyze/`, { method: 'POST', body: fd, headers: wsHeaders });
       if (!resp.ok) {
         const txt = await resp.text();
         throw new Error(`Analyze failed ${resp.status}: ${txt}`);
@@ -837,7 +905,7 @@ document.addEventListener('DOMContentLoaded', () => {
     if (!q) return;
     try {
       showThinking('Thinking…');
-      const resp = await fetch(`${API_BASE}/explain/?topic=${encodeURIComponent(q)}`);
+      const resp = await fetch(`${API_BASE}/explain/?topic=${encodeURIComponent(q)}`, { headers: wsHeaders });
       if (!resp.ok) throw new Error(`Explain failed ${resp.status}`);
       console.debug('[HTTP] /explain status', resp.status);
       const data = await resp.json();